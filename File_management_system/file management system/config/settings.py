@@ -15,12 +15,17 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # Lets runserver serve static files through WhiteNoise too, as in production
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     'records',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Answers /static/ requests before any other middleware, view or query runs
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'records.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,6 +59,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
 }
 
@@ -84,13 +92,136 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'records', 'static')]
 
+# collectstatic writes content-hashed copies of every file (style.4f2a1c.css)
+# plus .gz and .br versions; WhiteNoise serves the hashed names with
+# "Cache-Control: max-age=315360000, public, immutable" and picks the
+# smallest encoding the browser accepts.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'records.storage.StaticStorage',
+    },
+}
+WHITENOISE_MANIFEST_STRICT = False
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760
+# Uploads larger than this are spooled to a temp file instead of worker memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760
+# Bulk uploads send many files in one request
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+
+FILE_UPLOAD_HANDLERS = [
+    'records.storage.HashingMemoryFileUploadHandler',
+    'records.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Store each distinct upload once under media/blobs/, named by its SHA-256
+RECORDS_DEDUPLICATE_UPLOADS = True
+# Directory layout for files kept under their own name (deduplication off):
+# 'hash', 'date' or 'flat'. `manage.py shard_uploads` moves existing files.
+RECORDS_UPLOAD_LAYOUT = 'hash'
+# Cold tier (see records/tiers.py): `manage.py tier_files` compresses files
+# nobody downloaded for RECORDS_TIER_COLD_DAYS with 'zstd' (pip install
+# zstandard, else gzip) or 'gzip'. Downloads decompress them on the fly, and
+# a cold file downloaded RECORDS_TIER_PROMOTE_ACCESSES times is decompressed again.
+RECORDS_TIER_CODEC = 'zstd'
+RECORDS_TIER_COLD_DAYS = 90
+RECORDS_TIER_PROMOTE_ACCESSES = 3
+
+# Chunked, resumable uploads (see records/uploads.py). Partial files are kept
+# outside MEDIA_ROOT, which is served publicly in development.
+UPLOAD_SESSION_ROOT = os.path.join(BASE_DIR, 'partial_uploads')
+CHUNKED_UPLOAD_MAX_SIZE = 536870912
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8388608
+# Unfinished uploads untouched for this many seconds are deleted with their
+# partial file, and a chunk still being written after CHUNKED_UPLOAD_CHUNK_TIMEOUT
+# seconds is given up so the client can send it again
+CHUNKED_UPLOAD_SESSION_TTL = 172800
+CHUNKED_UPLOAD_CHUNK_TIMEOUT = 600
 
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'list_records'
+
+EXPORT_CHUNK_SIZE = 65536
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+# Background export jobs without a heartbeat for this many seconds (the
+# server restarted mid-export) are failed, and the next request requeues them
+EXPORT_JOB_TIMEOUT = 600
+# Threads deflating export ZIP members (None for one per CPU, 1 to deflate inline)
+EXPORT_COMPRESS_WORKERS = None
+# Files stored in export ZIPs without compression; other files are stored
+# when deflating a sample saves less than 10%
+EXPORT_STORED_FILE_TYPES = ('DOCX', 'XLSX')
+EXPORT_MIN_COMPRESSION_RATIO = 0.9
+
+# How downloads are sent: 'python', 'x-accel-redirect' (nginx) or 'x-sendfile'
+# (Apache/lighttpd). See records/downloads.py.
+RECORDS_DOWNLOAD_BACKEND = 'python'
+# Internal nginx locations for X-Accel-Redirect, keyed by directory
+RECORDS_DOWNLOAD_ACCEL_LOCATIONS = {
+    MEDIA_ROOT: '/protected/media/',
+    EXPORT_ROOT: '/protected/exports/',
+}
+
+WORKER_POOL_SIZE = 4
+
+# Serve uploads, downloads and exports with async views that do file I/O in
+# threads. Turn on when running under ASGI (config/asgi.py), e.g.
+#   gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+RECORDS_ASYNC_VIEWS = False
+
+# Thumbnails of Image and PDF records (see records/previews.py)
+RECORDS_PREVIEW_SIZE = (320, 320)
+RECORDS_PREVIEW_FORMAT = 'WEBP'
+RECORDS_PREVIEW_MAX_AGE = 31536000
+
+# 'cursor' (keyset) or 'offset' pagination for the records list
+RECORDS_PAGINATION = 'cursor'
+
+# Cached record ids and counts for the records list (see records/cache.py).
+# Results live in each process's memory, where the least recently used are
+# culled beyond MAX_ENTRIES. They are keyed by a generation that changes
+# whenever a record changes; it is kept in the 'records_generation' cache,
+# which must be shared by every process that serves or writes records
+# (gunicorn workers, bulk_ingest and the other management commands) so their
+# writes invalidate the pages other processes serve. The file cache is shared
+# on one machine; use Redis for both when the site runs on several (with
+# maxmemory-policy allkeys-lru so results are evicted least recently used):
+#   'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#   'LOCATION': 'redis://127.0.0.1:6379/1',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'records': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'records',
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 10},
+    },
+    'records_generation': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'records'),
+    },
+}
+RECORDS_CACHE_ALIAS = 'records'
+RECORDS_GENERATION_CACHE_ALIAS = 'records_generation'
+RECORDS_CACHE_TIMEOUT = 300
+
+# Per-view request metrics (see records/middleware.py), served at /metrics/
+# in Prometheus format to staff users or with "Authorization: Bearer <token>".
+# Windows are per process: scrape each worker, or run one per container.
+RECORDS_METRICS_WINDOW = 1024
+RECORDS_METRICS_TOKEN = ''
+# Peak memory per request via tracemalloc; slows every request, so off by default
+RECORDS_METRICS_TRACE_MEMORY = False
+# Requests slower than this are written to RECORDS_SLOW_REQUEST_DIR with
+# their SQL and, under WSGI, a sampled stack profile (None to turn off)
+RECORDS_SLOW_REQUEST_SECONDS = 1.0
+RECORDS_SLOW_REQUEST_DIR = os.path.join(BASE_DIR, 'slow_requests')
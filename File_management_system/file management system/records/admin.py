@@ -1,10 +1,31 @@
 from django.contrib import admin
-from .models import FileRecord
+from .models import ChangeEvent, ExportJob, FileRecord, FileTier
 
 
 @admin.register(FileRecord)
 class FileRecordAdmin(admin.ModelAdmin):
     list_display = ['id', 'description', 'file_type', 'upload_datetime']
     list_filter = ['file_type', 'upload_datetime']
-    search_fields = ['description']
-    readonly_fields = ['upload_datetime', 'file_type']
+    search_fields = ['description', 'letter_reference_number']
+    readonly_fields = ['upload_datetime', 'updated_datetime', 'file_type', 'original_name', 'content_hash']
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'progress', 'total', 'created_datetime', 'finished_datetime']
+    list_filter = ['status']
+    readonly_fields = ['filters_key', 'filters', 'created_datetime', 'finished_datetime']
+
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(admin.ModelAdmin):
+    list_display = ['seq', 'action', 'record_id', 'changed_datetime']
+    list_filter = ['action']
+    search_fields = ['record_id']
+
+
+@admin.register(FileTier)
+class FileTierAdmin(admin.ModelAdmin):
+    list_display = ['name', 'codec', 'size', 'stored_size', 'access_count', 'last_accessed']
+    list_filter = ['codec', 'incompressible']
+    search_fields = ['name']
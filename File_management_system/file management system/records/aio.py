@@ -0,0 +1,58 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import connection
+
+
+def _closing(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        connection.close()
+
+
+async def offload(fn, *args, **kwargs):
+    """Run blocking fn in a worker thread so the event loop keeps serving other clients.
+
+    Unlike sync_to_async's default, calls run in parallel rather than on the
+    one shared sync thread; the thread's database connection is closed after.
+    """
+
+    return await asyncio.to_thread(_closing, fn, *args, **kwargs)
+
+
+async def aiterate(iterator):
+    """Async iterator over a blocking iterator, advanced on a dedicated thread.
+
+    One thread for the whole iteration, because a queryset iterator holds a
+    database cursor that must stay on the connection (thread) that opened it.
+    """
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='records-stream')
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        await loop.run_in_executor(executor, _closing, close or (lambda: None))
+        executor.shutdown(wait=False)
+
+
+def async_login_required(view):
+    """login_required for async views (Django 4.2's decorator only wraps sync ones)"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view(request, *args, **kwargs)
+    return wrapper
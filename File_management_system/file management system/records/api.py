@@ -0,0 +1,251 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Max
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .bulk import BulkError, delete_records, selected_ids, update_records
+from .changes import changes_since, journal_expired, latest_seq
+from .filters import filter_records, filters_key, get_filters
+from .forms import BulkEditForm
+from .models import ChangeEvent, ExtractedContent, FileRecord
+from .pagination import cached_count, cached_cursor_page, cached_offset_page
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_BATCH_IDS = 500
+DEFAULT_CHANGES_LIMIT = 500
+
+# API field -> model fields it is built from
+FIELDS = {
+    'id': ['id'],
+    'description': ['description'],
+    'file_name': ['original_name', 'file'],
+    'file_type': ['file_type'],
+    'file_date': ['file_date'],
+    'letter_reference_number': ['letter_reference_number'],
+    'upload_datetime': ['upload_datetime'],
+    'updated_datetime': ['updated_datetime'],
+    'content_hash': ['content_hash'],
+    'download_url': ['id'],
+    'preview_url': ['id', 'preview'],
+}
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def api_view(view):
+    """Turn APIError into a JSON error response"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except APIError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+        except BulkError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+    return wrapper
+
+
+def results_etag(request, *args, **kwargs):
+    """ETag for any API response, read from the database so writes by any process change it.
+
+    Every record change is journaled, and search results also depend on
+    extracted text, which stamps extracted_datetime whenever it is indexed.
+    """
+
+    indexed = ExtractedContent.objects.aggregate(latest=Max('extracted_datetime'))['latest']
+    version = f"{latest_seq()}.{int(indexed.timestamp() * 1000000) if indexed else 0}"
+    path = hashlib.sha256(request.get_full_path().encode('utf-8')).hexdigest()[:16]
+    return f'"{version}-{path}"'
+
+
+def get_fields(params):
+    """Fields requested with ?fields=a,b (all fields by default)"""
+
+    value = params.get('fields', '').strip()
+    if not value:
+        return list(FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown:
+        raise APIError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(FIELDS)}.")
+    return fields
+
+
+def model_fields(fields):
+    return sorted({column for name in fields for column in FIELDS[name]})
+
+
+def _int_param(params, name, default, maximum):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise APIError(f'{name} must be an integer.')
+    return max(1, min(value, maximum))
+
+
+def serialize_record(record, fields):
+    data = {}
+    for name in fields:
+        if name == 'file_name':
+            value = record.file_name
+        elif name == 'download_url':
+            value = reverse('download_file', args=[record.id])
+        elif name == 'preview_url':
+            value = f"{reverse('record_preview', args=[record.id])}?v={record.preview_version}" if record.preview else None
+        else:
+            value = getattr(record, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+        data[name] = value
+    return data
+
+
+@gzip_page
+@api_login_required
+@require_GET
+@condition(etag_func=results_etag)
+@api_view
+def record_list(request):
+    """Records matching the list_records filters, a page at a time (cursor or page)"""
+
+    fields = get_fields(request.GET)
+    page_size = _int_param(request.GET, 'page_size', DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    filters = get_filters(request.GET)
+    key = filters_key(filters)
+    records = filter_records(filters)
+    only = model_fields(fields)
+
+    payload = {}
+    page = cached_cursor_page(records, key, request.GET.get('cursor'), page_size, only)
+    if page is None:
+        # Relevance ordering has no keyset, so it pages by number.
+        page = cached_offset_page(records, key, request.GET.get('page', 1), page_size, only)
+        payload['page'] = page.number
+        payload['num_pages'] = page.paginator.num_pages
+    else:
+        payload['next_cursor'] = page.next_cursor
+        payload['previous_cursor'] = page.previous_cursor
+    if request.GET.get('count') in ('1', 'true'):
+        payload['count'] = cached_count(records, key)
+    payload['results'] = [serialize_record(record, fields) for record in page]
+    return JsonResponse(payload)
+
+
+@gzip_page
+@api_login_required
+@require_GET
+@condition(etag_func=results_etag)
+@api_view
+def record_detail(request, record_id):
+    fields = get_fields(request.GET)
+    record = get_object_or_404(FileRecord.objects.only(*model_fields(fields)), id=record_id)
+    return JsonResponse(serialize_record(record, fields))
+
+
+@gzip_page
+@api_login_required
+@require_GET
+@condition(etag_func=results_etag)
+@api_view
+def record_batch(request):
+    """Many records by id in one request: ?ids=1,2,3 (up to MAX_BATCH_IDS)"""
+
+    fields = get_fields(request.GET)
+    try:
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        raise APIError('ids must be a comma-separated list of integers.')
+    if not ids:
+        raise APIError('ids is required.')
+    if len(ids) > MAX_BATCH_IDS:
+        raise APIError(f'At most {MAX_BATCH_IDS} ids per request.')
+
+    ids = list(dict.fromkeys(ids))
+    found = FileRecord.objects.only(*model_fields(fields)).in_bulk(ids)
+    return JsonResponse({
+        'results': [serialize_record(found[pk], fields) for pk in ids if pk in found],
+        'missing': [pk for pk in ids if pk not in found],
+    })
+
+
+@gzip_page
+@api_login_required
+@require_GET
+@api_view
+def record_changes(request):
+    """Change journal after ?since=<seq>, oldest first, with the current state of each changed record"""
+
+    fields = get_fields(request.GET)
+    limit = _int_param(request.GET, 'limit', DEFAULT_CHANGES_LIMIT, MAX_PAGE_SIZE)
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        raise APIError('since must be an integer.')
+
+    if journal_expired(since):
+        raise APIError('Changes after this sequence have been pruned; resync from /api/records/.', status=410)
+
+    events, has_more = changes_since(since, limit)
+    live = FileRecord.objects.only(*model_fields(fields)).in_bulk(
+        {event.record_id for event in events if event.action != ChangeEvent.ACTION_DELETE}
+    )
+    changes = []
+    for event in events:
+        record = live.get(event.record_id)
+        changes.append({
+            'seq': event.seq,
+            'action': event.action,
+            'record_id': event.record_id,
+            'changed_datetime': event.changed_datetime.isoformat(),
+            'record': serialize_record(record, fields) if record is not None else None,
+        })
+    return JsonResponse({
+        'changes': changes,
+        'next_since': events[-1].seq if events else since,
+        'has_more': has_more,
+        'latest_seq': latest_seq(),
+    })
+
+
+@api_login_required
+@require_POST
+@api_view
+def record_bulk_delete(request):
+    """Delete records by ids=1,2,3, or every record matching the filters with select=filter"""
+
+    return JsonResponse({'deleted': delete_records(selected_ids(request.POST))})
+
+
+@api_login_required
+@require_POST
+@api_view
+def record_bulk_update(request):
+    """Set description, file_date and/or letter_reference_number on records chosen as for bulk delete"""
+
+    form = BulkEditForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    return JsonResponse({'updated': update_records(selected_ids(request.POST), form.cleaned_data)})
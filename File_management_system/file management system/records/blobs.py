@@ -0,0 +1,151 @@
+import logging
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import workers
+from .models import Blob, FileRecord
+from .storage import blob_hash, blob_name, file_identity, upload_storage
+from .tiers import SUFFIXES, locate, original_size
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+REMOVE_BATCH_SIZE = 200
+
+
+def retain_file(name, count=1):
+    """Add count references to the blob behind a stored file name"""
+
+    content_hash = blob_hash(name)
+    if content_hash is None:
+        return
+    # Write before reading: on SQLite a transaction that reads first and then
+    # writes fails at once with "database is locked" if another connection
+    # is writing, instead of waiting for it.
+    with transaction.atomic():
+        if Blob.objects.filter(hash=content_hash).update(ref_count=F('ref_count') + count):
+            return
+        # The blob may be kept compressed in the cold tier.
+        located = locate(upload_storage.path(name))
+        size = original_size(*located) if located else 0
+        try:
+            with transaction.atomic():
+                Blob.objects.create(hash=content_hash, size=size, ref_count=count)
+        except IntegrityError:
+            Blob.objects.filter(hash=content_hash).update(ref_count=F('ref_count') + count)
+
+
+def release_file(name, count=1):
+    """Drop count references to a stored file and return the path to unlink, if any.
+
+    Blobs are only unlinked once nothing references them; files stored
+    outside the blob tree belong to a single record and are always unlinked.
+    """
+
+    if not name:
+        return None
+    content_hash = blob_hash(name)
+    if content_hash is None:
+        return upload_storage.path(name)
+
+    with transaction.atomic():
+        blobs = Blob.objects.filter(hash=content_hash)
+        if blobs.filter(ref_count__gt=count).update(ref_count=F('ref_count') - count):
+            return None
+        deleted, _ = blobs.delete()
+    return upload_storage.path(name) if deleted else None
+
+
+def release_files(counts):
+    """release_file for many names at once ({name: references}), a few queries per BATCH_SIZE blobs.
+
+    Returns the paths to unlink.
+    """
+
+    paths = []
+    hashes_by_count = defaultdict(list)
+    for name, count in counts.items():
+        if not name:
+            continue
+        content_hash = blob_hash(name)
+        if content_hash is None:
+            paths.append(upload_storage.path(name))
+        else:
+            hashes_by_count[count].append(content_hash)
+
+    with transaction.atomic():
+        for count, hashes in hashes_by_count.items():
+            for start in range(0, len(hashes), BATCH_SIZE):
+                blobs = Blob.objects.filter(hash__in=hashes[start:start + BATCH_SIZE])
+                unused = list(blobs.filter(ref_count__lte=count).values_list('hash', flat=True))
+                blobs.exclude(hash__in=unused).update(ref_count=F('ref_count') - count)
+                Blob.objects.filter(hash__in=unused).delete()
+                paths.extend(upload_storage.path(blob_name(content_hash)) for content_hash in unused)
+    return paths
+
+
+def remove_path(path, identity=None):
+    """Unlink a stored file, and its compressed copy if tier_files made one.
+
+    The unlink runs some time after the file was released, and the same
+    content may have been uploaded again meanwhile. identity is
+    file_identity(path) at release: a file rewritten or reused since is kept,
+    and so is a blob whose hash a Blob row or a record refers to again.
+    """
+
+    if not path:
+        return
+    current = file_identity(path)
+    if identity is not None and current is not None and current != identity:
+        return
+    content_hash = blob_hash(os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/'))
+    if content_hash is None:
+        _unlink(path)
+        return
+    with transaction.atomic():
+        # Write first, as retain_file does: the delete takes SQLite's write
+        # lock, so no upload can retain the blob between check and unlink.
+        Blob.objects.filter(hash=content_hash, ref_count=0).delete()
+        if Blob.objects.filter(hash=content_hash).exists():
+            return
+        if FileRecord.objects.filter(content_hash=content_hash).exists():
+            return
+        _unlink(path)
+
+
+def _unlink(path):
+    for candidate in [path] + [path + suffix for suffix in SUFFIXES.values()]:
+        try:
+            if os.path.exists(candidate):
+                os.remove(candidate)
+        except OSError:
+            logger.exception('Could not remove %s', candidate)
+
+
+def remove_paths(entries):
+    """remove_path for (path, identity) pairs"""
+
+    for path, identity in entries:
+        remove_path(path, identity)
+
+
+def remove_paths_on_commit(paths):
+    """Unlink paths on the worker pool once the transaction commits, REMOVE_BATCH_SIZE per task.
+
+    Each file's identity is taken now, while the transaction that released
+    it still holds the write lock.
+    """
+
+    entries = [(path, file_identity(path)) for path in paths]
+
+    def submit():
+        for start in range(0, len(entries), REMOVE_BATCH_SIZE):
+            workers.submit(remove_paths, entries[start:start + REMOVE_BATCH_SIZE])
+
+    if entries:
+        transaction.on_commit(submit)
@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .filters import filter_records, get_filters
+from .models import FileRecord
+from .signals import delete_in_bulk, records_bulk_deleted, records_bulk_updated
+
+
+BATCH_SIZE = 500
+# get_filters keys that narrow the selection (sort_by only orders it)
+FILTER_KEYS = ('search', 'file_type', 'start_date', 'end_date')
+
+
+class BulkError(Exception):
+    """A bulk action was rejected; status is the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def selected_ids(params):
+    """Record ids a bulk action applies to.
+
+    Either explicit ids (ids=1,2,3 or repeated ids=) or select=filter with
+    the list page's search/filter parameters, meaning every matching record.
+    select=filter without any filter needs all=true, so a form posted with
+    its filters missing cannot reach every record by accident.
+    """
+
+    if params.get('select') == 'filter':
+        filters = get_filters(params)
+        if not any(filters[key] for key in FILTER_KEYS) and params.get('all') != 'true':
+            raise BulkError('Choose at least one filter, or pass all=true to select every record.')
+        return list(filter_records(filters).order_by().values_list('pk', flat=True))
+    try:
+        ids = [int(value) for values in params.getlist('ids') for value in values.split(',') if value.strip()]
+    except ValueError:
+        raise BulkError('ids must be a comma-separated list of integers.')
+    if not ids:
+        raise BulkError('No records selected.')
+    return list(dict.fromkeys(ids))
+
+
+def _batches(ids):
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def delete_records(ids):
+    """Delete the records in one transaction and return how many were deleted.
+
+    Each batch goes through QuerySet.delete(), so rows that refer to the
+    records are cascaded or nulled as their foreign keys say and post_delete
+    handlers run. Blob references, previews, the change journal and cached
+    results are updated once per call by records_bulk_deleted; the files are
+    unlinked on the worker pool after commit.
+    """
+
+    deleted = []
+    with transaction.atomic():
+        for batch in _batches(ids):
+            records = FileRecord.objects.filter(pk__in=batch)
+            rows = list(records.values_list('pk', 'file', 'preview'))
+            if not rows:
+                continue
+            delete_in_bulk(records)
+            deleted.extend(rows)
+        if deleted:
+            records_bulk_deleted.send(sender=FileRecord, records=deleted)
+    return len(deleted)
+
+
+def update_records(ids, changes):
+    """Set the same metadata on every record in one transaction and return how many were updated"""
+
+    updated = []
+    changes = dict(changes, updated_datetime=timezone.now())
+    with transaction.atomic():
+        for batch in _batches(ids):
+            pks = list(FileRecord.objects.filter(pk__in=batch).values_list('pk', flat=True))
+            if pks:
+                FileRecord.objects.filter(pk__in=pks).update(**changes)
+                updated.extend(pks)
+        if updated:
+            records_bulk_updated.send(sender=FileRecord, record_ids=updated)
+    return len(updated)
@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .metrics import registry
+
+
+GENERATION_KEY = 'records:generation'
+
+_MISSING = object()
+
+
+def get_cache():
+    """Cache backend for record query results, the CACHES alias in RECORDS_CACHE_ALIAS"""
+
+    return caches[getattr(settings, 'RECORDS_CACHE_ALIAS', 'default')]
+
+
+def get_generation_cache():
+    """Cache holding the generation, the CACHES alias in RECORDS_GENERATION_CACHE_ALIAS.
+
+    Results may be cached per process, but the generation has to be shared
+    by every process that writes records so their changes reach the others.
+    """
+
+    alias = getattr(settings, 'RECORDS_GENERATION_CACHE_ALIAS', None)
+    return caches[alias] if alias else get_cache()
+
+
+def generation():
+    """Current results generation; every cached result is keyed under it"""
+
+    cache = get_generation_cache()
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Start from the clock so a generation evicted from the cache never
+        # comes back with a number whose old entries are still stored.
+        value = time.time_ns()
+        if not cache.add(GENERATION_KEY, value, None):
+            value = cache.get(GENERATION_KEY, value)
+    return value
+
+
+def invalidate():
+    """Start a new generation, orphaning every cached result; old entries age out of the LRU"""
+
+    # A fresh value rather than incr(): a file cache's incr is a read and a
+    # rewrite, and two processes invalidating at once could both write the
+    # same number.
+    get_generation_cache().set(GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
+
+
+def get_or_compute(name, compute):
+    """Return the cached value for name in the current generation, computing it on a miss"""
+
+    cache = get_cache()
+    key = f'records:{generation()}:{name}'
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        registry.count('cache_hits')
+        return value
+    registry.count('cache_misses')
+    value = compute()
+    cache.set(key, value, getattr(settings, 'RECORDS_CACHE_TIMEOUT', 300))
+    return value
@@ -0,0 +1,29 @@
+from django.db.models import Min
+
+from .models import ChangeEvent
+
+
+def journal(action, record_ids):
+    """Append one change event per record id, in the caller's transaction"""
+
+    ChangeEvent.objects.bulk_create([ChangeEvent(record_id=pk, action=action) for pk in record_ids])
+
+
+def latest_seq():
+    return ChangeEvent.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+
+
+def journal_expired(since):
+    """True if events after since have been pruned, so the client must resync from scratch"""
+
+    if since <= 0:
+        return False
+    oldest = ChangeEvent.objects.aggregate(oldest=Min('seq'))['oldest']
+    return oldest is not None and since < oldest - 1
+
+
+def changes_since(since, limit):
+    """Up to limit events with seq > since, oldest first, and whether more follow"""
+
+    events = list(ChangeEvent.objects.filter(seq__gt=since).order_by('seq')[:limit + 1])
+    return events[:limit], len(events) > limit
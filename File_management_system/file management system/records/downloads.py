@@ -0,0 +1,246 @@
+import asyncio
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+from .aio import aiterate
+from .metrics import count_io
+from .tiers import iter_stored, locate, original_size
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Times serve_stored locates a file again after tier_files moved it mid-request
+LOCATE_ATTEMPTS = 3
+
+
+def file_etag(path, content_hash=None):
+    """Strong ETag from the content hash when known, else from mtime and size like nginx"""
+
+    if content_hash:
+        return f'"{content_hash}"'
+    stat = os.stat(path)
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, None to ignore it, or False if unsatisfiable.
+
+    Multi-range requests are answered with the whole file, which RFC 9110
+    allows and which every download client accepts.
+    """
+
+    match = RANGE_RE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def decompressed_response(path, codec, asynchronous=False):
+    """The whole original content of a compressed file, decompressed as it is sent"""
+
+    size = original_size(path, codec)
+    chunks = iter_stored(path, codec)
+    response = StreamingHttpResponse(aiterate(chunks) if asynchronous else chunks)
+    response['Content-Length'] = str(size)
+    return response
+
+
+class DownloadBackend:
+    """Serve a file on disk as a download, answering conditional GETs with 304.
+
+    Subclasses decide how the body gets to the client in file_response().
+    A file kept compressed (codec set) is always streamed decompressed by
+    Django, without byte ranges.
+    """
+
+    def serve(self, request, path, filename, content_hash=None, as_attachment=True, asynchronous=False, codec=None):
+        stat = os.stat(path)
+        etag = file_etag(path, content_hash)
+        last_modified = int(stat.st_mtime)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if codec:
+                response = decompressed_response(path, codec, asynchronous)
+            else:
+                response = self.file_response(request, path, stat.st_size, etag, last_modified, asynchronous)
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+            content_type, encoding = mimetypes.guess_type(filename)
+            if encoding:
+                content_type = 'application/octet-stream'
+            response['Content-Type'] = content_type or 'application/octet-stream'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'none' if codec else 'bytes'
+        return response
+
+    async def aserve(self, request, path, filename, content_hash=None, as_attachment=True, codec=None):
+        """serve() for async views: file system calls run in a thread and the body is an async iterator"""
+
+        return await asyncio.to_thread(self.serve, request, path, filename, content_hash, as_attachment, True, codec)
+
+    def file_response(self, request, path, size, etag, last_modified, asynchronous=False):
+        raise NotImplementedError
+
+
+class PythonBackend(DownloadBackend):
+    """Stream the file from Django, with single byte-range (206) support"""
+
+    chunk_size = 64 * 1024
+
+    def file_response(self, request, path, size, etag, last_modified, asynchronous=False):
+        byte_range = parse_range(request.headers.get('Range'), size) if self._range_applies(request, etag, last_modified) else None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        whole = byte_range is None or byte_range == (0, size - 1)
+        # Opened here, not when the body is sent, so a file moved meanwhile fails in serve().
+        f = open(path, 'rb')
+        if whole and not asynchronous:
+            # FileResponse lets the WSGI server use wsgi.file_wrapper (sendfile).
+            if request.method != 'HEAD':
+                count_io('read', size)
+            return FileResponse(f)
+
+        start, end = (0, size - 1) if whole else byte_range
+        iter_range = self._aiter_range if asynchronous else self._iter_range
+        response = StreamingHttpResponse(iter_range(f, start, end - start + 1), status=200 if whole else 206)
+        response['Content-Length'] = str(end - start + 1)
+        if not whole:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return response
+
+    def _range_applies(self, request, etag, last_modified):
+        if request.method not in ('GET', 'HEAD') or 'Range' not in request.headers:
+            return False
+        if_range = request.headers.get('If-Range')
+        if not if_range:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return parse_etags(if_range) == [etag]
+        return parse_http_date_safe(if_range) == last_modified
+
+    def _iter_range(self, f, start, length):
+        with f:
+            f.seek(start)
+            while length > 0:
+                chunk = f.read(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                count_io('read', len(chunk))
+                yield chunk
+
+    async def _aiter_range(self, f, start, length):
+        try:
+            await asyncio.to_thread(f.seek, start)
+            while length > 0:
+                chunk = await asyncio.to_thread(f.read, min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                count_io('read', len(chunk))
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+
+class XSendfileBackend(DownloadBackend):
+    """Hand the transfer to Apache mod_xsendfile or lighttpd with the X-Sendfile header"""
+
+    header = 'X-Sendfile'
+
+    def file_response(self, request, path, size, etag, last_modified, asynchronous=False):
+        response = HttpResponse()
+        response[self.header] = path
+        return response
+
+
+class XAccelRedirectBackend(DownloadBackend):
+    """Hand the transfer to nginx with X-Accel-Redirect to an internal location.
+
+    RECORDS_DOWNLOAD_ACCEL_LOCATIONS maps each directory served this way to
+    the internal URL prefix nginx serves it under.
+    """
+
+    def file_response(self, request, path, size, etag, last_modified, asynchronous=False):
+        uri = self._internal_uri(path)
+        if uri is None:
+            return PythonBackend().file_response(request, path, size, etag, last_modified, asynchronous)
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = uri
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _internal_uri(self, path):
+        path = os.path.realpath(path)
+        for root, prefix in settings.RECORDS_DOWNLOAD_ACCEL_LOCATIONS.items():
+            root = os.path.realpath(root)
+            if path.startswith(root + os.sep):
+                relative = os.path.relpath(path, root).replace(os.sep, '/')
+                return prefix.rstrip('/') + '/' + quote(relative)
+        return None
+
+
+BACKENDS = {
+    'python': 'records.downloads.PythonBackend',
+    'x-sendfile': 'records.downloads.XSendfileBackend',
+    'x-accel-redirect': 'records.downloads.XAccelRedirectBackend',
+}
+
+
+def get_backend(name=None):
+    """Download backend named by RECORDS_DOWNLOAD_BACKEND (a BACKENDS key or a dotted path)"""
+
+    name = name or getattr(settings, 'RECORDS_DOWNLOAD_BACKEND', 'python')
+    return import_string(BACKENDS.get(name, name))()
+
+
+def serve_file(request, path, filename, content_hash=None, as_attachment=True, codec=None):
+    return get_backend().serve(request, path, filename, content_hash, as_attachment, codec=codec)
+
+
+async def aserve_file(request, path, filename, content_hash=None, as_attachment=True, codec=None):
+    return await get_backend().aserve(request, path, filename, content_hash, as_attachment, codec)
+
+
+def serve_stored(request, path, filename, content_hash=None, as_attachment=True, asynchronous=False):
+    """serve_file for an uploaded file, hot or cold; None if it is missing.
+
+    tier_files may compress or decompress the file between locate() and
+    opening it, so a vanished copy is located again.
+    """
+
+    for _ in range(LOCATE_ATTEMPTS):
+        located = locate(path)
+        if located is None:
+            return None
+        try:
+            return get_backend().serve(request, located[0], filename, content_hash, as_attachment, asynchronous, located[1])
+        except FileNotFoundError:
+            continue
+    return None
+
+
+async def aserve_stored(request, path, filename, content_hash=None, as_attachment=True):
+    """serve_stored for async views"""
+
+    return await asyncio.to_thread(serve_stored, request, path, filename, content_hash, as_attachment, True)
@@ -0,0 +1,580 @@
+import collections
+import csv
+import io
+import itertools
+import json
+import os
+import struct
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+import xlsxwriter
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .metrics import count_io
+from .pagination import _after, keyset_ordering
+from .tiers import locate, open_stored, original_size
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 64 * 1024)
+EXPORT_ITERATOR_CHUNK_SIZE = 2000
+EXPORT_COLUMNS = ('id', 'description', 'file_date', 'letter_reference_number',
+                  'original_name', 'file', 'file_type', 'upload_datetime')
+# File types stored without compression: DOCX and XLSX are ZIP archives already
+STORED_FILE_TYPES = getattr(settings, 'EXPORT_STORED_FILE_TYPES', ('DOCX', 'XLSX'))
+# Store a file when deflating a sample of it leaves more than this share of its size
+MIN_COMPRESSION_RATIO = getattr(settings, 'EXPORT_MIN_COMPRESSION_RATIO', 0.9)
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+DEFLATE_WINDOW = 32 * 1024
+
+# Metadata-only exports (CSV, NDJSON, Parquet): output fields and the columns they come from
+METADATA_FIELDS = ('id', 'description', 'file_date', 'letter_reference_number', 'file_name', 'file_type',
+                   'upload_datetime', 'updated_datetime', 'content_hash')
+METADATA_COLUMNS = ('id', 'description', 'file_date', 'letter_reference_number', 'original_name', 'file',
+                    'file_type', 'upload_datetime', 'updated_datetime', 'content_hash')
+METADATA_BATCH_SIZE = 1000
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# ZIP format limits (APPNOTE.TXT): larger sizes, offsets or counts need ZIP64 records
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+ZIP_DATA_DESCRIPTOR = 0x08
+ZIP_UTF8_NAME = 0x800
+
+_compress_executor = None
+_compress_lock = threading.Lock()
+
+
+class _ZipStream:
+    """Write-only file object that collects what _ZipWriter writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _ZipWriter:
+    """Writes a ZIP archive member by member, taking data that is deflated already.
+
+    zipfile compresses each member itself, one block after another; this
+    writer lets blocks be deflated in parallel and written as they come. Each
+    local header is followed by the data and a data descriptor with its CRC
+    and sizes, as zipfile does on unseekable streams, so fileobj only needs
+    write(). ZIP64 records are added where sizes, offsets or the number of
+    members need them.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.entries = []
+        self.current = None
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def start(self, zinfo):
+        """Write the local header of a member; zinfo.file_size is its expected size"""
+
+        flags = ZIP_DATA_DESCRIPTOR
+        try:
+            filename = zinfo.filename.encode('ascii')
+        except UnicodeEncodeError:
+            filename = zinfo.filename.encode('utf-8')
+            flags |= ZIP_UTF8_NAME
+        # Like zipfile: decide on ZIP64 up front, leaving room for deflate's overhead.
+        zip64 = zinfo.file_size * 1.05 > ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        dt = zinfo.date_time
+        self.current = {
+            'filename': filename, 'flags': flags, 'zip64': zip64, 'method': zinfo.compress_type,
+            'time': dt[3] << 11 | dt[4] << 5 | dt[5] // 2, 'date': (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2],
+            'external_attr': zinfo.external_attr, 'header_offset': self.offset,
+            'version': ZIP64_VERSION if zip64 else ZIP_VERSION, 'crc': 0, 'file_size': 0, 'compress_size': 0,
+        }
+        size = 0xFFFFFFFF if zip64 else 0
+        self._write(struct.pack(
+            '<4sHHHHHLLLHH', b'PK\x03\x04', self.current['version'], flags, zinfo.compress_type,
+            self.current['time'], self.current['date'], 0, size, size, len(filename), len(extra),
+        ) + filename + extra)
+
+    def write(self, data, compressed=None):
+        """Add data to the current member, written as compressed when it is deflated already"""
+
+        entry = self.current
+        stored = data if compressed is None else compressed
+        entry['crc'] = zlib.crc32(data, entry['crc'])
+        entry['file_size'] += len(data)
+        entry['compress_size'] += len(stored)
+        self._write(stored)
+
+    def finish(self):
+        """Write the current member's data descriptor"""
+
+        entry = self.current
+        if not entry['zip64'] and max(entry['file_size'], entry['compress_size']) > ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f"{entry['filename']!r} grew past the ZIP64 limit while it was exported")
+        fmt = '<4sLQQ' if entry['zip64'] else '<4sLLL'
+        self._write(struct.pack(fmt, b'PK\x07\x08', entry['crc'], entry['compress_size'], entry['file_size']))
+        self.entries.append(entry)
+        self.current = None
+
+    def close(self):
+        """Write the central directory and the end records"""
+
+        start = self.offset
+        for entry in self.entries:
+            sizes = [entry['file_size'], entry['compress_size'], entry['header_offset']]
+            # The ZIP64 extra field holds the values that do not fit, in this order.
+            large = [value for value in sizes if value > ZIP64_LIMIT]
+            extra = struct.pack(f'<HH{len(large)}Q', 1, 8 * len(large), *large) if large else b''
+            file_size, compress_size, header_offset = (0xFFFFFFFF if value > ZIP64_LIMIT else value for value in sizes)
+            version = ZIP64_VERSION if large or entry['zip64'] else ZIP_VERSION
+            self._write(struct.pack(
+                '<4sBBHHHHHLLLHHHHHLL', b'PK\x01\x02', version, 3, version, entry['flags'], entry['method'],
+                entry['time'], entry['date'], entry['crc'], compress_size, file_size,
+                len(entry['filename']), len(extra), 0, 0, 0, entry['external_attr'], header_offset,
+            ) + entry['filename'] + extra)
+
+        count, size = len(self.entries), self.offset - start
+        if count > ZIP_MAX_ENTRIES or size > ZIP64_LIMIT or start > ZIP64_LIMIT:
+            end = self.offset
+            self._write(struct.pack(
+                '<4sQHHLLQQQQ', b'PK\x06\x06', 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0, count, count, size, start,
+            ))
+            self._write(struct.pack('<4sLQL', b'PK\x06\x07', 0, end, 1))
+            count, size, start = min(count, 0xFFFF), min(size, 0xFFFFFFFF), min(start, 0xFFFFFFFF)
+        self._write(struct.pack('<4sHHHHLLH', b'PK\x05\x06', 0, 0, count, count, size, start, 0))
+
+
+def _keyset_rows(records, columns):
+    """records.values_list(*columns, named=True), EXPORT_ITERATOR_CHUNK_SIZE rows per query.
+
+    Every batch is its own keyset query starting after the last row of the
+    one before, so no cursor stays open while a streamed export waits on a
+    slow client (on SQLite an open cursor holds the read lock that uploads
+    and edits wait on). A sort with no keyset, such as relevance, reads the
+    ordered ids first and fetches their rows by primary key.
+    """
+
+    size = EXPORT_ITERATOR_CHUNK_SIZE
+    rows = records.values_list(*columns, named=True)
+    ordering = keyset_ordering(records)
+    if ordering is None:
+        ids = list(records.values_list('pk', flat=True))
+        rows = records.model._default_manager.values_list(*columns, named=True)
+        for start in range(0, len(ids), size):
+            batch = ids[start:start + size]
+            by_pk = {row.id: row for row in rows.filter(pk__in=batch)}
+            yield from (by_pk[pk] for pk in batch if pk in by_pk)
+        return
+
+    values = None
+    while True:
+        batch = list((rows if values is None else rows.filter(_after(ordering, values)))[:size])
+        yield from batch
+        if len(batch) < size:
+            return
+        values = [getattr(batch[-1], name) for name, _ in ordering]
+
+
+def export_rows(records):
+    """Only the exported columns of records, read from the database in batches"""
+
+    return _keyset_rows(records, EXPORT_COLUMNS)
+
+
+def row_file_name(row):
+    return row.original_name or os.path.basename(row.file)
+
+
+class RecordSheet:
+    """The records sheet with logo header, written to a filename or file object a row at a time.
+
+    The workbook is built in constant-memory mode, which flushes each row to
+    a temp file once the next one starts, so memory does not grow with the
+    number of rows. Call close() after the last row to finish the file.
+    """
+
+    def __init__(self, output):
+        self.workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        self.worksheet = worksheet = self.workbook.add_worksheet('File Records')
+
+        logo_path = os.path.join(settings.BASE_DIR, 'records', 'static', 'images', 'logo.png')
+        if os.path.exists(logo_path):
+            try:
+                worksheet.set_header('&C&G', {'image_center': logo_path})
+            except Exception:
+                pass
+
+        header_row = 4
+        headers = ['Serial Number', 'Description', 'File Date', 'Letter Reference', 'File Name', 'File Type', 'Upload Date & Time']
+
+        header_format = self.workbook.add_format({
+            'bold': True,
+            'bg_color': '#4472C4',
+            'font_color': 'white',
+            'align': 'center',
+            'valign': 'vcenter',
+            'border': 1
+        })
+
+        for col, header in enumerate(headers):
+            worksheet.write(header_row, col, header, header_format)
+
+        self.cell_format = self.workbook.add_format({
+            'align': 'center',
+            'valign': 'vcenter',
+            'border': 1
+        })
+
+        self.text_format = self.workbook.add_format({
+            'align': 'left',
+            'valign': 'vcenter',
+            'border': 1
+        })
+
+        self.date_format = self.workbook.add_format({
+            'align': 'center',
+            'valign': 'vcenter',
+            'border': 1,
+            'num_format': 'yyyy-mm-dd'
+        })
+
+        worksheet.set_column('A:A', 12)
+        worksheet.set_column('B:B', 25)
+        worksheet.set_column('C:C', 12)
+        worksheet.set_column('D:D', 18)
+        worksheet.set_column('E:E', 25)
+        worksheet.set_column('F:F', 12)
+        worksheet.set_column('G:G', 20)
+
+        self.row_num = header_row + 1
+
+    def add(self, row):
+        """Write one row from export_rows()"""
+
+        worksheet, row_num = self.worksheet, self.row_num
+        # Typed writes skip write()'s per-cell type sniffing (and never turn
+        # a description starting with '=' into a formula).
+        worksheet.write_number(row_num, 0, row.id, self.cell_format)
+        worksheet.write_string(row_num, 1, row.description, self.text_format)
+
+        if row.file_date:
+            worksheet.write_datetime(row_num, 2, row.file_date, self.date_format)
+        else:
+            worksheet.write_blank(row_num, 2, None, self.cell_format)
+
+        worksheet.write_string(row_num, 3, row.letter_reference_number or '', self.cell_format)
+        worksheet.write_string(row_num, 4, row_file_name(row), self.text_format)
+        worksheet.write_string(row_num, 5, row.file_type, self.cell_format)
+        worksheet.write_string(row_num, 6, row.upload_datetime.strftime('%Y-%m-%d %H:%M:%S'), self.cell_format)
+
+        self.row_num += 1
+
+    def close(self):
+        self.workbook.close()
+
+
+def _record_members(sheet, rows):
+    """Add each row to the sheet and yield (arcname, path, file_type, codec) for its file.
+
+    Files missing from disk are left out; a cold file comes with its
+    compressed copy's path and codec. The sheet is closed after the last row.
+    """
+
+    for count, row in enumerate(rows, 1):
+        sheet.add(row)
+        if not row.file:
+            continue
+        located = locate(os.path.join(settings.MEDIA_ROOT, row.file))
+        if located is None:
+            continue
+        path, codec = located
+        name_without_ext, ext = os.path.splitext(row_file_name(row))
+        yield f"files/{count:03d}_{name_without_ext}{ext}", path, row.file_type, codec
+    sheet.close()
+
+
+def compress_type(path, file_type):
+    """ZIP_STORED for content that deflate would barely shrink, else ZIP_DEFLATED.
+
+    Office documents are ZIP archives already. Anything else is judged by
+    compressing a sample from the middle of the file, where a PDF's streams
+    or an image's pixel data are.
+    """
+
+    if file_type in STORED_FILE_TYPES:
+        return zipfile.ZIP_STORED
+    with open(path, 'rb') as f:
+        f.seek(max(os.fstat(f.fileno()).st_size - COMPRESSION_SAMPLE_SIZE, 0) // 2)
+        sample = f.read(COMPRESSION_SAMPLE_SIZE)
+    if not sample or len(zlib.compress(sample, 1)) > len(sample) * MIN_COMPRESSION_RATIO:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def compress_workers():
+    return getattr(settings, 'EXPORT_COMPRESS_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_compress_executor():
+    """Process-wide thread pool for deflating export blocks, or None to deflate inline.
+
+    zlib releases the GIL while it compresses, so threads use every core
+    without copying blocks to other processes.
+    """
+
+    global _compress_executor
+    if compress_workers() <= 1:
+        return None
+    with _compress_lock:
+        if _compress_executor is None:
+            _compress_executor = ThreadPoolExecutor(max_workers=compress_workers(), thread_name_prefix='records-deflate')
+    return _compress_executor
+
+
+def _deflate_block(data, zdict, final):
+    """Raw deflate one block, primed with the end of the previous block like pigz.
+
+    Blocks end on a byte boundary (Z_SYNC_FLUSH), so compressed blocks simply
+    concatenate into one deflate stream; only the last one is final.
+    """
+
+    if zdict:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _Member:
+    def __init__(self, arcname, path, file_type, codec=None):
+        self.zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        if codec is None:
+            self.zinfo.compress_type = compress_type(path, file_type)
+        else:
+            # Only files that compressed well are kept cold.
+            self.zinfo.file_size = original_size(path, codec)
+            self.zinfo.compress_type = zipfile.ZIP_DEFLATED
+        self.path = path
+        self.codec = codec
+
+
+def _plan_blocks(members, executor):
+    """Read members in order and queue their blocks for compression.
+
+    Yields ('open', member), ('block', member, data, compressed) and
+    ('close', member) in archive order; compressed is a Future (or bytes when
+    deflating inline) for DEFLATED members and None for STORED ones.
+    """
+
+    for arcname, path, file_type, codec in members:
+        try:
+            member = _Member(arcname, path, file_type, codec)
+            src = open_stored(path, codec)
+        except OSError:
+            continue
+        deflated = member.zinfo.compress_type == zipfile.ZIP_DEFLATED
+        yield ('open', member)
+        with src:
+            zdict = b''
+            while True:
+                try:
+                    data = src.read(EXPORT_CHUNK_SIZE)
+                except OSError:
+                    break
+                if not data:
+                    break
+                count_io('read', len(data))
+                compressed = None
+                if deflated:
+                    if executor is None:
+                        compressed = _deflate_block(data, zdict, False)
+                    else:
+                        compressed = executor.submit(_deflate_block, data, zdict, False)
+                    zdict = data[-DEFLATE_WINDOW:]
+                yield ('block', member, data, compressed)
+        if deflated:
+            yield ('block', member, b'', _deflate_block(b'', b'', True))
+        yield ('close', member)
+
+
+def _write_blocks(writer, step):
+    kind, member = step[0], step[1]
+    if kind == 'open':
+        writer.start(member.zinfo)
+    elif kind == 'block':
+        data, compressed = step[2], step[3]
+        if compressed is not None and not isinstance(compressed, bytes):
+            compressed = compressed.result()
+        writer.write(data, compressed)
+    else:
+        writer.finish()
+        return True
+    return False
+
+
+def _write_members(writer, members, progress=None):
+    """Add members to the archive in order, deflating blocks in parallel; yields after each block"""
+
+    executor = get_compress_executor()
+    # Blocks read ahead of the writer: enough to keep every worker busy
+    window = compress_workers() * 4
+    pending = collections.deque()
+    done = 0
+    for step in itertools.chain(_plan_blocks(members, executor), [None]):
+        if step is not None:
+            pending.append(step)
+        while pending and (step is None or len(pending) > window):
+            if _write_blocks(writer, pending.popleft()):
+                if progress:
+                    progress(done)
+                done += 1
+            yield
+
+
+def _write_export(writer, records, progress=None):
+    """Write every record file, then records.xlsx, into a _ZipWriter, yielding after each block.
+
+    Files go into the archive as their rows are read, so the first bytes are
+    out before the sheet is finished; the central directory is written last,
+    which leaves records.xlsx free to be the last member.
+    """
+
+    fd, excel_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        sheet = RecordSheet(excel_path)
+        members = itertools.chain(_record_members(sheet, export_rows(records)),
+                                  [('records.xlsx', excel_path, 'XLSX', None)])
+        yield from _write_members(writer, members, progress)
+        writer.close()
+    finally:
+        os.remove(excel_path)
+
+
+def iter_export_zip(records):
+    """Generate the export ZIP (every file plus records.xlsx) as a stream of bytes.
+
+    Records are read from the database once, in batches, for both the sheet
+    and the files. Files are read from MEDIA_ROOT in EXPORT_CHUNK_SIZE
+    pieces and each piece is handed back as soon as it is compressed, so
+    memory use does not depend on the number of records or the size of the
+    exported files, and the first bytes do not wait for the last record.
+    """
+
+    stream = _ZipStream()
+    for _ in _write_export(_ZipWriter(stream), records):
+        data = stream.drain()
+        if data:
+            yield data
+
+    yield stream.drain()
+
+
+def write_export_zip(records, path, progress=None):
+    """Write the export ZIP to path, calling progress(files_done) after each file"""
+
+    with open(path, 'wb') as f:
+        for _ in _write_export(_ZipWriter(f), records, progress):
+            pass
+
+
+def metadata_rows(records):
+    """A tuple of METADATA_FIELDS values per record, read from the database in batches"""
+
+    for row in _keyset_rows(records, METADATA_COLUMNS):
+        yield (row.id, row.description, row.file_date, row.letter_reference_number, row_file_name(row),
+               row.file_type, row.upload_datetime, row.updated_datetime, row.content_hash)
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _plain(row):
+    return [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+
+
+def iter_csv(records):
+    """Generate the records' metadata as CSV with a header row, METADATA_BATCH_SIZE rows per chunk"""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(METADATA_FIELDS)
+    for batch in _batches(metadata_rows(records), METADATA_BATCH_SIZE):
+        writer.writerows(_plain(row) for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(records):
+    """Generate the records' metadata as newline-delimited JSON objects"""
+
+    for batch in _batches(metadata_rows(records), METADATA_BATCH_SIZE):
+        yield ''.join(
+            json.dumps(dict(zip(METADATA_FIELDS, _plain(row))), ensure_ascii=False) + '\n' for row in batch
+        ).encode('utf-8')
+
+
+def parquet_available():
+    return pyarrow is not None
+
+
+def write_parquet(records, output):
+    """Write the records' metadata as a Parquet file (requires pyarrow).
+
+    Rows are converted a row group at a time, so memory is bounded by
+    PARQUET_ROW_GROUP_SIZE rather than the number of records.
+    """
+
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('description', pyarrow.string()),
+        ('file_date', pyarrow.date32()),
+        ('letter_reference_number', pyarrow.string()),
+        ('file_name', pyarrow.string()),
+        ('file_type', pyarrow.string()),
+        ('upload_datetime', pyarrow.timestamp('us', tz='UTC')),
+        ('updated_datetime', pyarrow.timestamp('us', tz='UTC')),
+        ('content_hash', pyarrow.string()),
+    ])
+    with pyarrow.parquet.ParquetWriter(output, schema, compression='zstd') as writer:
+        for batch in _batches(metadata_rows(records), PARQUET_ROW_GROUP_SIZE):
+            columns = zip(*batch)
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
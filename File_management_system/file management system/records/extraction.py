@@ -0,0 +1,101 @@
+import hashlib
+import zipfile
+from xml.etree import ElementTree
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MAX_TEXT_CHARS = 1000000
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def hash_file(path):
+    """SHA-256 of a file, read in fixed-size chunks"""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _xml_text(archive, member, tag, separator_tag=None):
+    parts = []
+    with archive.open(member) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag == tag and elem.text:
+                parts.append(elem.text)
+            elif separator_tag and elem.tag == separator_tag:
+                parts.append('\n')
+            elem.clear()
+    return ' '.join(parts)
+
+
+def _docx_text(path):
+    with zipfile.ZipFile(path) as archive:
+        members = [
+            name for name in archive.namelist()
+            if name == 'word/document.xml' or name.startswith(('word/header', 'word/footer'))
+        ]
+        return '\n'.join(_xml_text(archive, name, f'{WORD_NS}t', f'{WORD_NS}p') for name in members)
+
+
+def _xlsx_text(path):
+    with zipfile.ZipFile(path) as archive:
+        members = [
+            name for name in archive.namelist()
+            if name == 'xl/sharedStrings.xml' or name.startswith('xl/worksheets/sheet')
+        ]
+        return '\n'.join(_xml_text(archive, name, f'{SHEET_NS}t') for name in members)
+
+
+def _pdf_text(path):
+    if PdfReader is None:
+        return ''
+    reader = PdfReader(path)
+    parts = []
+    size = 0
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        parts.append(text)
+        size += len(text)
+        if size >= MAX_TEXT_CHARS:
+            break
+    return '\n'.join(parts)
+
+
+EXTRACTORS = {
+    'PDF': _pdf_text,
+    'DOCX': _docx_text,
+    'XLSX': _xlsx_text,
+}
+
+
+def extract_text(path, file_type):
+    """Plain text of a PDF, DOCX or XLSX file; empty for other types or unreadable files"""
+
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        return ''
+    try:
+        return extractor(path)[:MAX_TEXT_CHARS]
+    except Exception:
+        return ''
+
+
+def extract_file(path, file_type, known_hash=None):
+    """Return (content_hash, text), with text None when the hash equals known_hash.
+
+    Module-level and free of Django state so it can run in a process pool.
+    """
+
+    content_hash = hash_file(path)
+    if content_hash == known_hash:
+        return content_hash, None
+    return content_hash, extract_text(path, file_type)
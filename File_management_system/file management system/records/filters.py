@@ -0,0 +1,92 @@
+import hashlib
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import FileRecord
+from .search import search_records
+
+
+DEFAULT_SORT = '-upload_datetime'
+
+SORT_ORDERINGS = {
+    '-upload_datetime': ('-upload_datetime', '-id'),
+    'upload_date_asc': ('upload_datetime', 'id'),
+    'upload_date_desc': ('-upload_datetime', '-id'),
+    'description_asc': ('description', 'id'),
+    'description_desc': ('-description', '-id'),
+    'relevance': ('search_rank', '-upload_datetime', '-id'),
+}
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def get_filters(params):
+    """Read and normalize the search/filter/sort parameters from a QueryDict"""
+
+    file_type = params.get('file_type', '').strip()
+    if file_type == 'All':
+        file_type = ''
+
+    start_date = params.get('start_date', '').strip()
+    if start_date and _parse_date(start_date) is None:
+        start_date = ''
+
+    end_date = params.get('end_date', '').strip()
+    if end_date and _parse_date(end_date) is None:
+        end_date = ''
+
+    sort_by = params.get('sort_by', DEFAULT_SORT).strip()
+    if sort_by not in SORT_ORDERINGS:
+        sort_by = DEFAULT_SORT
+
+    return {
+        'search': params.get('search', '').strip(),
+        'file_type': file_type,
+        'start_date': start_date,
+        'end_date': end_date,
+        'sort_by': sort_by,
+    }
+
+
+def filters_key(filters):
+    """Stable hash of normalized filters, used to key cached results"""
+
+    payload = json.dumps(filters, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def filter_records(filters):
+    """Apply normalized filters to FileRecord and return the ordered queryset"""
+
+    records = FileRecord.objects.all()
+
+    sort_by = filters['sort_by']
+    if filters['search']:
+        records = search_records(records, filters['search'], rank=sort_by == 'relevance')
+    elif sort_by == 'relevance':
+        sort_by = DEFAULT_SORT
+
+    if filters['file_type']:
+        records = records.filter(file_type=filters['file_type'])
+
+    # Plain range predicates on upload_datetime (rather than __date, which wraps
+    # the column in a function) so the upload_datetime indexes can be used.
+    if filters['start_date']:
+        records = records.filter(upload_datetime__gte=_day_start(_parse_date(filters['start_date'])))
+
+    if filters['end_date']:
+        end_day = _parse_date(filters['end_date']) + timedelta(days=1)
+        records = records.filter(upload_datetime__lt=_day_start(end_day))
+
+    return records.order_by(*SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS[DEFAULT_SORT]))
@@ -1,7 +1,13 @@
+import os
+
 from django import forms
-from .models import FileRecord
+from django.conf import settings
+
+from .models import FileRecord, UploadSession
 
 
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
 class FileRecordForm(forms.ModelForm):
     class Meta:
         model = FileRecord
@@ -36,6 +42,66 @@ class FileRecordForm(forms.ModelForm):
         file = self.cleaned_data.get('file')
         if not file:
             raise forms.ValidationError('Please select a file to upload.')
-        if file.size > 10 * 1024 * 1024:
+        if file.size > MAX_UPLOAD_SIZE:
             raise forms.ValidationError('File size must not exceed 10 MB.')
         return file
+
+
+class BulkUploadForm(forms.Form):
+    description = forms.CharField(required=False)
+    file_date = forms.DateField(required=False)
+    letter_reference_number = forms.CharField(required=False, max_length=255)
+    
+    def clean_description(self):
+        return self.cleaned_data.get('description', '').strip()
+    
+    def clean_letter_reference_number(self):
+        return self.cleaned_data.get('letter_reference_number', '').strip() or None
+
+
+class BulkEditForm(forms.Form):
+    """Metadata to set on every selected record; blank fields are left unchanged"""
+    
+    description = forms.CharField(required=False)
+    file_date = forms.DateField(required=False)
+    letter_reference_number = forms.CharField(required=False, max_length=255)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        changes = {name: value for name, value in cleaned_data.items() if value not in (None, '')}
+        if not changes:
+            raise forms.ValidationError('Enter at least one field to change.')
+        return changes
+    
+    def clean_description(self):
+        return self.cleaned_data.get('description', '').strip()
+    
+    def clean_letter_reference_number(self):
+        return self.cleaned_data.get('letter_reference_number', '').strip()
+
+
+class UploadSessionForm(forms.ModelForm):
+    class Meta:
+        model = UploadSession
+        fields = ['description', 'file_date', 'letter_reference_number', 'file_name', 'total_size']
+    
+    def clean_description(self):
+        description = self.cleaned_data.get('description', '').strip()
+        if not description:
+            raise forms.ValidationError('Description cannot be empty.')
+        return description
+    
+    def clean_file_name(self):
+        file_name = os.path.basename(self.cleaned_data.get('file_name', '').strip())
+        if not file_name:
+            raise forms.ValidationError('File name cannot be empty.')
+        return file_name
+    
+    def clean_total_size(self):
+        total_size = self.cleaned_data.get('total_size')
+        if total_size is None or total_size <= 0:
+            raise forms.ValidationError('File size must be greater than zero.')
+        limit = settings.CHUNKED_UPLOAD_MAX_SIZE
+        if total_size > limit:
+            raise forms.ValidationError(f'File size must not exceed {limit // (1024 * 1024)} MB.')
+        return total_size
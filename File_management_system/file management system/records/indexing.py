@@ -0,0 +1,51 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import workers
+from .extraction import EXTRACTORS, extract_text, hash_file
+from .models import ExtractedContent, FileRecord
+from .tiers import local_copy
+
+
+def queue_content_indexing(record_id):
+    """Extract and index a record's file on the worker pool once the transaction commits"""
+
+    transaction.on_commit(lambda: workers.submit(index_record_content, record_id))
+
+
+def save_content(record_id, content_hash, text):
+    # Write before reading, as retain_file does: update_or_create reads
+    # first, which fails at once with "database is locked" on SQLite while
+    # another worker writes. update() skips auto_now, so the time is set here.
+    values = {'content_hash': content_hash, 'text': text, 'extracted_datetime': timezone.now()}
+    if ExtractedContent.objects.filter(record_id=record_id).update(**values):
+        return
+    try:
+        with transaction.atomic():
+            ExtractedContent.objects.create(record_id=record_id, **values)
+    except IntegrityError:
+        ExtractedContent.objects.filter(record_id=record_id).update(**values)
+
+
+def index_record_content(record_id):
+    """Index one record's file, skipping extraction when its content hash is already known.
+
+    Only file types with an extractor are indexed; reading and hashing any
+    other file would only store empty text.
+    """
+
+    record = FileRecord.objects.filter(pk=record_id).first()
+    if record is None or not record.file or record.file_type not in EXTRACTORS:
+        return
+    with local_copy(record.file.path) as path:
+        if path is None:
+            return
+
+        content_hash = record.content_hash or hash_file(path)
+        known = ExtractedContent.objects.filter(content_hash=content_hash).only('record_id', 'text')
+        if known.filter(record_id=record_id).exists():
+            return
+
+        shared = known.first()
+        text = shared.text if shared else extract_text(path, record.file_type)
+    save_content(record_id, content_hash, text)
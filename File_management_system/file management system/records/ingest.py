@@ -0,0 +1,201 @@
+import collections
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .blobs import remove_paths
+from .models import FileRecord
+from .signals import records_bulk_created
+from .storage import blob_hash, file_identity, upload_storage
+
+
+DEFAULT_BATCH_SIZE = 500
+# Sources queued per worker thread: enough to keep them busy without
+# holding every file of a large directory or archive in the queue
+QUEUED_PER_WORKER = 4
+
+
+class IngestSource:
+    """A file to ingest: its name, size and a callable returning an open binary file"""
+
+    def __init__(self, name, size, opener):
+        self.name = os.path.basename(name)
+        self.size = size
+        self.open = opener
+
+
+class IngestResult:
+    def __init__(self, name, size=0, stored_name=None, error=None):
+        self.name = name
+        self.size = size
+        self.stored_name = stored_name
+        self.error = error
+        self.record_id = None
+        # file_identity() of the stored file, to unlink it only if unchanged
+        self.identity = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.record_id is not None
+
+    def as_dict(self):
+        return {'name': self.name, 'size': self.size, 'record_id': self.record_id, 'error': self.error}
+
+
+class IngestReport:
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def created(self):
+        return sum(1 for result in self.results if result.ok)
+
+    @property
+    def failed(self):
+        return len(self.results) - self.created
+
+    @property
+    def bytes(self):
+        return sum(result.size for result in self.results if result.ok)
+
+    def summary(self):
+        elapsed = max(self.elapsed, 1e-6)
+        return (
+            f"{self.created} files ingested, {self.failed} failed in {self.elapsed:.1f}s "
+            f"({self.created / elapsed:.1f} files/s, {self.bytes / elapsed / (1024 * 1024):.1f} MB/s)"
+        )
+
+
+def directory_sources(root):
+    """Every regular file below root, walked with os.scandir"""
+
+    pending = [root]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield IngestSource(entry.name, entry.stat().st_size, lambda path=entry.path: open(path, 'rb'))
+
+
+def zip_sources(archive):
+    """Every file member of an open zipfile.ZipFile"""
+
+    for info in archive.infolist():
+        if not info.is_dir():
+            yield IngestSource(info.filename, info.file_size, lambda info=info: archive.open(info))
+
+
+def uploaded_sources(files):
+    """Sources for UploadedFile objects from request.FILES"""
+
+    for uploaded in files:
+        yield IngestSource(uploaded.name, uploaded.size, lambda uploaded=uploaded: uploaded)
+
+
+@contextmanager
+def path_sources(path):
+    """Sources for a directory or ZIP archive; an archive stays open until the block ends"""
+
+    if zipfile.is_zipfile(path) and not os.path.isdir(path):
+        with zipfile.ZipFile(path) as archive:
+            yield zip_sources(archive)
+    else:
+        yield directory_sources(path)
+
+
+def _store(source, max_size):
+    result = IngestResult(source.name, source.size)
+    if not source.name:
+        result.error = 'File name is empty.'
+    elif source.size > max_size:
+        result.error = f'File size must not exceed {max_size // (1024 * 1024)} MB.'
+    else:
+        try:
+            f = source.open()
+            try:
+                content = f if isinstance(f, File) else File(f, name=source.name)
+                name = FileRecord.file.field.generate_filename(None, source.name)
+                result.stored_name = upload_storage.save(name, content)
+                result.identity = file_identity(upload_storage.path(result.stored_name))
+            finally:
+                f.close()
+        except Exception as e:
+            result.error = str(e)
+    return result
+
+
+def _insert(results, description, file_date, letter_reference_number):
+    records = [
+        FileRecord(
+            description=description or os.path.splitext(result.name)[0],
+            file=result.stored_name,
+            original_name=result.name,
+            content_hash=blob_hash(result.stored_name),
+            file_type=FileRecord.detect_file_type(result.name),
+            file_date=file_date,
+            letter_reference_number=letter_reference_number,
+        )
+        for result in results
+    ]
+    try:
+        with transaction.atomic():
+            created = FileRecord.objects.bulk_create(records)
+            records_bulk_created.send(sender=FileRecord, records=created)
+    except Exception as e:
+        # The files are stored already; unlink the ones no other record uses.
+        remove_paths((upload_storage.path(result.stored_name), result.identity) for result in results)
+        for result in results:
+            result.error = f'Could not save record: {e}'
+            result.stored_name = None
+        return
+    for result, record in zip(results, created):
+        result.record_id = record.pk
+
+
+def ingest(sources, description='', file_date=None, letter_reference_number=None,
+           workers=None, batch_size=DEFAULT_BATCH_SIZE, max_size=None):
+    """Store many files concurrently and insert their FileRecords in batches.
+
+    Files are written to storage on a thread pool, with at most
+    QUEUED_PER_WORKER sources per thread queued ahead. Rows are inserted
+    with bulk_create once per batch_size stored files, and
+    records_bulk_created is then sent so the work save() signals normally
+    do still happens.
+    """
+
+    started = time.perf_counter()
+    results = []
+    pending = []
+    workers = workers or getattr(settings, 'WORKER_POOL_SIZE', 4)
+    store = partial(_store, max_size=max_size or settings.CHUNKED_UPLOAD_MAX_SIZE)
+
+    def collect(result):
+        nonlocal pending
+        results.append(result)
+        if result.error is None:
+            pending.append(result)
+        if len(pending) >= batch_size:
+            _insert(pending, description, file_date, letter_reference_number)
+            pending = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        queued = collections.deque()
+        for source in sources:
+            queued.append(executor.submit(store, source))
+            if len(queued) >= workers * QUEUED_PER_WORKER:
+                collect(queued.popleft().result())
+        while queued:
+            collect(queued.popleft().result())
+        if pending:
+            _insert(pending, description, file_date, letter_reference_number)
+    return IngestReport(results, time.perf_counter() - started)
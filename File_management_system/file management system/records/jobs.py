@@ -0,0 +1,123 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import workers
+from .exports import write_export_zip
+from .filters import filter_records, filters_key
+from .models import ExportJob
+
+
+PROGRESS_INTERVAL = 1.0
+LIVE_STATUSES = [ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING]
+
+
+def job_timeout():
+    """Seconds a pending or running job may go without a heartbeat before it is given up as dead"""
+
+    return getattr(settings, 'EXPORT_JOB_TIMEOUT', 600)
+
+
+def abandon_dead_jobs(**filters):
+    """Mark pending and running jobs whose worker stopped (restart, deploy, OOM) as failed"""
+
+    cutoff = timezone.now() - timedelta(seconds=job_timeout())
+    # Jobs from before heartbeats were recorded go by their creation time.
+    dead = Q(heartbeat_datetime__lt=cutoff) | Q(heartbeat_datetime__isnull=True, created_datetime__lt=cutoff)
+    return ExportJob.objects.filter(dead, status__in=LIVE_STATUSES, **filters).update(
+        status=ExportJob.STATUS_FAILED, error='The export stopped without finishing.', finished_datetime=timezone.now(),
+    )
+
+
+def start_export(filters, user=None):
+    """Return a job for these filters, reusing a running or finished one when possible"""
+
+    key = filters_key(filters)
+    abandon_dead_jobs(filters_key=key)
+    job = ExportJob.objects.filter(
+        filters_key=key,
+        status__in=LIVE_STATUSES + [ExportJob.STATUS_DONE],
+    ).first()
+    if job and (job.status != ExportJob.STATUS_DONE or os.path.exists(job.artifact_path)):
+        return job
+
+    job = ExportJob.objects.create(filters_key=key, filters=filters, created_by=user, heartbeat_datetime=timezone.now())
+    transaction.on_commit(lambda: workers.submit(run_export_job, job.pk))
+    transaction.on_commit(lambda: workers.submit(prune_artifacts))
+    return job
+
+
+def run_export_job(job_id):
+    """Build the xlsx+ZIP bundle for a job on a worker thread"""
+
+    # Claim the job, unless it was given up while it waited for a worker.
+    claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING).update(
+        status=ExportJob.STATUS_RUNNING, heartbeat_datetime=timezone.now(),
+    )
+    if not claimed:
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    records = filter_records(job.filters)
+    job.total = records.count()
+    job.save(update_fields=['total'])
+
+    last_update = time.monotonic()
+
+    def progress(done):
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update >= PROGRESS_INTERVAL:
+            ExportJob.objects.filter(pk=job.pk).update(progress=done, heartbeat_datetime=timezone.now())
+            last_update = now
+
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    tmp_path = os.path.join(settings.EXPORT_ROOT, f"{job.filters_key}.{job.pk}.tmp")
+    changes = {}
+    try:
+        write_export_zip(records, tmp_path, progress)
+        os.replace(tmp_path, job.artifact_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        changes.update(status=ExportJob.STATUS_FAILED, error=str(e))
+    else:
+        changes.update(status=ExportJob.STATUS_DONE, progress=job.total)
+    changes['finished_datetime'] = timezone.now()
+    # Only a job still running finishes: one marked stale because records
+    # changed meanwhile, or failed as dead, keeps that status.
+    if not ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING).update(**changes):
+        _remove(job.artifact_path)
+
+
+def prune_artifacts():
+    """Delete bundles and partial files under EXPORT_ROOT that no pending, running or finished job uses.
+
+    Returns the number of files deleted.
+    """
+
+    try:
+        names = os.listdir(settings.EXPORT_ROOT)
+    except FileNotFoundError:
+        return 0
+    keep = set()
+    for job in ExportJob.objects.filter(status__in=LIVE_STATUSES + [ExportJob.STATUS_DONE]).only('id', 'filters_key'):
+        keep.add(os.path.basename(job.artifact_path))
+        keep.add(f"{job.filters_key}.{job.pk}.tmp")
+    removed = 0
+    for name in names:
+        if name.endswith(('.zip', '.tmp')) and name not in keep:
+            removed += _remove(os.path.join(settings.EXPORT_ROOT, name))
+    return removed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
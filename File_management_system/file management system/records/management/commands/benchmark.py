@@ -0,0 +1,246 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from records import workers
+from records.cache import get_cache, invalidate
+from records.synthetic import make_pdf, seed_records
+
+
+STEPS = ['list', 'list_cached', 'search', 'filter', 'api_list', 'upload', 'download', 'export', 'export_csv']
+UPLOAD_SIZE = 100 * 1024
+MIN_MEMORY_DELTA_KB = 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the main views on generated records at several archive sizes, in a throwaway '
+        'database and MEDIA_ROOT, and fail if any step regressed against a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000], help='Record counts to seed')
+        parser.add_argument('--repeat', type=int, default=9, help='Timed runs per step')
+        parser.add_argument('--step', choices=STEPS, action='append', help='Only run these steps')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--unique-files', type=int, default=200, help='Distinct files per scale; others are duplicates')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--no-compare', action='store_true', help='Only report the timings; do not check a baseline')
+        parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown, e.g. 0.25 for 25%%')
+        parser.add_argument('--min-ms', type=float, default=5.0, help='Ignore slowdowns smaller than this')
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        compare = not (options['save_baseline'] or options['no_compare'])
+        if compare and not os.path.exists(options['baseline']):
+            raise CommandError(
+                f"No baseline at {options['baseline']}; record one with --save-baseline, or pass --no-compare."
+            )
+        steps = options['step'] or STEPS
+        root = tempfile.mkdtemp(prefix='records-benchmark-')
+        media_root = os.path.join(root, 'media')
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        test_settings['NAME'] = os.path.join(root, 'db.sqlite3')
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                UPLOAD_SESSION_ROOT=os.path.join(root, 'partial_uploads'),
+                EXPORT_ROOT=os.path.join(root, 'exports'),
+                ALLOWED_HOSTS=['testserver'],
+                DEBUG=False,
+                RECORDS_SLOW_REQUEST_SECONDS=None,
+                # Its own cache, so the server's shared one is neither read nor cleared
+                CACHES=dict(settings.CACHES,
+                            records={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                     'LOCATION': 'benchmark'},
+                            records_generation={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                'LOCATION': 'benchmark-generation'}),
+            ):
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    results = self._run(steps, options)
+                finally:
+                    workers.wait_idle()
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            test_settings['NAME'] = old_test_name
+            shutil.rmtree(root, ignore_errors=True)
+
+        report = {'environment': self._environment(), 'options': self._options(options), 'results': results}
+        if options['output']:
+            self._write(options['output'], report)
+        if options['save_baseline']:
+            self._write(options['baseline'], report)
+            self.stdout.write(f"Baseline written to {options['baseline']}")
+        if compare:
+            self._compare(report, options)
+
+    def _run(self, steps, options):
+        get_cache().clear()
+        user = get_user_model().objects.create_user('benchmark')
+        client = Client()
+        client.force_login(user)
+        self.rng = random.Random(options['seed'])
+        self.record_id = None
+
+        results = {}
+        seeded = 0
+        self.stdout.write(f"{'records':>8}  {'step':<12} {'median ms':>10} {'p95 ms':>9} {'peak KB':>9} {'queries':>8}")
+        for scale in sorted(options['scales']):
+            started = time.perf_counter()
+            ids = seed_records(scale - seeded, seed=options['seed'] + seeded, unique_files=options['unique_files'])
+            if self.record_id is None:
+                self.record_id = ids[0]
+            seeded = scale
+            # Indexing and previews of the seeded records run in the background.
+            workers.wait_idle()
+            self.stderr.write(f'Seeded {scale} records in {time.perf_counter() - started:.1f}s')
+
+            results[str(scale)] = {}
+            for name in steps:
+                result = self._measure(client, getattr(self, f'_step_{name}'), options['repeat'])
+                results[str(scale)][name] = result
+                self.stdout.write(
+                    f"{scale:>8}  {name:<12} {result['median_ms']:>10.2f} {result['p95_ms']:>9.2f} "
+                    f"{result['peak_kb']:>9} {result['queries']:>8}"
+                )
+        return results
+
+    def _measure(self, client, step, repeat):
+        """Latency over repeat runs, then one traced run for peak memory and query count"""
+
+        step(client)
+        workers.wait_idle()
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            step(client)
+            samples.append((time.perf_counter() - started) * 1000)
+            workers.wait_idle()
+
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                step(client)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        workers.wait_idle()
+
+        samples.sort()
+        return {
+            'median_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 3),
+            'peak_kb': peak // 1024,
+            'queries': len(queries),
+        }
+
+    def _get(self, client, path, params=None):
+        response = client.get(path, params or {})
+        if response.status_code != 200:
+            raise CommandError(f'GET {path} answered {response.status_code}.')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+
+    def _step_list(self, client):
+        invalidate()
+        self._get(client, '/')
+
+    def _step_list_cached(self, client):
+        self._get(client, '/')
+
+    def _step_search(self, client):
+        invalidate()
+        self._get(client, '/', {'search': 'budget report'})
+
+    def _step_filter(self, client):
+        invalidate()
+        self._get(client, '/', {'file_type': 'PDF', 'sort_by': 'description_asc'})
+
+    def _step_api_list(self, client):
+        invalidate()
+        self._get(client, '/api/records/', {'page_size': 100})
+
+    def _step_upload(self, client):
+        upload = SimpleUploadedFile('benchmark.pdf', make_pdf(self.rng, UPLOAD_SIZE), 'application/pdf')
+        response = client.post('/upload/', {'description': 'Benchmark upload', 'file': upload})
+        if response.status_code != 302:
+            raise CommandError(f'POST /upload/ answered {response.status_code}.')
+
+    def _step_download(self, client):
+        self._get(client, f'/download/{self.record_id}/')
+
+    def _step_export(self, client):
+        self._get(client, '/export/')
+
+    def _step_export_csv(self, client):
+        self._get(client, '/export/csv/')
+
+    def _environment(self):
+        return {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        }
+
+    def _options(self, options):
+        return {name: options[name] for name in ('scales', 'repeat', 'seed', 'unique_files')}
+
+    def _write(self, path, report):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    def _compare(self, report, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        for key in ('environment', 'options'):
+            if baseline.get(key) != report[key]:
+                self.stderr.write(self.style.WARNING(
+                    f'Baseline {key} differs ({baseline.get(key)} vs {report[key]}); results may not be comparable.'
+                ))
+
+        threshold = options['threshold']
+        regressions = []
+        for scale, steps in report['results'].items():
+            for name, result in steps.items():
+                base = baseline.get('results', {}).get(scale, {}).get(name)
+                if base is None:
+                    # A step nothing can be compared with must not pass silently.
+                    regressions.append(f'{scale} {name}: not in the baseline (re-record it, or pass --no-compare)')
+                    continue
+                if (result['median_ms'] > base['median_ms'] * (1 + threshold)
+                        and result['median_ms'] - base['median_ms'] > options['min_ms']):
+                    regressions.append(f"{scale} {name}: {base['median_ms']:.2f} -> {result['median_ms']:.2f} ms")
+                if (result['peak_kb'] > base['peak_kb'] * (1 + threshold)
+                        and result['peak_kb'] - base['peak_kb'] > MIN_MEMORY_DELTA_KB):
+                    regressions.append(f"{scale} {name}: {base['peak_kb']} -> {result['peak_kb']} KB peak memory")
+                if result['queries'] > base['queries']:
+                    regressions.append(f"{scale} {name}: {base['queries']} -> {result['queries']} queries")
+
+        if regressions:
+            raise CommandError('Regressed against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {threshold:.0%} against the baseline.'))
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from records.downloads import BACKENDS, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Measure the Django-side cost of full, ranged and conditional downloads for each download backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50, help='Test file size in MB')
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--range-size', type=int, default=1, help='Bytes per ranged request, in MB')
+        parser.add_argument('--backend', choices=sorted(BACKENDS), action='append')
+
+    def handle(self, *args, **options):
+        size = options['size'] * 1024 * 1024
+        range_size = min(options['range_size'] * 1024 * 1024, size)
+        factory = RequestFactory()
+
+        # Inside MEDIA_ROOT so X-Accel-Redirect has an internal location for it
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', dir=settings.MEDIA_ROOT) as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(options['size']):
+                f.write(chunk)
+            f.flush()
+
+            response = get_backend('python').serve(factory.get('/'), f.name, 'benchmark.pdf')
+            etag = response['ETag']
+            response.close()
+            start = (size - range_size) // 2
+            cases = [
+                ('full', {}),
+                ('range', {'HTTP_RANGE': f'bytes={start}-{start + range_size - 1}'}),
+                ('304', {'HTTP_IF_NONE_MATCH': etag}),
+            ]
+
+            self.stdout.write(f"{'backend':<18} {'case':<6} {'status':>6} {'req/s':>10} {'MB/s':>10} {'ms/req':>9}")
+            for name in options['backend'] or sorted(BACKENDS):
+                backend = get_backend(name)
+                for case, headers in cases:
+                    status, sent, elapsed = self._run(backend, factory, f.name, headers, options['requests'])
+                    self.stdout.write(
+                        f"{name:<18} {case:<6} {status:>6} {options['requests'] / elapsed:>10.1f} "
+                        f"{sent / elapsed / (1024 * 1024):>10.1f} {elapsed / options['requests'] * 1000:>9.2f}"
+                    )
+
+    def _run(self, backend, factory, path, headers, count):
+        sent = 0
+        status = None
+        started = time.perf_counter()
+        for _ in range(count):
+            response = backend.serve(factory.get('/', **headers), path, 'benchmark.pdf')
+            status = response.status_code
+            for chunk in (response if response.streaming else [response.content]):
+                sent += len(chunk)
+            response.close()
+        return status, sent, max(time.perf_counter() - started, 1e-9)
@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from records.filters import filter_records, get_filters
+from records.models import FileRecord
+from records.search import fts_enabled
+
+
+SYLLABLES = ['ka', 'ri', 'to', 'men', 'sa', 'lo', 'vi', 'dra', 'pe', 'nu', 'gor', 'shi', 'ta', 'bel', 'mo']
+
+
+class Command(BaseCommand):
+    help = 'Compare icontains and full-text search latency at several archive sizes (seeded rows are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('Full-text search requires SQLite with FTS5.')
+
+        rng = random.Random(42)
+        vocabulary = sorted({
+            ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            for _ in range(5000)
+        })
+        first, last = vocabulary[0], vocabulary[-1]
+        queries = [first, last, first[:3], f'{first} {last}']
+
+        self.stdout.write(f"{'rows':>10}  {'query':<24} {'icontains ms':>13} {'fts ms':>9} {'speedup':>8}")
+        with transaction.atomic():
+            seeded = 0
+            for target in sorted(options['rows']):
+                self._seed(rng, vocabulary, target - seeded, options['batch_size'])
+                seeded = target
+                for query in queries:
+                    legacy = self._time(lambda: self._legacy_page(query), options['repeat'])
+                    fts = self._time(lambda: self._fts_page(query), options['repeat'])
+                    self.stdout.write(
+                        f"{target:>10}  {query:<24} {legacy:>13.2f} {fts:>9.2f} {legacy / max(fts, 1e-6):>7.1f}x"
+                    )
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, vocabulary, count, batch_size):
+        while count > 0:
+            size = min(batch_size, count)
+            FileRecord.objects.bulk_create([
+                FileRecord(
+                    description=' '.join(rng.choices(vocabulary, k=rng.randint(4, 12))),
+                    letter_reference_number=f"REF/{rng.randint(1, 99999):05d}",
+                    file='uploads/benchmark.pdf',
+                    file_type='PDF',
+                )
+                for _ in range(size)
+            ], batch_size=size)
+            count -= size
+
+    def _legacy_page(self, query):
+        records = FileRecord.objects.filter(description__icontains=query).order_by('-upload_datetime')
+        return records.count(), list(records[:10])
+
+    def _fts_page(self, query):
+        records = filter_records(get_filters({'search': query}))
+        return records.count(), list(records[:10])
+
+    def _time(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,114 @@
+import io
+import shutil
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import include, path, re_path
+from django.views.static import serve
+
+
+WHITENOISE = 'whitenoise.middleware.WhiteNoiseMiddleware'
+ASSETS = ['admin/css/base.css', 'admin/js/vendor/jquery/jquery.js', 'admin/img/search.svg']
+ENCODINGS = {'identity': '', 'gzip': 'gzip', 'br': 'br, gzip'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Collect static files into a throwaway STATIC_ROOT and compare requests per second '
+        'and bytes sent for static assets served by django.views.static.serve (before) and '
+        'by WhiteNoise with hashed, precompressed files (after).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per asset and encoding')
+        parser.add_argument('--asset', action='append', help='Static paths to request (default: a few admin files)')
+
+    def handle(self, *args, **options):
+        if WHITENOISE not in settings.MIDDLEWARE:
+            raise CommandError(f'{WHITENOISE} is not in MIDDLEWARE.')
+        assets = options['asset'] or ASSETS
+        root = tempfile.mkdtemp(prefix='records-static-')
+        try:
+            with override_settings(
+                STATIC_ROOT=root,
+                DEBUG=False,
+                ALLOWED_HOSTS=['testserver'],
+                RECORDS_SLOW_REQUEST_SECONDS=None,
+            ):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                self._compare(assets, root, options['requests'])
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def _compare(self, assets, root, count):
+        # What config/urls.py used to do: every asset goes through the full
+        # middleware stack and URL resolution to the static serve view.
+        before_urls = type('StaticServeUrls', (), {'urlpatterns': [
+            re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), serve, {'document_root': root}),
+            path('', include('records.urls')),
+        ]})
+        with override_settings(MIDDLEWARE=[name for name in settings.MIDDLEWARE if name != WHITENOISE]):
+            before = WSGIHandler()
+        after = WSGIHandler()
+
+        self.stdout.write(
+            f"{'asset':<36} {'encoding':<9} {'before req/s':>13} {'after req/s':>12} {'speedup':>8} "
+            f"{'before KB':>10} {'after KB':>9}"
+        )
+        for asset in assets:
+            hashed = staticfiles_storage.url(asset)
+            for encoding, accept in ENCODINGS.items():
+                with override_settings(ROOT_URLCONF=before_urls):
+                    before_rate, before_size, _ = self._run(before, settings.STATIC_URL + asset, accept, count)
+                after_rate, after_size, headers = self._run(after, hashed, accept, count)
+                self.stdout.write(
+                    f'{asset[-36:]:<36} {encoding:<9} {before_rate:>13.0f} {after_rate:>12.0f} '
+                    f'{after_rate / before_rate:>7.1f}x {before_size / 1024:>10.1f} {after_size / 1024:>9.1f}'
+                )
+            self.stdout.write(f"  {hashed}: Cache-Control {headers.get('Cache-Control')!r}")
+
+    def _run(self, handler, url, accept, count):
+        """(requests per second, body bytes, response headers) for count GETs of url"""
+
+        status, size, headers = self._get(handler, url, accept)
+        if not status.startswith('200'):
+            raise CommandError(f'GET {url} answered {status}.')
+        started = time.perf_counter()
+        for _ in range(count):
+            self._get(handler, url, accept)
+        return count / (time.perf_counter() - started), size, headers
+
+    def _get(self, handler, url, accept):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': url,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_ACCEPT_ENCODING': accept,
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+        }
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = status
+            started['headers'] = dict(headers)
+
+        response = handler(environ, start_response)
+        size = 0
+        try:
+            for chunk in response:
+                size += len(chunk)
+        finally:
+            response.close()
+        return started['status'], size, started['headers']
@@ -0,0 +1,76 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from records.models import FileRecord
+from records.previews import PREVIEW_TYPES, preview_format, previews_enabled, set_preview
+from records.thumbnails import build_preview
+from records.tiers import locate, with_local_copy
+
+
+class Command(BaseCommand):
+    help = 'Build missing thumbnails for Image and PDF records using all CPU cores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--force', action='store_true', help='Also rebuild records that already have a preview')
+
+    def handle(self, *args, **options):
+        if not previews_enabled():
+            raise CommandError('Previews require Pillow.')
+
+        records = FileRecord.objects.filter(file_type__in=PREVIEW_TYPES).exclude(file='')
+        if not options['force']:
+            records = records.filter(preview='')
+        records = records.values_list('id', 'file', 'file_type', 'content_hash').order_by('id')
+
+        started = time.perf_counter()
+        built = failed = missing = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            batch = []
+            for record_id, name, file_type, content_hash in records.iterator(chunk_size=options['batch_size']):
+                path = FileRecord.file.field.storage.path(name)
+                if locate(path) is None:
+                    missing += 1
+                    continue
+                batch.append((record_id, path, file_type, content_hash))
+                if len(batch) >= options['batch_size']:
+                    done, errors = self._build_batch(executor, batch)
+                    built += done
+                    failed += errors
+                    batch = []
+            if batch:
+                done, errors = self._build_batch(executor, batch)
+                built += done
+                failed += errors
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {built} previews, {failed} without preview, {missing} missing in {elapsed:.1f}s.'
+        ))
+
+    def _build_batch(self, executor, batch):
+        fmt = preview_format()
+        # Cold files are decompressed into a temporary file by the worker.
+        names = executor.map(
+            with_local_copy,
+            [build_preview] * len(batch),
+            [path for _, path, _, _ in batch],
+            [file_type for _, _, file_type, _ in batch],
+            [settings.MEDIA_ROOT] * len(batch),
+            [settings.RECORDS_PREVIEW_SIZE] * len(batch),
+            [fmt] * len(batch),
+            [content_hash for _, _, _, content_hash in batch],
+        )
+        built = failed = 0
+        for (record_id, _, _, _), name in zip(batch, names):
+            set_preview(record_id, name)
+            if name:
+                built += 1
+            else:
+                failed += 1
+        return built, failed
@@ -0,0 +1,38 @@
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from records.ingest import DEFAULT_BATCH_SIZE, ingest, path_sources
+
+
+class Command(BaseCommand):
+    help = 'Create a record for every file in a directory or ZIP archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Directory (searched recursively) or ZIP archive')
+        parser.add_argument('--description', default='', help='Description for every record; defaults to each file name')
+        parser.add_argument('--file-date', type=datetime.date.fromisoformat, help='File date as YYYY-MM-DD')
+        parser.add_argument('--letter-reference', default=None)
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+
+        with path_sources(path) as sources:
+            report = ingest(
+                sources,
+                description=options['description'],
+                file_date=options['file_date'],
+                letter_reference_number=options['letter_reference'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+            )
+
+        for result in report.results:
+            if not result.ok:
+                self.stderr.write(f'{result.name}: {result.error}')
+        self.stdout.write(self.style.SUCCESS(report.summary()))
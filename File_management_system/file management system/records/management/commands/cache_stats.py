@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from records.cache import generation, invalidate
+
+
+class Command(BaseCommand):
+    help = 'Show the generation of the records list cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Invalidate every cached result')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"generation {generation()}; hits and misses are counted per process, "
+            f"as records_cache_hits_total and records_cache_misses_total at /metrics/"
+        )
+        if options['clear']:
+            invalidate()
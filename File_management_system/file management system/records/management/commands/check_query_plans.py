@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from records.query_plans import check_plans
+from records.search import fts_enabled
+
+
+class Command(BaseCommand):
+    help = 'Fail if list, cursor, count or export queries on records do a full scan or an unindexed sort'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('Query plan checks use SQLite EXPLAIN QUERY PLAN.')
+
+        failures = []
+        checked = 0
+        for label, plan, problems in check_plans():
+            if options['verbose_plans']:
+                self.stdout.write(f'{label}:\n{plan}\n')
+            if problems:
+                indented = plan.replace('\n', '\n    ')
+                failures.append(f"{label}: {', '.join(problems)}\n    {indented}")
+            checked += 1
+
+        if failures:
+            raise CommandError('Query plan regressions:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'All {checked} record queries use indexes.'))
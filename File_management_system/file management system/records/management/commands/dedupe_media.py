@@ -0,0 +1,113 @@
+import os
+import shutil
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from records.blobs import retain_file
+from records.changes import journal
+from records.models import ChangeEvent, FileRecord, FileTier
+from records.storage import BLOB_DIR, blob_name, upload_storage
+from records.tiers import SUFFIXES, hash_stored, locate
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads into the content-addressed blob store, keeping one copy per distinct file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        legacy = (
+            FileRecord.objects.exclude(file='').exclude(file__startswith=f'{BLOB_DIR}/')
+            .values_list('id', 'file').order_by('id')
+        )
+
+        totals = defaultdict(int)
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            batch = []
+            for record_id, name in legacy.iterator(chunk_size=options['batch_size']):
+                batch.append((record_id, name))
+                if len(batch) >= options['batch_size']:
+                    self._dedupe_batch(executor, batch, options['dry_run'], totals)
+                    batch = []
+            if batch:
+                self._dedupe_batch(executor, batch, options['dry_run'], totals)
+
+        elapsed = time.perf_counter() - started
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['records']} records ({totals['missing']} missing files) in {elapsed:.1f}s. "
+            f"{verb} {totals['duplicates']} duplicate files, {totals['bytes']} bytes."
+        ))
+
+    def _dedupe_batch(self, executor, batch, dry_run, totals):
+        # (path on disk, codec) per record: tier_files may have compressed the file.
+        located = {}
+        for record_id, name in batch:
+            found = locate(upload_storage.path(name))
+            if found is not None:
+                located[record_id] = found
+            else:
+                totals['missing'] += 1
+        totals['records'] += len(batch)
+
+        by_path = sorted(set(located.values()))
+        hashes = dict(zip(by_path, executor.map(hash_stored, *zip(*by_path), chunksize=16))) if by_path else {}
+
+        groups = defaultdict(list)
+        for record_id, found in located.items():
+            groups[hashes[found]].append((record_id, found))
+
+        names = dict(batch)
+        for content_hash, members in groups.items():
+            name = blob_name(content_hash)
+            blob_path = upload_storage.path(name)
+            sources = sorted({found for _, found in members})
+            blob_exists = locate(blob_path) is not None
+            duplicates = sources if blob_exists else sources[1:]
+            totals['duplicates'] += len(duplicates)
+            totals['bytes'] += sum(os.path.getsize(path) for path, _ in duplicates)
+            if dry_run:
+                continue
+
+            if not blob_exists:
+                # Link (or copy) rather than move so the records stay valid
+                # until the database points at the blob. A cold file becomes
+                # a cold blob.
+                source, codec = sources[0]
+                target = blob_path + (SUFFIXES[codec] if codec else '')
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+
+            with transaction.atomic():
+                for record_id, (path, codec) in members:
+                    FileRecord.objects.filter(pk=record_id, original_name='').update(
+                        original_name=os.path.basename(names[record_id])
+                    )
+                record_ids = [record_id for record_id, _ in members]
+                FileRecord.objects.filter(pk__in=record_ids).update(file=name, content_hash=content_hash)
+                if not blob_exists and sources[0][1]:
+                    tiered = next(names[record_id] for record_id, found in members if found == sources[0])
+                    FileTier.objects.filter(name=name).delete()
+                    FileTier.objects.filter(name=tiered).update(name=name)
+                # content_hash is part of the API, so sync clients need the change.
+                journal(ChangeEvent.ACTION_UPDATE, record_ids)
+                retain_file(name, count=len(members))
+                transaction.on_commit(lambda sources=sources: self._remove(sources))
+
+    def _remove(self, sources):
+        for path, _ in sources:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
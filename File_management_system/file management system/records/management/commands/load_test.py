@@ -0,0 +1,159 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold many slow downloads or uploads open against a running server and measure how '
+        'quickly a fast probe request is still answered. Run it against sync gunicorn and '
+        'against the ASGI server to compare how many slow clients each sustains.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Base URL of the running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--mode', choices=['download', 'upload'], default='download')
+        parser.add_argument('--record', type=int, help='Record id to download (download mode)')
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16, 64])
+        parser.add_argument('--rate', type=int, default=64, help='Bytes per second per slow client, in KB')
+        parser.add_argument('--upload-size', type=int, default=1024, help='Upload size in KB (upload mode)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to hold the slow clients')
+        parser.add_argument('--probe-path', default='/api/records/?page_size=1&fields=id')
+        parser.add_argument('--timeout', type=float, default=5.0, help='Probe timeout in seconds')
+        parser.add_argument('--user', default='MESGCC')
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'download' and options['record'] is None:
+            raise CommandError('--record is required in download mode.')
+        parts = urlsplit(options['url'])
+        if parts.scheme != 'http':
+            raise CommandError('Only plain http:// URLs are supported.')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.options = options
+        self.cookies = self._session_cookies(options['user'])
+
+        self.stdout.write(
+            f"{'clients':>8} {'probes':>7} {'timeouts':>9} {'p50 ms':>9} {'p95 ms':>9} {'slow ok':>8} {'slow err':>9}"
+        )
+        for clients in options['clients']:
+            result = asyncio.run(self._round(clients))
+            self.stdout.write(
+                f"{clients:>8} {result['probes']:>7} {result['timeouts']:>9} {result['p50']:>9.1f} "
+                f"{result['p95']:>9.1f} {result['slow_ok']:>8} {result['slow_errors']:>9}"
+            )
+
+    def _session_cookies(self, username):
+        try:
+            user = get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {username} does not exist.')
+        session = import_string(settings.SESSION_ENGINE + '.SessionStore')()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.csrf_token = get_random_string(32)
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={self.csrf_token}'
+
+    async def _round(self, clients):
+        deadline = time.monotonic() + self.options['duration']
+        slow = [asyncio.create_task(self._slow_client(deadline)) for _ in range(clients)]
+        # Let the slow clients occupy the server before probing.
+        await asyncio.sleep(min(1.0, self.options['duration'] / 4))
+
+        latencies = []
+        timeouts = 0
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._probe(), self.options['timeout'])
+                latencies.append((time.monotonic() - started) * 1000)
+            except (asyncio.TimeoutError, OSError):
+                timeouts += 1
+            await asyncio.sleep(0.2)
+
+        outcomes = await asyncio.gather(*slow, return_exceptions=True)
+        latencies.sort()
+        return {
+            'probes': len(latencies) + timeouts,
+            'timeouts': timeouts,
+            'p50': statistics.median(latencies) if latencies else float('nan'),
+            'p95': latencies[int(len(latencies) * 0.95)] if latencies else float('nan'),
+            'slow_ok': sum(1 for outcome in outcomes if outcome is True),
+            'slow_errors': sum(1 for outcome in outcomes if outcome is not True),
+        }
+
+    def _headers(self, method, path, extra=''):
+        return (
+            f'{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+            f'Cookie: {self.cookies}\r\nConnection: close\r\n{extra}\r\n'
+        ).encode('latin-1')
+
+    async def _probe(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(self._headers('GET', self.options['probe_path']))
+            await writer.drain()
+            status = await reader.readline()
+            if not status.startswith(b'HTTP/1.1 2') and not status.startswith(b'HTTP/1.0 2'):
+                raise OSError(f'Probe failed: {status!r}')
+            await reader.read()
+        finally:
+            writer.close()
+
+    async def _slow_client(self, deadline):
+        """Trickle a download or upload at --rate until the deadline; True if the server kept up"""
+
+        rate = self.options['rate'] * 1024
+        step = max(rate // 10, 1)
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError:
+            return False
+        try:
+            if self.options['mode'] == 'download':
+                writer.write(self._headers('GET', f"/download/{self.options['record']}/"))
+                await writer.drain()
+                while time.monotonic() < deadline:
+                    if not await reader.read(step):
+                        break
+                    await asyncio.sleep(0.1)
+                return True
+
+            boundary = get_random_string(16)
+            size = self.options['upload_size'] * 1024
+            head = (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="description"\r\n\r\nload test\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load.bin"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'
+            ).encode('latin-1')
+            tail = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+            writer.write(self._headers('POST', '/upload/', (
+                f'Content-Type: multipart/form-data; boundary={boundary}\r\n'
+                f'Content-Length: {len(head) + size + len(tail)}\r\n'
+                f'X-CSRFToken: {self.csrf_token}\r\nReferer: http://{self.host}:{self.port}/\r\n'
+            )) + head)
+            sent = 0
+            while sent < size:
+                chunk = min(step, size - sent)
+                writer.write(b'x' * chunk)
+                await writer.drain()
+                sent += chunk
+                if time.monotonic() < deadline:
+                    await asyncio.sleep(0.1)
+            writer.write(tail)
+            await writer.drain()
+            status = await reader.readline()
+            return b' 302 ' in status or b' 200 ' in status
+        except OSError:
+            return False
+        finally:
+            writer.close()
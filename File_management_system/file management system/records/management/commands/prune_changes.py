@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from records.models import ChangeEvent
+
+
+class Command(BaseCommand):
+    help = 'Delete change journal events older than --days (clients further behind must resync)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        newest = ChangeEvent.objects.order_by('-seq').values_list('seq', flat=True).first()
+        # Keep the newest event so the sequence never restarts from 1.
+        deleted, _ = ChangeEvent.objects.filter(changed_datetime__lt=cutoff).exclude(seq=newest).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change events.'))
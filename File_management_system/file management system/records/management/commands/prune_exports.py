@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from records.jobs import abandon_dead_jobs, prune_artifacts
+
+
+class Command(BaseCommand):
+    help = (
+        'Fail export jobs whose worker died (no heartbeat for EXPORT_JOB_TIMEOUT seconds) and delete '
+        'bundles under EXPORT_ROOT that no pending, running or finished job uses'
+    )
+
+    def handle(self, *args, **options):
+        abandoned = abandon_dead_jobs()
+        removed = prune_artifacts()
+        self.stdout.write(self.style.SUCCESS(f'Failed {abandoned} dead export jobs and deleted {removed} files.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from records.uploads import expire_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete chunked uploads left unfinished for CHUNKED_UPLOAD_SESSION_TTL seconds, with their partial '
+        'files, and partial files under UPLOAD_SESSION_ROOT that no unfinished upload uses'
+    )
+
+    def handle(self, *args, **options):
+        sessions, files = expire_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {sessions} abandoned uploads and {files} partial files.'))
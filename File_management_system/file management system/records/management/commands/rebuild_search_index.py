@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from records.models import FileRecord
+from records.search import fts_enabled, install_fts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over record descriptions and reference numbers'
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError(f'Full-text search index is not supported on {connection.vendor}.')
+
+        install_fts(rebuild=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Search index rebuilt for {FileRecord.objects.count()} records.'
+        ))
@@ -0,0 +1,295 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from records.models import Blob, FileRecord
+from records.previews import preview_path
+from records.storage import BLOB_DIR, blob_hash, upload_storage
+from records.thumbnails import PREVIEW_DIR
+from records.tiers import SUFFIXES, locate
+
+
+# Directory under MEDIA_ROOT -> FileRecord column whose values name its files
+ROOTS = {'uploads': 'file', BLOB_DIR: 'file', PREVIEW_DIR: 'preview'}
+# Files being written; DedupStorage moves them into place when complete.
+SKIP_DIRS = {f'{BLOB_DIR}/tmp'}
+TOTALS = [
+    'files', 'orphans', 'orphan_bytes', 'reclaimed', 'reclaimed_bytes',
+    'records', 'dangling_files', 'dangling_previews', 'errors',
+]
+
+
+def list_directory(directory):
+    """Sorted (name, is_dir) entries of a directory under MEDIA_ROOT; empty if it does not exist"""
+
+    try:
+        with os.scandir(os.path.join(settings.MEDIA_ROOT, directory)) as entries:
+            return sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries)
+    except FileNotFoundError:
+        return []
+
+
+def _uncompressed_name(name):
+    for suffix in SUFFIXES.values():
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def find_orphans(names, column):
+    """(name, size, mtime) of the files in names that no FileRecord refers to in column.
+
+    A compressed copy made by tier_files belongs to the name without its suffix.
+    """
+
+    stored = {name: _uncompressed_name(name) for name in names}
+    try:
+        known = set(FileRecord.objects.filter(**{f'{column}__in': set(stored.values())}).values_list(column, flat=True))
+    finally:
+        connection.close()
+    orphans = []
+    for name in names:
+        if stored[name] in known:
+            continue
+        try:
+            stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+        except FileNotFoundError:
+            continue
+        orphans.append((name, stat.st_size, stat.st_mtime))
+    return orphans
+
+
+def find_dangling(rows):
+    """(record id, kind, name) for every file or preview in rows that is missing on disk"""
+
+    dangling = []
+    for pk, file, preview in rows:
+        if file and locate(upload_storage.path(file)) is None:
+            dangling.append((pk, 'dangling_file', file))
+        if preview and not os.path.exists(preview_path(preview)):
+            dangling.append((pk, 'dangling_preview', preview))
+    return dangling
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the files under MEDIA_ROOT with FileRecord: report files no record uses (orphans) '
+        'and records whose file or preview is missing (dangling), optionally deleting orphans. '
+        'Progress is checkpointed, so an interrupted or --max-seconds run continues where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        state_dir = os.path.join(settings.BASE_DIR, 'scan_storage')
+        parser.add_argument('--root', choices=sorted(ROOTS), action='append', help='Only scan these directories')
+        parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) + 4))
+        parser.add_argument('--batch-size', type=int, default=500, help='Names per database query')
+        parser.add_argument('--reclaim', action='store_true', help='Delete orphans (and their Blob rows)')
+        parser.add_argument('--min-age', type=float, default=24.0,
+                            help='Only reclaim orphans not modified for this many hours')
+        parser.add_argument('--max-seconds', type=float, help='Stop after this long; the next run resumes')
+        parser.add_argument('--checkpoint', default=os.path.join(state_dir, 'checkpoint.json'))
+        parser.add_argument('--report', default=os.path.join(state_dir, 'report.ndjson'),
+                            help='Every orphan and dangling record, one JSON object per line')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.deadline = time.monotonic() + options['max_seconds'] if options['max_seconds'] else None
+        roots = sorted(options['root'] or ROOTS)
+        self.state = self._load_checkpoint(roots)
+        started = time.perf_counter()
+
+        os.makedirs(os.path.dirname(os.path.abspath(options['report'])), exist_ok=True)
+        with open(options['report'], 'a' if self.state['resumed'] else 'w') as self.report, \
+                ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='scan') as self.executor:
+            if self.state['phase'] == 'files':
+                done = self._scan_files(roots)
+                if done:
+                    self.state['phase'] = 'records'
+                    self._save_checkpoint()
+            if self.state['phase'] == 'records':
+                done = self._scan_records()
+
+        totals = self.state['totals']
+        summary = (
+            f"{totals['files']} files, {totals['orphans']} orphans ({totals['orphan_bytes']} bytes), "
+            f"{totals['reclaimed']} reclaimed ({totals['reclaimed_bytes']} bytes), {totals['records']} records, "
+            f"{totals['dangling_files']} missing files, {totals['dangling_previews']} missing previews"
+        )
+        elapsed = time.perf_counter() - started
+        if not done:
+            self.stdout.write(self.style.WARNING(
+                f'Stopped after {elapsed:.1f}s; run again to continue. So far: {summary}.'
+            ))
+            return
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        style = self.style.WARNING if totals['errors'] else self.style.SUCCESS
+        self.stdout.write(style(f"Scanned in {elapsed:.1f}s: {summary}; {totals['errors']} errors. "
+                                f"Details in {options['report']}."))
+
+    def _load_checkpoint(self, roots):
+        path = self.options['checkpoint']
+        if os.path.exists(path) and not self.options['restart']:
+            with open(path) as f:
+                state = json.load(f)
+            if state['roots'] != roots:
+                raise CommandError(f"{path} is for --root {' '.join(state['roots'])}; pass --restart to start over.")
+            state['resumed'] = True
+            self.stderr.write(f'Resuming from {path}.')
+            return state
+        return {
+            'roots': roots, 'phase': 'files', 'position': None, 'last_pk': 0,
+            'totals': dict.fromkeys(TOTALS, 0), 'resumed': False,
+        }
+
+    def _save_checkpoint(self):
+        path = self.options['checkpoint']
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({key: value for key, value in self.state.items() if key != 'resumed'}, f)
+        os.replace(path + '.tmp', path)
+        self.report.flush()
+
+    def _out_of_time(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _walk(self, directory, listing, position):
+        """Names of the files under directory in sorted path order, skipping those up to position.
+
+        Listings of subdirectories are requested from the pool as soon as
+        their parent is read, so many directories are scanned at once.
+        """
+
+        parts = tuple(directory.split('/'))
+        entries = []
+        for name, is_dir in listing.result():
+            path = parts + (name,)
+            if position and (path <= position if not is_dir else path < position[:len(path)]):
+                continue
+            if is_dir:
+                subdirectory = f'{directory}/{name}'
+                if subdirectory not in SKIP_DIRS:
+                    entries.append((subdirectory, self.executor.submit(list_directory, subdirectory)))
+            else:
+                entries.append((f'{directory}/{name}', None))
+        for name, sublisting in entries:
+            if sublisting is None:
+                yield name
+            else:
+                yield from self._walk(name, sublisting, position)
+
+    def _scan_files(self, roots):
+        position = tuple(self.state['position'] or ())
+        window = self.options['workers'] * 2
+        pending = []
+        for root in roots:
+            if position and (root,) < position[:1]:
+                continue
+            column = ROOTS[root]
+            batch = []
+            for name in self._walk(root, self.executor.submit(list_directory, root), position):
+                batch.append(name)
+                if len(batch) >= self.options['batch_size']:
+                    pending.append((batch, self.executor.submit(find_orphans, batch, column)))
+                    batch = []
+                    while len(pending) >= window:
+                        self._orphans_found(*pending.pop(0))
+                    if self._out_of_time():
+                        break
+            if batch:
+                pending.append((batch, self.executor.submit(find_orphans, batch, column)))
+            if self._out_of_time():
+                break
+        for batch, future in pending:
+            self._orphans_found(batch, future)
+        return not self._out_of_time()
+
+    def _orphans_found(self, batch, future):
+        orphans = future.result()
+        totals = self.state['totals']
+        totals['files'] += len(batch)
+        totals['orphans'] += len(orphans)
+        totals['orphan_bytes'] += sum(size for _, size, _ in orphans)
+
+        reclaimed = set()
+        if self.options['reclaim']:
+            cutoff = time.time() - self.options['min_age'] * 3600
+            reclaimed = self._reclaim([(name, size) for name, size, mtime in orphans if mtime < cutoff])
+        for name, size, mtime in orphans:
+            self._write_report({'kind': 'orphan', 'name': name, 'size': size, 'reclaimed': name in reclaimed})
+        self.state['position'] = batch[-1].split('/')
+        self._save_checkpoint()
+
+    def _reclaim(self, orphans):
+        """Delete orphans that are still unreferenced, with their Blob rows; returns the names removed"""
+
+        if not orphans:
+            return set()
+        names = list({_uncompressed_name(name) for name, _ in orphans})
+        hashes = [content_hash for content_hash in map(blob_hash, names) if content_hash]
+        with transaction.atomic():
+            # Write first, as retain_file does: the delete takes SQLite's write
+            # lock, so no upload can start referencing these blobs meanwhile.
+            if hashes:
+                Blob.objects.filter(hash__in=hashes).exclude(
+                    hash__in=FileRecord.objects.filter(content_hash__in=hashes).values('content_hash')
+                ).delete()
+            used = set(FileRecord.objects.filter(file__in=names).values_list('file', flat=True))
+            used.update(FileRecord.objects.filter(preview__in=names).values_list('preview', flat=True))
+
+            reclaimed = set()
+            totals = self.state['totals']
+            for name, size in orphans:
+                if _uncompressed_name(name) in used:
+                    continue
+                try:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, name))
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    totals['errors'] += 1
+                    self._write_report({'kind': 'error', 'name': name, 'error': str(e)})
+                    continue
+                reclaimed.add(name)
+                totals['reclaimed'] += 1
+                totals['reclaimed_bytes'] += size
+        return reclaimed
+
+    def _scan_records(self):
+        window = self.options['workers'] * 2
+        last_pk = self.state['last_pk']
+        pending = []
+        while not self._out_of_time():
+            rows = list(
+                FileRecord.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'file', 'preview')[:self.options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            pending.append((rows, self.executor.submit(find_dangling, rows)))
+            while len(pending) >= window:
+                self._dangling_found(*pending.pop(0))
+        for rows, future in pending:
+            self._dangling_found(rows, future)
+        return not self._out_of_time()
+
+    def _dangling_found(self, rows, future):
+        totals = self.state['totals']
+        totals['records'] += len(rows)
+        for pk, kind, name in future.result():
+            totals[f'{kind}s'] += 1
+            self._write_report({'kind': kind, 'record_id': pk, 'name': name})
+        self.state['last_pk'] = rows[-1][0]
+        self._save_checkpoint()
+
+    def _write_report(self, entry):
+        self.report.write(json.dumps(entry) + '\n')
+        if self.options['verbosity'] >= 2:
+            self.stdout.write(json.dumps(entry))
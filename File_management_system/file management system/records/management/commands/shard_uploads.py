@@ -0,0 +1,117 @@
+import os
+import shutil
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from records.blobs import remove_path
+from records.cache import invalidate_on_commit
+from records.models import FileRecord, FileTier
+from records.storage import FLAT_UPLOAD_NAME_RE, sharded_name, upload_storage
+from records.tiers import SUFFIXES, locate
+
+
+def link_file(source, destination):
+    """Make destination another name for source (a hard link, or a copy across file systems)"""
+
+    if os.path.exists(destination):
+        # Linked by an interrupted run; _destination only reuses names that are source.
+        return
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class Command(BaseCommand):
+    help = (
+        'Move files stored directly in media/uploads/ into the RECORDS_UPLOAD_LAYOUT subdirectories '
+        'while the site keeps running. Safe to interrupt and run again: it picks up the records '
+        'that still point at the flat directory.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) + 4))
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Show where files would go without moving them')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        flat = FileRecord.objects.filter(file__regex=FLAT_UPLOAD_NAME_RE).order_by('pk')
+        totals = defaultdict(int)
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='shard') as executor:
+            while True:
+                rows = list(flat.filter(pk__gt=last_pk).values_list('pk', 'file', 'upload_datetime')[:options['batch_size']])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                self._move_batch(executor, rows, options['dry_run'], totals)
+
+        elapsed = time.perf_counter() - started
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['files']} files ({totals['records']} records) in {elapsed:.1f}s; "
+            f"{totals['missing']} missing."
+        ))
+
+    def _destination(self, name, uploaded, source):
+        """Storage name the flat file should move to; the same on every run so a rerun finds its own links"""
+
+        new = sharded_name(name, uploaded)
+        existing = locate(upload_storage.path(new))
+        if existing and os.path.samefile(existing[0], source):
+            return new
+        max_length = FileRecord._meta.get_field('file').max_length
+        if existing or len(new) > max_length:
+            # FileSystemStorage's, not DedupStorage's, which assumes names never collide.
+            new = FileSystemStorage.get_available_name(upload_storage, new, max_length)
+        return new
+
+    def _move_batch(self, executor, rows, dry_run, totals):
+        # Records may share a file, so move each name once, dated by its first upload.
+        uploads = {}
+        for pk, name, uploaded in rows:
+            uploads.setdefault(name, uploaded)
+
+        moves = {}
+        # A file tier_files compressed moves as its compressed copy.
+        suffixes = {}
+        for name, uploaded in uploads.items():
+            located = locate(upload_storage.path(name))
+            if located is None:
+                totals['missing'] += 1
+                continue
+            source, codec = located
+            moves[name] = self._destination(name, uploaded, source)
+            suffixes[name] = SUFFIXES[codec] if codec else ''
+        if dry_run or not moves:
+            for name, new in moves.items():
+                self.stdout.write(f'{name} -> {new}')
+            totals['files'] += len(moves)
+            return
+
+        list(executor.map(
+            link_file,
+            [upload_storage.path(name) + suffixes[name] for name in moves],
+            [upload_storage.path(new) + suffixes[name] for name, new in moves.items()],
+        ))
+        try:
+            with transaction.atomic():
+                for name, new in moves.items():
+                    # original_name keeps the displayed name if the new one got a suffix.
+                    FileRecord.objects.filter(file=name, original_name='').update(original_name=os.path.basename(name))
+                    totals['records'] += FileRecord.objects.filter(file=name).update(file=new)
+                    FileTier.objects.filter(name=name).update(name=new)
+                invalidate_on_commit()
+                sources = [upload_storage.path(name) for name in moves]
+                transaction.on_commit(lambda: list(executor.map(remove_path, sources)))
+        except Exception:
+            list(executor.map(remove_path, [upload_storage.path(new) for new in moves.values()]))
+            raise
+        totals['files'] += len(moves)
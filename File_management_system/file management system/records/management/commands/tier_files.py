@@ -0,0 +1,145 @@
+import os
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from records.exports import compress_type
+from records.models import FileRecord, FileTier
+from records.storage import upload_storage
+from records.tiers import SUFFIXES, compress_copy, demote, promote, promote_accesses, tier_codec, zstandard
+
+
+class Command(BaseCommand):
+    help = (
+        'Compress stored files that were neither uploaded nor downloaded for --days into the cold tier, '
+        'skipping formats that are compressed already, and decompress cold files that are downloaded '
+        'again. --report shows how many bytes the cold tier saves.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=getattr(settings, 'RECORDS_TIER_COLD_DAYS', 90))
+        parser.add_argument('--codec', choices=sorted(SUFFIXES), default=tier_codec())
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='List the files that would be compressed')
+        parser.add_argument('--report', action='store_true', help='Only report the cold tier and bytes saved')
+
+    def handle(self, *args, **options):
+        if options['report']:
+            self._report()
+            return
+        if options['codec'] == 'zstd' and zstandard is None:
+            raise CommandError('zstd needs the zstandard package (pip install zstandard); use --codec gzip.')
+
+        started = time.perf_counter()
+        totals = defaultdict(int)
+        if not options['dry_run']:
+            self._tidy(totals)
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='tier') as executor:
+            last = ''
+            while True:
+                rows = list(self._candidates(cutoff).filter(file__gt=last)[:options['batch_size']])
+                if not rows:
+                    break
+                last = rows[-1][0]
+                self._demote_batch(executor, rows, options, totals)
+
+        elapsed = time.perf_counter() - started
+        verb = 'Would compress' if options['dry_run'] else 'Compressed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['files']} files in {elapsed:.1f}s, saving {totals['saved']} bytes; "
+            f"{totals['incompressible']} not worth compressing, {totals['missing']} missing. "
+            f"Promoted {totals['promoted']} files back to the hot tier."
+        ))
+
+    def _candidates(self, cutoff):
+        """(name, file type) of the stored files nobody uploaded or downloaded since cutoff, by name"""
+
+        settled = FileTier.objects.filter(Q(codec__gt='') | Q(incompressible=True) | Q(last_accessed__gte=cutoff))
+        return (
+            FileRecord.objects.exclude(file='').exclude(file__in=settled.values('name'))
+            .values('file').annotate(latest=Max('upload_datetime'), kind=Min('file_type'))
+            .filter(latest__lt=cutoff).order_by('file').values_list('file', 'kind')
+        )
+
+    def _tidy(self, totals):
+        """Promote cold files downloaded often enough, and drop the tier state of files that are gone"""
+
+        FileTier.objects.exclude(name__in=FileRecord.objects.values('file')).delete()
+        for name in FileTier.objects.filter(codec__gt='', access_count__gte=promote_accesses()).values_list('name', flat=True):
+            totals['promoted'] += promote(name)
+        # A cold file uploaded again is stored anew next to its compressed copy.
+        for name, codec in list(FileTier.objects.filter(codec__gt='').values_list('name', 'codec')):
+            path = upload_storage.path(name)
+            if os.path.exists(path):
+                with transaction.atomic():
+                    FileTier.objects.filter(name=name).update(codec='', stored_size=0, compressed_datetime=None)
+                    transaction.on_commit(lambda copy=path + SUFFIXES[codec]: self._remove(copy))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _demote_batch(self, executor, rows, options, totals):
+        paths = {}
+        for name, file_type in rows:
+            path = upload_storage.path(name)
+            if not os.path.exists(path):
+                totals['missing'] += 1
+            elif compress_type(path, file_type) == zipfile.ZIP_STORED:
+                # Office documents, images and PDFs of images gain nothing.
+                totals['incompressible'] += 1
+                if not options['dry_run']:
+                    FileTier.objects.update_or_create(name=name, defaults={'size': os.path.getsize(path), 'incompressible': True})
+            else:
+                paths[name] = path
+        if options['dry_run']:
+            for name in paths:
+                self.stdout.write(name)
+            totals['files'] += len(paths)
+            return
+
+        codec = options['codec']
+        # Compress before the transaction, which holds SQLite's write lock.
+        stored_sizes = list(executor.map(compress_copy, paths.values(), [codec] * len(paths)))
+        with transaction.atomic():
+            for (name, path), stored_size in zip(paths.items(), stored_sizes):
+                size = os.path.getsize(path)
+                if stored_size is None:
+                    totals['incompressible'] += 1
+                    FileTier.objects.update_or_create(name=name, defaults={'size': size, 'incompressible': True})
+                    continue
+                demote(name, codec, size, stored_size)
+                totals['files'] += 1
+                totals['saved'] += size - stored_size
+
+    def _report(self):
+        names = FileRecord.objects.exclude(file='').values('file').distinct().count()
+        cold = FileTier.objects.filter(codec__gt='').values('codec').annotate(
+            files=Count('name'), size=Sum('size'), stored_size=Sum('stored_size')
+        ).order_by('codec')
+        incompressible = FileTier.objects.filter(incompressible=True).count()
+
+        self.stdout.write(f"{'tier':<8} {'files':>8} {'bytes':>14} {'on disk':>14} {'saved':>14} {'ratio':>6}")
+        saved = 0
+        cold_files = 0
+        for row in cold:
+            cold_files += row['files']
+            saved += row['size'] - row['stored_size']
+            self.stdout.write(
+                f"{row['codec']:<8} {row['files']:>8} {row['size']:>14} {row['stored_size']:>14} "
+                f"{row['size'] - row['stored_size']:>14} {row['stored_size'] / (row['size'] or 1):>6.2f}"
+            )
+        self.stdout.write(f"{'hot':<8} {names - cold_files:>8}  ({incompressible} not worth compressing)")
+        self.stdout.write(self.style.SUCCESS(f'The cold tier saves {saved} bytes ({saved / 1024 ** 2:.1f} MiB).'))
@@ -0,0 +1,282 @@
+import collections
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERIES = 500
+QUANTILES = (0.5, 0.95, 0.99)
+
+# name -> help text for every per-request measurement
+METRICS = {
+    'duration_seconds': 'Wall time from request to the last byte of the response',
+    'db_queries': 'Database queries run',
+    'db_seconds': 'Time spent in database queries',
+    'media_read_bytes': 'Bytes read from MEDIA_ROOT',
+    'media_written_bytes': 'Bytes written to MEDIA_ROOT',
+    'peak_memory_bytes': 'Peak traced Python memory (RECORDS_METRICS_TRACE_MEMORY)',
+}
+# name -> help text for every process-wide counter
+COUNTERS = {
+    'cache_hits': 'Records cache lookups answered from the cache',
+    'cache_misses': 'Records cache lookups that ran the query',
+}
+
+_current = contextvars.ContextVar('records_request_stats', default=None)
+
+
+class RequestStats:
+    """Measurements for one request, collected from whatever thread does the work"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.media_read_bytes = 0
+        self.media_written_bytes = 0
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        with self.lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({'sql': sql, 'ms': round(seconds * 1000, 3)})
+
+
+def begin_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Closed from another context (e.g. a streaming response finished elsewhere).
+        _current.set(None)
+
+
+def count_io(direction, size):
+    """Attribute size bytes read from or written to MEDIA_ROOT ('read'/'written') to the current request"""
+
+    stats = _current.get()
+    if stats is not None and size:
+        with stats.lock:
+            setattr(stats, f'media_{direction}_bytes', getattr(stats, f'media_{direction}_bytes') + size)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_instrument_connection)
+
+
+class Window:
+    """The most recent values of one measurement, plus running totals for Prometheus _sum/_count"""
+
+    def __init__(self, size):
+        self.values = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        values = sorted(self.values)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: values[min(int(q * len(values)), len(values) - 1)] for q in QUANTILES}
+
+
+class Registry:
+    """Per-view rolling windows for every metric, and the COUNTERS, in this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.statuses = collections.Counter()
+        self.counters = collections.Counter()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, view, status, values):
+        size = getattr(settings, 'RECORDS_METRICS_WINDOW', 1024)
+        with self.lock:
+            self.statuses[(view, status)] += 1
+            for name, value in values.items():
+                window = self.windows.get((view, name))
+                if window is None:
+                    window = self.windows[(view, name)] = Window(size)
+                window.add(value)
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+
+        lines = []
+        with self.lock:
+            for name, help_text in METRICS.items():
+                metric = f'records_request_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} summary')
+                for (view, window_name), window in sorted(self.windows.items()):
+                    if window_name != name:
+                        continue
+                    for q, value in window.quantiles().items():
+                        lines.append(f'{metric}{{view="{view}",quantile="{q}"}} {value:g}')
+                    lines.append(f'{metric}_sum{{view="{view}"}} {window.total:g}')
+                    lines.append(f'{metric}_count{{view="{view}"}} {window.count}')
+            lines.append('# HELP records_requests_total Requests served, by view and status code')
+            lines.append('# TYPE records_requests_total counter')
+            for (view, status), count in sorted(self.statuses.items()):
+                lines.append(f'records_requests_total{{view="{view}",status="{status}"}} {count}')
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP records_{name}_total {help_text}')
+                lines.append(f'# TYPE records_{name}_total counter')
+                lines.append(f'records_{name}_total {self.counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class StackProfile:
+    """Stack samples of one request"""
+
+    def __init__(self):
+        self.samples = collections.Counter()
+
+    def add(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+            frame = frame.f_back
+        if stack:
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def profile(self, limit=50):
+        """Most frequent stacks in collapsed (flame graph) format: 'outer;...;inner count'"""
+
+        return [f'{stack} {count}' for stack, count in self.samples.most_common(limit)]
+
+
+class SlowRequestWatchdog:
+    """One thread per process that samples the stacks of requests running past their threshold.
+
+    Requests register their thread and deadline in a dict; the thread sleeps
+    until the earliest deadline, then samples every overdue request each
+    interval until it is unwatched. A fast request costs a dict insert and
+    removal, so the profile covers just the slow part of slow requests.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.requests = {}
+        self.wake_at = float('inf')
+        self.thread = None
+
+    def watch(self, thread_id, threshold):
+        """Start watching thread_id; returns the StackProfile its samples go to"""
+
+        profile = StackProfile()
+        deadline = time.monotonic() + threshold
+        with self.condition:
+            self.requests[profile] = (thread_id, deadline)
+            # Started lazily, and again in a process forked after it started.
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='records-slow-requests', daemon=True)
+                self.thread.start()
+            elif deadline < self.wake_at:
+                self.condition.notify()
+        return profile
+
+    def unwatch(self, profile):
+        with self.condition:
+            self.requests.pop(profile, None)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                overdue = [(profile, thread_id) for profile, (thread_id, deadline) in self.requests.items()
+                           if deadline <= now]
+                if not overdue:
+                    self.wake_at = min((deadline for _, deadline in self.requests.values()), default=float('inf'))
+                    self.condition.wait(None if self.wake_at == float('inf') else self.wake_at - now)
+                    continue
+                # Sampled under the lock, so a request is never added to once it is unwatched.
+                self.wake_at = now + self.interval
+                frames = sys._current_frames()
+                for profile, thread_id in overdue:
+                    profile.add(frames.get(thread_id))
+                del frames
+            time.sleep(self.interval)
+
+
+watchdog = SlowRequestWatchdog()
+
+
+def memory_tracing_enabled():
+    return getattr(settings, 'RECORDS_METRICS_TRACE_MEMORY', False)
+
+
+def start_memory_trace():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+
+
+def peak_memory():
+    return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+
+
+def dump_slow_request(request, view, status, values, stats, profile):
+    """Write the request's SQL and profile to RECORDS_SLOW_REQUEST_DIR as JSON"""
+
+    directory = settings.RECORDS_SLOW_REQUEST_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{view.replace(':', '_')}.json"
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        json.dump({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': view,
+            'status': status,
+            'metrics': values,
+            'queries': stats.queries,
+            'profile': profile.profile() if profile else [],
+        }, f, indent=2)
+    logger.warning('Slow request %s %s took %.2fs; details in %s',
+                   request.method, request.path, values['duration_seconds'], path)
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """Time every request and record its SQL, MEDIA_ROOT I/O and memory per view.
+
+    Streaming responses are measured until the last byte is sent. Requests
+    slower than RECORDS_SLOW_REQUEST_SECONDS are dumped with their SQL and a
+    sampled profile. The profile is left out under ASGI, where the request's
+    thread is the event loop every other request runs on too. Results are
+    exposed by the metrics view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self._begin(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            metrics.end_request(state['token'])
+            raise
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = self._begin(request, sample_stack=False)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            metrics.end_request(state['token'])
+            raise
+        return self._finish(request, response, state)
+
+    def _begin(self, request, sample_stack=True):
+        stats, token = metrics.begin_request()
+        profile = None
+        threshold = getattr(settings, 'RECORDS_SLOW_REQUEST_SECONDS', None)
+        if threshold and sample_stack:
+            profile = metrics.watchdog.watch(threading.get_ident(), threshold)
+        if metrics.memory_tracing_enabled():
+            metrics.start_memory_trace()
+        return {'stats': stats, 'token': token, 'profile': profile}
+
+    def _finish(self, request, response, state):
+        if response.streaming:
+            # The body is produced after the view returns, so keep attributing
+            # queries and I/O to this request until the server closes it.
+            response._resource_closers.append(lambda: self._record(request, response, state))
+        else:
+            self._record(request, response, state)
+        return response
+
+    def _record(self, request, response, state):
+        metrics.end_request(state['token'])
+        stats, profile = state['stats'], state['profile']
+        if profile:
+            metrics.watchdog.unwatch(profile)
+        duration = time.perf_counter() - stats.started
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unmatched'
+        values = {
+            'duration_seconds': duration,
+            'db_queries': stats.db_queries,
+            'db_seconds': stats.db_seconds,
+            'media_read_bytes': stats.media_read_bytes,
+            'media_written_bytes': stats.media_written_bytes,
+        }
+        if metrics.memory_tracing_enabled():
+            values['peak_memory_bytes'] = metrics.peak_memory()
+        metrics.registry.observe(view, response.status_code, values)
+
+        threshold = getattr(settings, 'RECORDS_SLOW_REQUEST_SECONDS', None)
+        if threshold and duration >= threshold:
+            metrics.dump_slow_request(request, view, response.status_code, values, stats, profile)
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+# The FTS5 index as this migration created it. The SQL is frozen here rather
+# than taken from records.search, so later changes there go in new migrations.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS records_filerecord_fts USING fts5(
+        description, letter_reference_number, content='records_filerecord', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    "CREATE TRIGGER IF NOT EXISTS records_filerecord_fts_ai AFTER INSERT ON records_filerecord BEGIN "
+    "INSERT INTO records_filerecord_fts(rowid, description, letter_reference_number) "
+    "VALUES (new.id, new.description, new.letter_reference_number); END",
+    "CREATE TRIGGER IF NOT EXISTS records_filerecord_fts_ad AFTER DELETE ON records_filerecord BEGIN "
+    "INSERT INTO records_filerecord_fts(records_filerecord_fts, rowid, description, letter_reference_number) "
+    "VALUES ('delete', old.id, old.description, old.letter_reference_number); END",
+    "CREATE TRIGGER IF NOT EXISTS records_filerecord_fts_au AFTER UPDATE OF description, letter_reference_number "
+    "ON records_filerecord BEGIN "
+    "INSERT INTO records_filerecord_fts(records_filerecord_fts, rowid, description, letter_reference_number) "
+    "VALUES ('delete', old.id, old.description, old.letter_reference_number); "
+    "INSERT INTO records_filerecord_fts(rowid, description, letter_reference_number) "
+    "VALUES (new.id, new.description, new.letter_reference_number); END",
+    "INSERT INTO records_filerecord_fts(records_filerecord_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS records_filerecord_fts_ai",
+    "DROP TRIGGER IF EXISTS records_filerecord_fts_ad",
+    "DROP TRIGGER IF EXISTS records_filerecord_fts_au",
+    "DROP TABLE IF EXISTS records_filerecord_fts",
+]
+
+
+def _run(schema_editor, statements):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, CREATE_SQL)
+
+
+def remove_search_index(apps, schema_editor):
+    _run(schema_editor, DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0003_exportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The FTS5 index over extracted text as this migration created it, frozen
+# here rather than taken from records.search.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS records_extractedcontent_fts USING fts5(
+        text, content='records_extractedcontent', content_rowid='record_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    "CREATE TRIGGER IF NOT EXISTS records_extractedcontent_fts_ai AFTER INSERT ON records_extractedcontent BEGIN "
+    "INSERT INTO records_extractedcontent_fts(rowid, text) VALUES (new.record_id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS records_extractedcontent_fts_ad AFTER DELETE ON records_extractedcontent BEGIN "
+    "INSERT INTO records_extractedcontent_fts(records_extractedcontent_fts, rowid, text) "
+    "VALUES ('delete', old.record_id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS records_extractedcontent_fts_au AFTER UPDATE OF text ON records_extractedcontent BEGIN "
+    "INSERT INTO records_extractedcontent_fts(records_extractedcontent_fts, rowid, text) "
+    "VALUES ('delete', old.record_id, old.text); "
+    "INSERT INTO records_extractedcontent_fts(rowid, text) VALUES (new.record_id, new.text); END",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS records_extractedcontent_fts_ai",
+    "DROP TRIGGER IF EXISTS records_extractedcontent_fts_ad",
+    "DROP TRIGGER IF EXISTS records_extractedcontent_fts_au",
+    "DROP TABLE IF EXISTS records_extractedcontent_fts",
+]
+
+
+def _run(schema_editor, statements):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_content_index(apps, schema_editor):
+    _run(schema_editor, CREATE_SQL)
+
+
+def remove_content_index(apps, schema_editor):
+    _run(schema_editor, DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0004_filerecord_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedContent',
+            fields=[
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='extracted_content', serialize=False, to='records.filerecord')),
+                ('content_hash', models.CharField(db_index=True, help_text='SHA-256 of the file the text was extracted from', max_length=64)),
+                ('text', models.TextField(blank=True)),
+                ('extracted_datetime', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_content_index, remove_content_index),
+    ]
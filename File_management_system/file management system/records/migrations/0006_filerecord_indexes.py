@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0005_extractedcontent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filerecord',
+            index=models.Index(fields=['upload_datetime', 'id'], name='record_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filerecord',
+            index=models.Index(fields=['file_type', 'upload_datetime', 'id'], name='record_type_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filerecord',
+            index=models.Index(fields=['description', 'id'], name='record_description_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filerecord',
+            index=models.Index(fields=['file_type', 'description', 'id'], name='record_type_description_idx'),
+        ),
+    ]
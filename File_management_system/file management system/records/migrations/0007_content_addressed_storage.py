@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:12
+
+from django.db import migrations, models
+import records.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0006_filerecord_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('hash', models.CharField(help_text='SHA-256 of the stored content', max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_datetime', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='filerecord',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the stored blob', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='filerecord',
+            name='original_name',
+            field=models.CharField(blank=True, help_text='File name as uploaded', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='filerecord',
+            name='file',
+            field=models.FileField(storage=records.storage.DedupStorage(), upload_to='uploads/'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('records', '0007_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('total_size', models.BigIntegerField()),
+                ('received_size', models.BigIntegerField(default=0)),
+                ('description', models.TextField()),
+                ('file_date', models.DateField(blank=True, null=True)),
+                ('letter_reference_number', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('complete', 'Complete')], default='active', max_length=20)),
+                ('created_datetime', models.DateTimeField(auto_now_add=True)),
+                ('updated_datetime', models.DateTimeField(auto_now=True)),
+                ('record', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='records.filerecord')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filerecord',
+            name='preview',
+            field=models.CharField(blank=True, db_index=True, help_text='Storage name of the thumbnail, if one was built', max_length=255),
+        ),
+    ]
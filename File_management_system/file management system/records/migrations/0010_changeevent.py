@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_upload_datetime(apps, schema_editor):
+    FileRecord = apps.get_model('records', 'FileRecord')
+    FileRecord.objects.update(updated_datetime=models.F('upload_datetime'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0009_filerecord_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filerecord',
+            name='updated_datetime',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_upload_datetime, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('record_id', models.BigIntegerField(db_index=True, help_text='Not a foreign key, so events outlive deleted records')),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('changed_datetime', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['seq'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:23
+
+from django.db import migrations, models
+import records.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0010_changeevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filerecord',
+            name='file',
+            field=models.FileField(storage=records.storage.DedupStorage(), upload_to=records.storage.upload_to),
+        ),
+    ]
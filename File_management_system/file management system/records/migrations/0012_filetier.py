@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0011_filerecord_sharded_upload_to'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileTier',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('codec', models.CharField(blank=True, help_text="'zstd' or 'gzip' while the file is kept compressed", max_length=10)),
+                ('size', models.BigIntegerField(default=0, help_text='Size of the file itself')),
+                ('stored_size', models.BigIntegerField(default=0, help_text='Size on disk while compressed')),
+                ('incompressible', models.BooleanField(default=False, help_text='Compressing it did not save enough to keep')),
+                ('access_count', models.PositiveIntegerField(default=0, help_text='Downloads since it last changed tier')),
+                ('last_accessed', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('compressed_datetime', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0012_filetier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='extractedcontent',
+            index=models.Index(fields=['extracted_datetime'], name='content_extracted_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0013_extractedcontent_extracted_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_datetime',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life of the worker running it', null=True),
+        ),
+    ]
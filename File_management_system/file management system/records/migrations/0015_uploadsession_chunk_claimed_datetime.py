@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0014_exportjob_heartbeat_datetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='chunk_claimed_datetime',
+            field=models.DateTimeField(blank=True, help_text='When the chunk being written started', null=True),
+        ),
+    ]
@@ -1,7 +1,11 @@
 import os
+import uuid
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+from .storage import blob_hash, upload_storage, upload_to
+
 
 class FileRecord(models.Model):
     FILE_TYPE_CHOICES = [
@@ -13,33 +17,195 @@ class FileRecord(models.Model):
     ]
     
     description = models.TextField(help_text="Description of the file")
-    file = models.FileField(upload_to='uploads/')
+    file = models.FileField(upload_to=upload_to, storage=upload_storage)
+    original_name = models.CharField(max_length=255, blank=True, help_text="File name as uploaded")
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, help_text="SHA-256 of the stored blob")
     upload_datetime = models.DateTimeField(auto_now_add=True)
+    updated_datetime = models.DateTimeField(auto_now=True)
     file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES, default='Other')
     file_date = models.DateField(null=True, blank=True, help_text="Date associated with the file")
     letter_reference_number = models.CharField(max_length=255, null=True, blank=True, help_text="Letter or reference number")
+    preview = models.CharField(max_length=255, blank=True, db_index=True, help_text="Storage name of the thumbnail, if one was built")
     
     class Meta:
         ordering = ['-upload_datetime']
+        indexes = [
+            models.Index(fields=['upload_datetime', 'id'], name='record_upload_idx'),
+            models.Index(fields=['file_type', 'upload_datetime', 'id'], name='record_type_upload_idx'),
+            models.Index(fields=['description', 'id'], name='record_description_idx'),
+            models.Index(fields=['file_type', 'description', 'id'], name='record_type_description_idx'),
+        ]
     
     def __str__(self):
         return f"{self.id} - {self.description[:50]}"
     
+    @staticmethod
+    def detect_file_type(name):
+        ext = os.path.splitext(name)[1].lower()
+        if ext == '.pdf':
+            return 'PDF'
+        elif ext == '.docx':
+            return 'DOCX'
+        elif ext == '.xlsx':
+            return 'XLSX'
+        elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
+            return 'Image'
+        return 'Other'
+    
     def save(self, *args, **kwargs):
+        self._file_changed = bool(self.file) and not self.file._committed
+        self._replaced_file = None
+        if self._file_changed:
+            self.original_name = os.path.basename(self.file.name)
+            if self.pk:
+                self._replaced_file = FileRecord.objects.filter(pk=self.pk).values_list('file', flat=True).first()
+            # Store the file now (FileField would do it during the insert) so
+            # the blob hash is known before the row is written.
+            self.file.save(self.file.name, self.file.file, save=False)
+            self.content_hash = blob_hash(self.file.name)
         if self.file:
-            ext = os.path.splitext(self.file.name)[1].lower()
-            if ext == '.pdf':
-                self.file_type = 'PDF'
-            elif ext == '.docx':
-                self.file_type = 'DOCX'
-            elif ext == '.xlsx':
-                self.file_type = 'XLSX'
-            elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-                self.file_type = 'Image'
-            else:
-                self.file_type = 'Other'
+            self.file_type = self.detect_file_type(self.file_name)
         super().save(*args, **kwargs)
     
     @property
     def file_name(self):
-        return os.path.basename(self.file.name)
+        return self.original_name or os.path.basename(self.file.name)
+    
+    @property
+    def preview_version(self):
+        """Changes whenever the preview does, for cache-busting its URL"""
+        return os.path.splitext(os.path.basename(self.preview))[0][:16]
+
+
+class Blob(models.Model):
+    hash = models.CharField(max_length=64, primary_key=True, help_text="SHA-256 of the stored content")
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_datetime = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.ref_count} refs)"
+
+
+class FileTier(models.Model):
+    """Access statistics and compression state of one stored file (a FileRecord.file name)"""
+    
+    name = models.CharField(max_length=255, primary_key=True)
+    codec = models.CharField(max_length=10, blank=True, help_text="'zstd' or 'gzip' while the file is kept compressed")
+    size = models.BigIntegerField(default=0, help_text="Size of the file itself")
+    stored_size = models.BigIntegerField(default=0, help_text="Size on disk while compressed")
+    incompressible = models.BooleanField(default=False, help_text="Compressing it did not save enough to keep")
+    access_count = models.PositiveIntegerField(default=0, help_text="Downloads since it last changed tier")
+    last_accessed = models.DateTimeField(null=True, blank=True, db_index=True)
+    compressed_datetime = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.codec or 'hot'})"
+
+
+class ChangeEvent(models.Model):
+    """Append-only journal of FileRecord changes, read in seq order by sync clients"""
+    
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_CREATE, 'Create'),
+        (ACTION_UPDATE, 'Update'),
+        (ACTION_DELETE, 'Delete'),
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    record_id = models.BigIntegerField(db_index=True, help_text="Not a foreign key, so events outlive deleted records")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed_datetime = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['seq']
+    
+    def __str__(self):
+        return f"{self.seq} - {self.action} {self.record_id}"
+
+
+class ExtractedContent(models.Model):
+    record = models.OneToOneField(FileRecord, primary_key=True, on_delete=models.CASCADE, related_name='extracted_content')
+    content_hash = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the file the text was extracted from")
+    text = models.TextField(blank=True)
+    extracted_datetime = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['extracted_datetime'], name='content_extracted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.record_id} - {self.content_hash[:12]}"
+
+
+class ExportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_STALE = 'stale'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_STALE, 'Stale'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filters_key = models.CharField(max_length=64, db_index=True, help_text="Hash of the normalized export filters")
+    filters = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_datetime = models.DateTimeField(auto_now_add=True)
+    heartbeat_datetime = models.DateTimeField(null=True, blank=True, help_text="Last sign of life of the worker running it")
+    finished_datetime = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_datetime']
+    
+    def __str__(self):
+        return f"{self.id} - {self.status}"
+    
+    @property
+    def artifact_path(self):
+        # One file per job: a job that went stale while running never
+        # overwrites the bundle of the job that replaced it.
+        return os.path.join(settings.EXPORT_ROOT, f"{self.filters_key}.{self.id}.zip")
+
+
+class UploadSession(models.Model):
+    STATUS_ACTIVE = 'active'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_size = models.BigIntegerField(default=0)
+    description = models.TextField()
+    file_date = models.DateField(null=True, blank=True)
+    letter_reference_number = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    record = models.ForeignKey(FileRecord, null=True, blank=True, on_delete=models.SET_NULL)
+    chunk_claimed_datetime = models.DateTimeField(null=True, blank=True, help_text="When the chunk being written started")
+    created_datetime = models.DateTimeField(auto_now_add=True)
+    updated_datetime = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.id} - {self.file_name} ({self.received_size}/{self.total_size})"
+    
+    @property
+    def part_path(self):
+        return os.path.join(settings.UPLOAD_SESSION_ROOT, f"{self.id}.part")
@@ -0,0 +1,188 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+
+from .cache import get_or_compute
+
+
+PAGE_SIZE = 10
+
+
+class CursorPage:
+    """One page of keyset-paginated records with opaque next/previous tokens"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def keyset_ordering(records):
+    """Return [(field, descending)] for the queryset ordering with id as tiebreaker.
+
+    Returns None when the ordering cannot be used as a keyset, e.g. when it
+    sorts on an annotation such as search_rank.
+    """
+
+    model_fields = {f.name for f in records.model._meta.concrete_fields}
+    ordering = []
+    for item in records.query.order_by:
+        if not isinstance(item, str):
+            return None
+        name = item.lstrip('-')
+        if name not in model_fields:
+            return None
+        ordering.append((name, item.startswith('-')))
+    if not ordering:
+        return None
+    if ordering[-1][0] != 'id':
+        ordering.append(('id', ordering[-1][1]))
+    return ordering
+
+
+def encode_cursor(direction, record, ordering):
+    values = [getattr(record, name) for name, _ in ordering]
+    payload = json.dumps([direction, [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """Return (direction, values) from a cursor token, or None if it is invalid"""
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, raw_values = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('n', 'p') or len(raw_values) != len(ordering):
+            return None
+        values = [
+            model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(ordering, raw_values)
+        ]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+    return direction, values
+
+
+def _after(ordering, values, backwards=False):
+    """Q matching rows strictly after values in ordering (before, if backwards).
+
+    The leading inclusive bound on the first sort key gives the database a
+    range it can seek to in the index; the OR terms then break ties.
+    """
+
+    first, descending = ordering[0]
+    bound = Q(**{f"{first}__{'lte' if descending != backwards else 'gte'}": values[0]})
+    condition = Q()
+    for i, (name, descending) in enumerate(ordering):
+        lookup = 'lt' if descending != backwards else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[i]})
+        for j in range(i):
+            term &= Q(**{ordering[j][0]: values[j]})
+        condition |= term
+    return bound & condition
+
+
+def paginate_cursor(records, cursor=None, page_size=PAGE_SIZE):
+    """Return a CursorPage, or None if the queryset ordering has no usable keyset.
+
+    Each page is a single indexed range query, so page N costs the same as
+    page 1 regardless of how deep it is.
+    """
+
+    ordering = keyset_ordering(records)
+    if ordering is None:
+        return None
+
+    decoded = decode_cursor(cursor, records.model, ordering) if cursor else None
+    direction, values = decoded or ('n', None)
+    backwards = direction == 'p'
+
+    order_by = [('-' if desc != backwards else '') + name for name, desc in ordering]
+    if values is not None:
+        records = records.filter(_after(ordering, values, backwards))
+    rows = list(records.order_by(*order_by)[:page_size + 1])
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    has_next = has_more if not backwards else values is not None
+    has_previous = values is not None if not backwards else has_more
+    if not rows:
+        return CursorPage(rows)
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor('n', rows[-1], ordering) if has_next else None,
+        previous_cursor=encode_cursor('p', rows[0], ordering) if has_previous else None,
+    )
+
+
+def cached_count(records, key):
+    """Count of records, cached under the filters key until any record changes"""
+
+    return get_or_compute(f'count:{key}', records.count)
+
+
+def _rows(records, ids, only=None):
+    manager = records.model._default_manager
+    rows = (manager.only(*only) if only else manager).in_bulk(ids)
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def cached_cursor_page(records, key, cursor=None, page_size=PAGE_SIZE, only=None):
+    """paginate_cursor() with the page's ids and cursors cached.
+
+    Rows are fetched by primary key, loading just the only fields if given.
+    """
+
+    if keyset_ordering(records) is None:
+        return None
+
+    def compute():
+        page = paginate_cursor(records, cursor, page_size)
+        return [record.pk for record in page], page.next_cursor, page.previous_cursor
+
+    token = hashlib.sha256((cursor or '').encode('utf-8')).hexdigest()[:16]
+    ids, next_cursor, previous_cursor = get_or_compute(f'cursor:{key}:{token}:{page_size}', compute)
+    return CursorPage(_rows(records, ids, only), next_cursor, previous_cursor)
+
+
+def cached_offset_page(records, key, number, page_size=PAGE_SIZE, only=None):
+    """Paginator.get_page() with the count and the page's ids cached"""
+
+    paginator = Paginator(records, page_size)
+    paginator.count = cached_count(records, key)
+    try:
+        number = paginator.validate_number(number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+
+    bottom = (number - 1) * page_size
+    ids = get_or_compute(
+        f'page:{key}:{number}:{page_size}',
+        lambda: list(records.values_list('pk', flat=True)[bottom:bottom + page_size]),
+    )
+    return Page(_rows(records, ids, only), number, paginator)
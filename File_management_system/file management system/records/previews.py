@@ -0,0 +1,88 @@
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import workers
+from .blobs import remove_paths_on_commit
+from .cache import invalidate_on_commit
+from .changes import journal
+from .models import ChangeEvent, FileRecord
+from .thumbnails import Image, build_preview
+from .tiers import local_copy
+
+try:
+    from PIL import features
+except ImportError:
+    features = None
+
+
+PREVIEW_TYPES = ('Image', 'PDF')
+BATCH_SIZE = 500
+
+
+def previews_enabled():
+    return Image is not None
+
+
+def preview_format():
+    """'WEBP' when Pillow was built with WebP support, else 'JPEG'"""
+
+    fmt = getattr(settings, 'RECORDS_PREVIEW_FORMAT', 'WEBP').upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt
+
+
+def preview_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def queue_preview(record_id):
+    """Build a record's preview on the worker pool once the transaction commits"""
+
+    if previews_enabled():
+        transaction.on_commit(lambda: workers.submit(build_record_preview, record_id))
+
+
+def set_preview(record_id, name):
+    """Point a record at a preview and remove the one it replaces if nothing else uses it"""
+
+    old = FileRecord.objects.filter(pk=record_id).values_list('preview', flat=True).first()
+    if old == (name or ''):
+        return
+    FileRecord.objects.filter(pk=record_id).update(preview=name or '', updated_datetime=timezone.now())
+    journal(ChangeEvent.ACTION_UPDATE, [record_id])
+    invalidate_on_commit()
+    if old:
+        release_preview(old)
+
+
+def release_preview(name):
+    if name and not FileRecord.objects.filter(preview=name).exists():
+        remove_paths_on_commit([preview_path(name)])
+
+
+def release_previews(names):
+    """release_preview for many names at once: returns the paths no remaining record uses"""
+
+    names = sorted({name for name in names if name})
+    used = set()
+    for start in range(0, len(names), BATCH_SIZE):
+        used.update(FileRecord.objects.filter(preview__in=names[start:start + BATCH_SIZE]).values_list('preview', flat=True))
+    return [preview_path(name) for name in names if name not in used]
+
+
+def build_record_preview(record_id):
+    record = FileRecord.objects.filter(pk=record_id).first()
+    if record is None or not record.file or record.file_type not in PREVIEW_TYPES:
+        return
+    with local_copy(record.file.path) as path:
+        if path is None:
+            return
+        name = build_preview(
+            path, record.file_type, settings.MEDIA_ROOT,
+            settings.RECORDS_PREVIEW_SIZE, preview_format(), record.content_hash,
+        )
+    set_preview(record_id, name)
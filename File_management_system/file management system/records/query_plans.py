@@ -0,0 +1,79 @@
+import itertools
+import re
+
+from django.utils import timezone
+
+from .filters import SORT_ORDERINGS, filter_records
+from .pagination import PAGE_SIZE, _after, keyset_ordering
+
+
+TABLE = 'records_filerecord'
+
+FILTER_CASES = {
+    'no filters': {},
+    'file_type': {'file_type': 'PDF'},
+    'date range': {'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+    'file_type + date range': {'file_type': 'PDF', 'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+}
+
+FULL_SCAN = re.compile(rf'\bSCAN {TABLE}\b(?! USING (COVERING )?INDEX)')
+INDEX_SEEK = re.compile(rf'\bSEARCH {TABLE} USING (COVERING )?INDEX\b')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR ORDER BY')
+
+CURSOR_PROBES = {
+    'upload_datetime': timezone.now,
+    'description': lambda: 'm',
+    'id': lambda: 1,
+}
+
+
+def _filters(**overrides):
+    filters = {'search': '', 'file_type': '', 'start_date': '', 'end_date': '', 'sort_by': '-upload_datetime'}
+    filters.update(overrides)
+    return filters
+
+
+def plan_problems(plan, sorted_by_index=True, seek=False, unfiltered_count=False):
+    """Describe what is wrong with an EXPLAIN QUERY PLAN result, if anything"""
+
+    problems = []
+    # SQLite answers an unfiltered COUNT(*) from b-tree page counts.
+    if FULL_SCAN.search(plan) and not unfiltered_count:
+        problems.append('full table scan')
+    if sorted_by_index and TEMP_SORT.search(plan):
+        problems.append('sort without index')
+    if seek and not INDEX_SEEK.search(plan):
+        problems.append('no index seek for cursor')
+    return problems
+
+
+def check_plans():
+    """(label, plan, problems) for the list, cursor, export and count queries of every filter and sort.
+
+    Plans come from SQLite's EXPLAIN QUERY PLAN; used by the check_query_plans
+    command and records.tests.
+    """
+
+    sorts = [key for key in SORT_ORDERINGS if key != 'relevance']
+    for (case, params), sort_by in itertools.product(FILTER_CASES.items(), sorts):
+        records = filter_records(_filters(sort_by=sort_by, **params))
+        ordering = keyset_ordering(records)
+        probe = [CURSOR_PROBES[name]() for name, _ in ordering]
+
+        # A date range narrows through the upload_datetime index, after
+        # which sorting the matching rows by description is expected.
+        sorted_by_index = not ('start_date' in params and ordering[0][0] == 'description')
+
+        queries = {
+            'list page': (records[:PAGE_SIZE], {'sorted_by_index': sorted_by_index}),
+            'cursor page': (
+                records.filter(_after(ordering, probe))[:PAGE_SIZE],
+                {'sorted_by_index': sorted_by_index, 'seek': True},
+            ),
+            'export': (records, {'sorted_by_index': sorted_by_index}),
+            'count': (records.order_by(), {'sorted_by_index': False, 'unfiltered_count': not params}),
+        }
+
+        for name, (queryset, expectations) in queries.items():
+            plan = queryset.explain()
+            yield f'{case} / {sort_by} / {name}', plan, plan_problems(plan, **expectations)
@@ -0,0 +1,115 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'records_filerecord_fts'
+CONTENT_FTS_TABLE = 'records_extractedcontent_fts'
+
+# (fts table, source table, source rowid column, indexed columns)
+FTS_INDEXES = [
+    (FTS_TABLE, 'records_filerecord', 'id', ('description', 'letter_reference_number')),
+    (CONTENT_FTS_TABLE, 'records_extractedcontent', 'record_id', ('text',)),
+]
+
+# Weights passed to bm25() for (description, letter_reference_number)
+RANK_WEIGHTS = (1.0, 2.0)
+# Multiplier applied to extracted-content matches so metadata hits rank first
+CONTENT_RANK_WEIGHT = 0.5
+
+
+def _fts_schema(fts_table, source_table, rowid, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{col}' for col in columns)
+    old = ', '.join(f'old.{col}' for col in columns)
+    delete_old = (
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.{rowid}, {old});"
+    )
+    insert_new = f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.{rowid}, {new});"
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+            {cols}, content='{source_table}', content_rowid='{rowid}',
+            tokenize='unicode61 remove_diacritics 2'
+        )""",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source_table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source_table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {source_table} BEGIN "
+        f"{delete_old} {insert_new} END",
+    ]
+
+
+def fts_enabled(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def install_fts(using=None, rebuild=False):
+    """Create the FTS5 tables and their sync triggers where missing.
+
+    Django rebuilds SQLite tables for some schema changes, which silently
+    drops triggers, so this is re-run after every migrate.
+    """
+
+    conn = using or connection
+    if not fts_enabled(conn):
+        return
+    tables = conn.introspection.table_names()
+    with conn.cursor() as cursor:
+        for fts_table, source_table, rowid, columns in FTS_INDEXES:
+            if source_table not in tables:
+                continue
+            created = fts_table not in tables
+            for statement in _fts_schema(fts_table, source_table, rowid, columns):
+                cursor.execute(statement)
+            if created or rebuild:
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def drop_fts(using=None, tables=None):
+    conn = using or connection
+    if not fts_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        for fts_table, *_ in FTS_INDEXES:
+            if tables is not None and fts_table not in tables:
+                continue
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts_table}")
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a quoted prefix term"""
+
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text))
+
+
+def search_records(records, text, rank=False):
+    """Restrict records to those whose metadata or extracted content matches text.
+
+    With rank=True each record is annotated with search_rank; lower is a
+    better match. Databases without FTS5 fall back to
+    icontains over the same columns.
+    """
+
+    match = build_match_query(text)
+    if not match or not fts_enabled():
+        records = records.filter(Q(description__icontains=text) | Q(letter_reference_number__icontains=text))
+        # Every match ranks the same, so a relevance sort falls back to its tiebreakers.
+        return records.annotate(search_rank=Value(0.0, output_field=FloatField())) if rank else records
+
+    records = records.filter(
+        Q(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)))
+        | Q(id__in=RawSQL(f"SELECT rowid FROM {CONTENT_FTS_TABLE} WHERE {CONTENT_FTS_TABLE} MATCH %s", (match,)))
+    )
+    if rank:
+        records = records.annotate(search_rank=RawSQL(
+            f"COALESCE((SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = records_filerecord.id), 0) + "
+            f"COALESCE((SELECT bm25({CONTENT_FTS_TABLE}) * %s FROM {CONTENT_FTS_TABLE} "
+            f"WHERE {CONTENT_FTS_TABLE} MATCH %s AND rowid = records_filerecord.id), 0)",
+            (*RANK_WEIGHTS, match, CONTENT_RANK_WEIGHT, match),
+            output_field=FloatField(),
+        ))
+    return records
@@ -1,6 +1,48 @@
+from collections import Counter
+
 from django.contrib.auth.models import User
-from django.db.models.signals import post_migrate
-from django.dispatch import receiver
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import Signal, receiver
+
+from . import workers
+from .blobs import release_file, release_files, remove_paths_on_commit, retain_file
+from .cache import invalidate_on_commit
+from .changes import journal
+from .extraction import EXTRACTORS
+from .indexing import queue_content_indexing
+from .jobs import prune_artifacts
+from .models import ChangeEvent, ExportJob, ExtractedContent, FileRecord
+from .previews import PREVIEW_TYPES, queue_preview, release_preview, release_previews
+from .search import install_fts
+
+
+# Sent with records=[...] after FileRecord.objects.bulk_create, which skips
+# save() and post_save.
+records_bulk_created = Signal()
+# Sent with records=[(pk, file, preview), ...] by bulk.delete_records, whose
+# rows this app's post_delete receivers skip (see delete_in_bulk), and with
+# record_ids=[...] by bulk.update_records, whose queryset update skips post_save.
+records_bulk_deleted = Signal()
+records_bulk_updated = Signal()
+
+
+def delete_in_bulk(records):
+    """records.delete(), leaving this app's per-row post_delete work to records_bulk_deleted.
+
+    Related rows are still cascaded or nulled as their foreign keys say and
+    every other post_delete receiver runs; the caller sends
+    records_bulk_deleted for the deleted records.
+    """
+
+    records._records_bulk_delete = True
+    return records.delete()
+
+
+def _deleted_in_bulk(kwargs):
+    # post_delete's origin is the queryset delete_in_bulk() deleted, also for cascaded rows.
+    return kwargs.get('signal') is post_delete and getattr(kwargs.get('origin'), '_records_bulk_delete', False)
 
 
 @receiver(post_migrate)
@@ -10,3 +52,111 @@ def create_default_user(sender, **kwargs):
             username='MESGCC',
             password='BBA@123'
         )
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using='default', **kwargs):
+    if sender.name != 'records':
+        return
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ('records', '0004_filerecord_search_index') in applied:
+        install_fts(connection)
+
+
+@receiver(post_save, sender=FileRecord)
+@receiver(post_delete, sender=FileRecord)
+@receiver(records_bulk_created, sender=FileRecord)
+@receiver(records_bulk_deleted, sender=FileRecord)
+@receiver(records_bulk_updated, sender=FileRecord)
+def expire_export_artifacts(sender, **kwargs):
+    if _deleted_in_bulk(kwargs):
+        return
+    # Running jobs may already have read the changed records; they finish as stale.
+    expired = ExportJob.objects.filter(status__in=[ExportJob.STATUS_DONE, ExportJob.STATUS_RUNNING])
+    if expired.update(status=ExportJob.STATUS_STALE):
+        transaction.on_commit(lambda: workers.submit(prune_artifacts))
+
+
+@receiver(post_save, sender=FileRecord)
+@receiver(post_delete, sender=FileRecord)
+@receiver(records_bulk_created, sender=FileRecord)
+@receiver(records_bulk_deleted, sender=FileRecord)
+@receiver(records_bulk_updated, sender=FileRecord)
+@receiver(post_save, sender=ExtractedContent)
+@receiver(post_delete, sender=ExtractedContent)
+def invalidate_cached_results(sender, **kwargs):
+    if _deleted_in_bulk(kwargs):
+        return
+    invalidate_on_commit()
+
+
+@receiver(post_save, sender=FileRecord)
+def journal_saved_record(sender, instance, created, **kwargs):
+    journal(ChangeEvent.ACTION_CREATE if created else ChangeEvent.ACTION_UPDATE, [instance.pk])
+
+
+@receiver(post_delete, sender=FileRecord)
+def journal_deleted_record(sender, instance, **kwargs):
+    if _deleted_in_bulk(kwargs):
+        return
+    journal(ChangeEvent.ACTION_DELETE, [instance.pk])
+
+
+@receiver(post_save, sender=FileRecord)
+def index_uploaded_content(sender, instance, created, **kwargs):
+    if not getattr(instance, '_file_changed', False):
+        return
+    if instance.file_type in EXTRACTORS:
+        queue_content_indexing(instance.pk)
+    elif not created:
+        # Nothing to extract from the new file; the old file's text must not keep matching searches.
+        ExtractedContent.objects.filter(record_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=FileRecord)
+def build_uploaded_preview(sender, instance, **kwargs):
+    if getattr(instance, '_file_changed', False) and instance.file_type in PREVIEW_TYPES:
+        queue_preview(instance.pk)
+
+
+@receiver(post_save, sender=FileRecord)
+def update_blob_references(sender, instance, **kwargs):
+    if not getattr(instance, '_file_changed', False):
+        return
+    retain_file(instance.file.name)
+    if instance._replaced_file and instance._replaced_file != instance.file.name:
+        remove_paths_on_commit([path for path in [release_file(instance._replaced_file)] if path])
+
+
+@receiver(post_delete, sender=FileRecord)
+def release_deleted_file(sender, instance, **kwargs):
+    if _deleted_in_bulk(kwargs):
+        return
+    remove_paths_on_commit([path for path in [release_file(instance.file.name)] if path])
+    release_preview(instance.preview)
+
+
+@receiver(records_bulk_created, sender=FileRecord)
+def handle_bulk_created(sender, records, **kwargs):
+    for name, count in Counter(record.file.name for record in records).items():
+        retain_file(name, count)
+    journal(ChangeEvent.ACTION_CREATE, [record.pk for record in records])
+    for record in records:
+        if record.file_type in EXTRACTORS:
+            queue_content_indexing(record.pk)
+        if record.file_type in PREVIEW_TYPES:
+            queue_preview(record.pk)
+
+
+@receiver(records_bulk_deleted, sender=FileRecord)
+def handle_bulk_deleted(sender, records, **kwargs):
+    journal(ChangeEvent.ACTION_DELETE, [pk for pk, file, preview in records])
+    paths = release_files(Counter(file for pk, file, preview in records))
+    paths += release_previews(preview for pk, file, preview in records)
+    remove_paths_on_commit(paths)
+
+
+@receiver(records_bulk_updated, sender=FileRecord)
+def journal_bulk_updated(sender, record_ids, **kwargs):
+    journal(ChangeEvent.ACTION_UPDATE, record_ids)
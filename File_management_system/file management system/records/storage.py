@@ -0,0 +1,184 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .metrics import count_io
+
+
+BLOB_DIR = 'blobs'
+BLOB_NAME_RE = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/(?P<hash>[0-9a-f]{{64}})$')
+UPLOAD_DIR = 'uploads'
+FLAT_UPLOAD_NAME_RE = rf'^{UPLOAD_DIR}/[^/]+$'
+
+
+def blob_name(content_hash):
+    """Storage name of the blob holding content with this SHA-256"""
+
+    return f"{BLOB_DIR}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def file_identity(path):
+    """(inode, mtime in ns) of a file, or None if it is missing; changes when the file is rewritten or reused"""
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def claim_file(path):
+    """Touch an existing blob before reusing it, so an unlink queued when it was released skips it.
+
+    Returns False if the file is gone and has to be written again.
+    """
+
+    now = time.time_ns()
+    try:
+        os.utime(path, ns=(now, now))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def blob_hash(name):
+    """SHA-256 encoded in a blob storage name, or None for any other name"""
+
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group('hash') if match else None
+
+
+def sharded_name(filename, when=None):
+    """Storage name for a file kept under its own name, laid out by RECORDS_UPLOAD_LAYOUT.
+
+    'hash' spreads names over 65536 directories by their SHA-256
+    (uploads/3f/a2/letter.pdf), 'date' files them by upload day
+    (uploads/2024/05/17/letter.pdf) and 'flat' is the old single directory.
+    """
+
+    filename = os.path.basename(filename)
+    layout = getattr(settings, 'RECORDS_UPLOAD_LAYOUT', 'hash')
+    if layout == 'date':
+        return f"{UPLOAD_DIR}/{timezone.localtime(when):%Y/%m/%d}/{filename}"
+    if layout == 'flat':
+        return f"{UPLOAD_DIR}/{filename}"
+    digest = hashlib.sha256(filename.encode('utf-8')).hexdigest()
+    return f"{UPLOAD_DIR}/{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+def upload_to(instance, filename):
+    """FileRecord.file upload_to; only used when RECORDS_DEDUPLICATE_UPLOADS is off"""
+
+    return sharded_name(filename)
+
+
+@deconstructible
+class DedupStorage(FileSystemStorage):
+    """File system storage that keeps each distinct upload once, named by its SHA-256.
+
+    The hash comes from the upload handlers below when the file arrived over
+    HTTP; otherwise it is computed while the content is copied to disk. With
+    RECORDS_DEDUPLICATE_UPLOADS off this behaves like FileSystemStorage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if not getattr(settings, 'RECORDS_DEDUPLICATE_UPLOADS', True):
+            return super().get_available_name(name, max_length)
+        # Content-addressed names cannot collide, so skip the exists() probing.
+        return name
+
+    def _save(self, name, content):
+        if not getattr(settings, 'RECORDS_DEDUPLICATE_UPLOADS', True):
+            count_io('written', content.size)
+            return super()._save(name, content)
+
+        content_hash = getattr(content, 'content_hash', None)
+        if content_hash and claim_file(self.path(blob_name(content_hash))):
+            return blob_name(content_hash)
+        if content_hash and hasattr(content, 'temporary_file_path'):
+            return self._store_blob(content_hash, content.temporary_file_path())
+
+        tmp_dir = self.path(os.path.join(BLOB_DIR, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = None if content_hash else hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if digest is not None:
+                        digest.update(chunk)
+                    out.write(chunk)
+                    count_io('written', len(chunk))
+            return self._store_blob(content_hash or digest.hexdigest(), tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store_blob(self, content_hash, source_path):
+        name = blob_name(content_hash)
+        path = self.path(name)
+        if not claim_file(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_move_safe(source_path, path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+
+upload_storage = DedupStorage()
+
+
+class _HashingMixin:
+    """Compute the SHA-256 of an upload while its chunks arrive"""
+
+    def new_file(self, *args, **kwargs):
+        # Set up first: the memory handler ends new_file with StopFutureHandlers.
+        self._digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self._is_storing():
+            self._digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.content_hash = self._digest.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(_HashingMixin, MemoryFileUploadHandler):
+    def _is_storing(self):
+        return self.activated
+
+
+class HashingTemporaryFileUploadHandler(_HashingMixin, TemporaryFileUploadHandler):
+    def _is_storing(self):
+        return True
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    """Hashed, gzip- and brotli-compressed static files for WhiteNoise.
+
+    A {% static %} reference to a file that collectstatic never saw keeps its
+    plain URL (and 404s) instead of failing the whole page.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
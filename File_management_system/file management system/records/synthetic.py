@@ -0,0 +1,182 @@
+import io
+import random
+import zipfile
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+import xlsxwriter
+
+from .models import FileRecord
+from .signals import records_bulk_created
+from .storage import blob_hash, upload_storage
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# (share of records, extension, smallest size, largest size); sizes are
+# drawn log-uniformly, so most files sit near the small end as in a real
+# letter archive with the occasional large scan.
+SIZE_MIX = [
+    (0.55, 'pdf', 20 * 1024, 200 * 1024),
+    (0.25, 'jpg', 100 * 1024, 600 * 1024),
+    (0.12, 'docx', 10 * 1024, 60 * 1024),
+    (0.08, 'xlsx', 10 * 1024, 100 * 1024),
+]
+
+WORDS = (
+    'account allocation approval audit budget building circular committee contract correspondence '
+    'department district estimate finance grant inspection invoice maintenance meeting minutes notice '
+    'office order payment pension permit proposal purchase receipt report request revenue salary '
+    'sanction schedule school survey tender transfer vehicle works'
+).split()
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def make_pdf(rng, size):
+    """A one-page text PDF of about size bytes, with text that extraction can find"""
+
+    lines = []
+    total = 0
+    while total < size:
+        line = words(rng, 12)
+        lines.append(f'({line}) Tj T*')
+        total += len(line) + 8
+    stream = 'BT /F1 10 Tf 12 TL 50 800 Td\n' + '\n'.join(lines) + '\nET'
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+        '/Resources << /Font << /F1 5 0 R >> >> >>',
+        f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1'))
+    xref = out.tell()
+    out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1'))
+    for offset in offsets:
+        out.write(f'{offset:010d} 00000 n \n'.encode('latin-1'))
+    out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1'))
+    return out.getvalue()
+
+
+def make_jpeg(rng, size):
+    """A noisy greyscale scan of about size bytes"""
+
+    if Image is None:
+        return rng.randbytes(size)
+    side = max(int((size / 0.6) ** 0.5), 16)
+    image = Image.frombytes('L', (side, side), rng.randbytes(side * side))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def make_docx(rng, size):
+    """A minimal Word document of about size bytes (uncompressed text)"""
+
+    paragraphs = []
+    total = 0
+    while total < size:
+        text = words(rng, 30)
+        paragraphs.append(f'<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>')
+        total += len(text)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+        + ''.join(paragraphs) + '</w:body></w:document>'
+    )
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Override PartName="/word/document.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>'
+        ))
+        archive.writestr('word/document.xml', document)
+    return out.getvalue()
+
+
+def make_xlsx(rng, size):
+    """A spreadsheet of words and amounts with about size bytes of cell data"""
+
+    out = io.BytesIO()
+    workbook = xlsxwriter.Workbook(out, {'in_memory': True})
+    worksheet = workbook.add_worksheet()
+    row = total = 0
+    while total < size:
+        text = words(rng, 4)
+        worksheet.write_string(row, 0, text)
+        worksheet.write_number(row, 1, rng.randint(100, 1000000))
+        total += len(text) + 8
+        row += 1
+    workbook.close()
+    return out.getvalue()
+
+
+MAKERS = {'pdf': make_pdf, 'jpg': make_jpeg, 'docx': make_docx, 'xlsx': make_xlsx}
+
+
+def random_file(rng):
+    """(extension, content) drawn from SIZE_MIX"""
+
+    roll = rng.random()
+    for share, ext, smallest, largest in SIZE_MIX:
+        roll -= share
+        if roll < 0:
+            break
+    size = int(smallest * (largest / smallest) ** rng.random())
+    return ext, MAKERS[ext](rng, size)
+
+
+def seed_records(count, seed=0, unique_files=500, batch_size=500):
+    """Insert count FileRecords backed by up to unique_files generated files.
+
+    The same seed always gives the same descriptions, dates, references and
+    file contents. Records beyond unique_files reuse stored files, which the
+    content-addressed storage keeps once, as it does for real duplicates.
+    Returns the created records' ids.
+    """
+
+    rng = random.Random(seed)
+    pool = []
+    for i in range(min(count, unique_files)):
+        ext, content = random_file(rng)
+        name = upload_storage.save(f'uploads/seed_{seed}_{i:05d}.{ext}', ContentFile(content))
+        original = f"{words(rng, 2).replace(' ', '_')}_{i:05d}.{ext}"
+        pool.append((name, original))
+
+    ids = []
+    start = date(2015, 1, 1)
+    for offset in range(0, count, batch_size):
+        records = []
+        for i in range(offset, min(offset + batch_size, count)):
+            name, original = pool[i % len(pool)]
+            records.append(FileRecord(
+                description=words(rng, rng.randint(4, 14)).capitalize(),
+                file=name,
+                original_name=original,
+                content_hash=blob_hash(name),
+                file_type=FileRecord.detect_file_type(original),
+                file_date=start + timedelta(days=rng.randint(0, 3650)),
+                letter_reference_number=f'REF/{rng.randint(1, 99999):05d}',
+            ))
+        with transaction.atomic():
+            created = FileRecord.objects.bulk_create(records)
+            records_bulk_created.send(sender=FileRecord, records=created)
+        ids.extend(record.pk for record in created)
+    return ids
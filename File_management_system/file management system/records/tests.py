@@ -0,0 +1,315 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .exports import export_rows
+from .filters import SORT_ORDERINGS, get_filters, filter_records
+from .models import Blob, ChangeEvent, ExtractedContent, FileRecord, UploadSession
+from .query_plans import check_plans
+from .search import fts_enabled
+
+
+class RecordsTestCase(TestCase):
+    """A logged-in client, with files, partial uploads, exports and the records cache kept per test class"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp(prefix='records-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=f'{cls.root}/media',
+            UPLOAD_SESSION_ROOT=f'{cls.root}/partial_uploads',
+            EXPORT_ROOT=f'{cls.root}/exports',
+            RECORDS_SLOW_REQUEST_SECONDS=None,
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+                'records': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-records'},
+                'records_generation': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'tests-records-generation'},
+            },
+        )
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+
+    def setUp(self):
+        # Writes are rolled back without running on_commit, so nothing would invalidate the cache.
+        for alias in ('records', 'records_generation'):
+            caches[alias].clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        self.client.force_login(self.user)
+
+    def run_workers_inline(self):
+        """Run tasks for the worker pool at once, on this test's connection and transaction"""
+
+        patcher = mock.patch('records.workers.submit', side_effect=lambda fn, *args, **kwargs: fn(*args, **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_record(self, name, content, **fields):
+        record = FileRecord(description=fields.pop('description', name), **fields)
+        record.file = SimpleUploadedFile(name, content)
+        record.save()
+        return record
+
+
+class CursorPaginationTests(RecordsTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Shared descriptions and upload times, so pages break ties on id
+        for i, description in enumerate(['b', 'a', 'c', 'a', 'b', 'd', 'a']):
+            record = FileRecord.objects.create(description=description, file_type='Other')
+            FileRecord.objects.filter(pk=record.pk).update(upload_datetime=now - timedelta(hours=i // 2))
+
+    def pages(self, sort_by, cursor_key, cursor=None):
+        """ids of every page from cursor on, following cursor_key"""
+
+        pages = []
+        while True:
+            params = {'sort_by': sort_by, 'page_size': 3, 'fields': 'id'}
+            if cursor:
+                params['cursor'] = cursor
+            payload = self.client.get('/api/records/', params).json()
+            pages.append([row['id'] for row in payload['results']])
+            cursor = payload[cursor_key]
+            if cursor is None:
+                return pages, payload
+
+    def test_pages_forwards_and_backwards_for_every_sort(self):
+        for sort_by in SORT_ORDERINGS:
+            if sort_by == 'relevance':
+                continue
+            with self.subTest(sort_by):
+                expected = [record.pk for record in filter_records(get_filters({'sort_by': sort_by}))]
+                forwards, last = self.pages(sort_by, 'next_cursor')
+                self.assertEqual([pk for page in forwards for pk in page], expected)
+                self.assertEqual([len(page) for page in forwards], [3, 3, 1])
+
+                backwards, first = self.pages(sort_by, 'previous_cursor', last['previous_cursor'])
+                self.assertEqual(backwards, forwards[-2::-1])
+                self.assertIsNotNone(first['next_cursor'])
+
+    def test_invalid_cursor_starts_at_the_first_page(self):
+        first = self.client.get('/api/records/', {'page_size': 3}).json()
+        again = self.client.get('/api/records/', {'page_size': 3, 'cursor': 'not-a-cursor'}).json()
+        self.assertEqual(again['results'], first['results'])
+        self.assertIsNone(again['previous_cursor'])
+
+
+class SearchTests(RecordsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.letter = FileRecord.objects.create(description='Budget letter', letter_reference_number='REF-7', file_type='PDF')
+        self.memo = FileRecord.objects.create(description='Staff memo', letter_reference_number='budget-2', file_type='DOCX')
+        FileRecord.objects.create(description='Holiday photo', file_type='Image')
+
+    def search(self, text, sort_by='relevance'):
+        return list(filter_records(get_filters({'search': text, 'sort_by': sort_by})))
+
+    @skipUnless(fts_enabled(), 'Needs SQLite FTS5.')
+    def test_full_text_search_matches_prefixes_and_ranks_reference_hits(self):
+        self.assertEqual({r.pk for r in self.search('budg', '-upload_datetime')}, {self.letter.pk, self.memo.pk})
+        self.assertEqual(self.search('photo'), [FileRecord.objects.get(description='Holiday photo')])
+        # The reference number weighs more than the description.
+        self.assertEqual(self.search('budget')[0], self.memo)
+
+    def test_relevance_sort_without_word_characters(self):
+        self.assertEqual(self.search('!!!'), [])
+        for url in ('/', '/api/records/'):
+            with self.subTest(url):
+                self.assertEqual(self.client.get(url, {'search': '!!!', 'sort_by': 'relevance'}).status_code, 200)
+
+    def test_relevance_sort_without_fts(self):
+        with mock.patch('records.search.fts_enabled', return_value=False):
+            self.assertEqual({r.pk for r in self.search('BUDGET')}, {self.letter.pk, self.memo.pk})
+            for url in ('/', '/api/records/'):
+                with self.subTest(url):
+                    response = self.client.get(url, {'search': 'budget', 'sort_by': 'relevance'})
+                    self.assertEqual(response.status_code, 200)
+
+
+class ChunkedUploadTests(RecordsTestCase):
+    data = b'0123456789' * 3
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/uploads/', {
+            'description': 'Scanned letter', 'file_name': 'letter.txt', 'total_size': len(self.data),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.session = response.json()
+
+    def put(self, start, end):
+        return self.client.put(
+            self.session['upload_url'], self.data[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.data)}',
+        )
+
+    def test_upload_resumes_from_the_received_offset(self):
+        self.assertEqual(self.put(0, 9).json()['received_size'], 10)
+        # A client that lost track asks where to carry on.
+        self.assertEqual(self.client.get(self.session['upload_url']).json()['received_size'], 10)
+
+        for start, end in [(0, 9), (20, 29)]:
+            with self.subTest(start=start):
+                response = self.put(start, end)
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['received_size'], 10)
+        self.assertEqual(self.client.post(self.session['complete_url']).status_code, 409)
+        self.assertEqual(self.put(0, 40).status_code, 416)
+
+        self.assertEqual(self.put(10, 29).json()['received_size'], 30)
+        response = self.client.post(self.session['complete_url'])
+        self.assertEqual(response.status_code, 201)
+        record = FileRecord.objects.get(pk=response.json()['record_id'])
+        with record.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(record.original_name, 'letter.txt')
+
+    def test_completing_twice_returns_the_same_record(self):
+        self.put(0, 29)
+        first = self.client.post(self.session['complete_url'])
+        second = self.client.post(self.session['complete_url'])
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(first.json()['record_id'], second.json()['record_id'])
+        self.assertEqual(FileRecord.objects.count(), 1)
+        self.assertEqual(self.put(0, 9).status_code, 409)
+
+
+class DownloadTests(RecordsTestCase):
+    data = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.record = self.create_record('table.bin', self.data)
+        self.url = f'/download/{self.record.pk}/'
+        # Downloads count accesses for tier_files on the worker pool.
+        self.run_workers_inline()
+
+    def test_whole_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['ETag'], f'"{self.record.content_hash}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_byte_ranges(self):
+        size = len(self.data)
+        for header, start, end in [('bytes=10-19', 10, 19), ('bytes=1000-', 1000, size - 1), ('bytes=-24', size - 24, size - 1)]:
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(b''.join(response.streaming_content), self.data[start:end + 1])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # A range against an older version of the file gets the whole new one.
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        for headers in [{'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}]:
+            with self.subTest(headers):
+                self.assertEqual(self.client.get(self.url, **headers).status_code, 304)
+        stale = http_date(timezone.now().timestamp() - 86400 * 365)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=stale).status_code, 200)
+
+
+class ExportTests(RecordsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.files = {'minutes.txt': b'minutes ' * 5000, 'copy.txt': b'minutes ' * 5000, 'scan.bin': os.urandom(3000)}
+        for i, (name, content) in enumerate(self.files.items()):
+            self.create_record(name, content, description=f'Export {i}')
+        FileRecord.objects.create(description='No file', file_type='Other')
+
+    def test_export_zip_holds_every_file_and_the_sheet_last(self):
+        response = self.client.get('/export/', {'sort_by': 'description_asc'})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIsNone(archive.testzip())
+            names = archive.namelist()
+            self.assertEqual(names, ['files/001_minutes.txt', 'files/002_copy.txt', 'files/003_scan.bin', 'records.xlsx'])
+            for name, content in self.files.items():
+                self.assertEqual(archive.read(next(n for n in names if n.endswith(name))), content)
+            with zipfile.ZipFile(io.BytesIO(archive.read('records.xlsx'))) as workbook:
+                sheet = workbook.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        for description in ['Export 0', 'Export 1', 'Export 2', 'No file']:
+            self.assertIn(description, sheet)
+
+    def test_rows_are_read_in_batches_in_list_order(self):
+        for i in range(5):
+            FileRecord.objects.create(description=f'Export {i % 2}', file_type='Other')
+        with mock.patch('records.exports.EXPORT_ITERATOR_CHUNK_SIZE', 2):
+            for sort_by in SORT_ORDERINGS:
+                with self.subTest(sort_by):
+                    records = filter_records(get_filters({'search': 'export', 'sort_by': sort_by}))
+                    self.assertEqual([row.id for row in export_rows(records)], [record.pk for record in records])
+
+
+class BulkDeleteTests(RecordsTestCase):
+    def test_bulk_delete_releases_blobs_and_leaves_no_orphans(self):
+        shared = [self.create_record(f'copy{i}.txt', b'shared content') for i in range(3)]
+        unique = self.create_record('unique.txt', b'unique content')
+        ExtractedContent.objects.create(record=shared[0], content_hash='h', text='shared')
+        session = UploadSession.objects.create(user=self.user, file_name='copy0.txt', total_size=14,
+                                               description='copy', record=shared[0])
+        unique_path = unique.file.path
+        deleted = [shared[0].pk, shared[1].pk, unique.pk]
+        # Receivers outside this app still hear about every deleted record.
+        notified = []
+
+        def receiver(sender, instance, **kwargs):
+            notified.append(instance.pk)
+
+        post_delete.connect(receiver, sender=FileRecord)
+        self.addCleanup(post_delete.disconnect, receiver, sender=FileRecord)
+
+        self.run_workers_inline()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/records/bulk/delete/', {'ids': ','.join(map(str, deleted))})
+
+        self.assertEqual(response.json(), {'deleted': 3})
+        self.assertEqual(sorted(notified), sorted(deleted))
+        self.assertEqual(list(FileRecord.objects.values_list('pk', flat=True)), [shared[2].pk])
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(shared[2].file.path))
+        self.assertFalse(os.path.exists(unique_path))
+        self.assertFalse(ExtractedContent.objects.exists())
+        session.refresh_from_db()
+        self.assertIsNone(session.record_id)
+        self.assertEqual(
+            sorted(ChangeEvent.objects.filter(action=ChangeEvent.ACTION_DELETE).values_list('record_id', flat=True)),
+            sorted(deleted),
+        )
+
+
+@skipUnless(fts_enabled(), 'Query plan checks use SQLite EXPLAIN QUERY PLAN.')
+class QueryPlanTests(TestCase):
+    """The records list, cursor pages, exports and counts stay on indexes (see manage.py check_query_plans)"""
+
+    def test_record_queries_use_indexes(self):
+        checked = 0
+        for label, plan, problems in check_plans():
+            with self.subTest(label):
+                self.assertEqual(problems, [], f'{label}:\n{plan}')
+            checked += 1
+        self.assertGreater(checked, 0)
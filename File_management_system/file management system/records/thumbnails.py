@@ -0,0 +1,103 @@
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from .extraction import hash_file
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = 'previews'
+PDF_RENDER_TIMEOUT = 30
+
+
+def preview_name(content_hash, fmt):
+    """Storage name of the preview for content with this SHA-256; shared by identical files"""
+
+    ext = 'webp' if fmt == 'WEBP' else 'jpg'
+    return f"{PREVIEW_DIR}/{content_hash[:2]}/{content_hash}.{ext}"
+
+
+def _open_pdf_page(path, size):
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, 'page')
+            subprocess.run(
+                [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(max(size) * 2), '-png', path, prefix],
+                check=True, capture_output=True, timeout=PDF_RENDER_TIMEOUT,
+            )
+            with Image.open(prefix + '.png') as image:
+                image.load()
+                return image
+    if PdfReader is not None:
+        # Without poppler, use the largest image on the first page; scanned
+        # letters are a single full-page image.
+        images = PdfReader(path).pages[0].images
+        if images:
+            data = max(images, key=lambda image: len(image.data)).data
+            return Image.open(io.BytesIO(data))
+    return None
+
+
+def _open_image(path, size):
+    image = Image.open(path)
+    # Lets JPEG decode at a reduced scale instead of full resolution.
+    image.draft('RGB', (size[0] * 2, size[1] * 2))
+    return ImageOps.exif_transpose(image)
+
+
+def render_preview(path, file_type, out_path, size, fmt):
+    """Write a thumbnail of an image or the first page of a PDF to out_path.
+
+    Returns False when the file has no preview. Module-level and free of
+    Django state so it can run in a process pool.
+    """
+
+    if Image is None:
+        return False
+    try:
+        image = _open_pdf_page(path, size) if file_type == 'PDF' else _open_image(path, size)
+        if image is None:
+            return False
+        image.thumbnail(size)
+        mode = 'RGBA' if fmt == 'WEBP' and ('A' in image.mode or 'transparency' in image.info) else 'RGB'
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, fmt, quality=80)
+            os.replace(tmp_path, out_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except Exception as e:
+        logger.warning('Could not render a preview of %s: %s', path, e)
+        return False
+    return True
+
+
+def build_preview(path, file_type, media_root, size, fmt, content_hash=None):
+    """Return the preview name for a file, rendering it unless it already exists"""
+
+    name = preview_name(content_hash or hash_file(path), fmt)
+    out_path = os.path.join(media_root, name)
+    if os.path.exists(out_path) or render_preview(path, file_type, out_path, size, fmt):
+        return name
+    return None
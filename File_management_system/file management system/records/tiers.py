@@ -0,0 +1,255 @@
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import workers
+from .metrics import count_io
+from .models import FileTier
+from .storage import upload_storage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+# codec -> suffix of the compressed copy, which replaces the file at its path
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+CHUNK_SIZE = 1024 * 1024
+ZSTD_LEVEL = 9
+GZIP_LEVEL = 6
+# Keep a compressed copy only if it is at most this share of the original
+MAX_STORED_RATIO = 0.9
+
+
+def tier_codec():
+    """RECORDS_TIER_CODEC, or 'gzip' when zstandard is not installed"""
+
+    codec = getattr(settings, 'RECORDS_TIER_CODEC', 'zstd')
+    if codec == 'zstd' and zstandard is None:
+        return 'gzip'
+    return codec
+
+
+def promote_accesses():
+    return getattr(settings, 'RECORDS_TIER_PROMOTE_ACCESSES', 3)
+
+
+def locate(path):
+    """(path on disk, codec) of a stored file, its uncompressed copy first, or None if it is missing"""
+
+    if os.path.exists(path):
+        return path, None
+    for codec, suffix in SUFFIXES.items():
+        if os.path.exists(path + suffix):
+            return path + suffix, codec
+    return None
+
+
+def open_stored(path, codec):
+    """Binary file object reading the original content of a located file"""
+
+    if codec is None:
+        return open(path, 'rb')
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def original_size(path, codec):
+    """Size of the original content of a located file, read from the compressed file's header or trailer"""
+
+    if codec is None:
+        return os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if codec == 'zstd':
+            return zstandard.frame_content_size(f.read(18))
+        # ISIZE: the length modulo 2**32, which uploads never reach
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), 'little')
+
+
+def iter_stored(path, codec):
+    """Chunks of the original content of a located file, which is opened right away"""
+
+    return _iter_chunks(open_stored(path, codec))
+
+
+def _iter_chunks(f):
+    with f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            count_io('read', len(chunk))
+            yield chunk
+
+
+def hash_stored(path, codec):
+    """SHA-256 of the original content of a located file"""
+
+    digest = hashlib.sha256()
+    with open_stored(path, codec) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def local_copy(path):
+    """Path to the original content of a stored file, for readers that need one, or None if it is missing.
+
+    A cold file is decompressed into a temporary file, removed on exit. A
+    copy compressed or decompressed meanwhile by tier_files is located again.
+    """
+
+    for _ in range(3):
+        located = locate(path)
+        if located is None:
+            break
+        if located[1] is None:
+            yield located[0]
+            return
+        fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+        try:
+            try:
+                with os.fdopen(fd, 'wb') as out, open_stored(*located) as src:
+                    shutil.copyfileobj(src, out, CHUNK_SIZE)
+            except FileNotFoundError:
+                continue
+            yield tmp_path
+            return
+        finally:
+            _remove(tmp_path)
+    yield None
+
+
+def with_local_copy(fn, path, *args):
+    """fn(local path, *args) on a stored file's original content, or None if it is missing.
+
+    Module-level so process pools can run it.
+    """
+
+    with local_copy(path) as local:
+        return None if local is None else fn(local, *args)
+
+
+def _rewrite(source, target, write):
+    """Write target from source through write(src, out), atomically and keeping source's mtime"""
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with open(source, 'rb') as src, os.fdopen(fd, 'wb') as out:
+            write(src, out)
+        shutil.copystat(source, tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _compress(codec):
+    def write(src, out):
+        if codec == 'gzip':
+            with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) as dest:
+                shutil.copyfileobj(src, dest, CHUNK_SIZE)
+        else:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            size = os.fstat(src.fileno()).st_size
+            with compressor.stream_writer(out, size=size, closefd=False) as dest:
+                shutil.copyfileobj(src, dest, CHUNK_SIZE)
+    return write
+
+
+def _decompress(codec):
+    def write(src, out):
+        src.close()
+        with open_stored(src.name, codec) as dest:
+            shutil.copyfileobj(dest, out, CHUNK_SIZE)
+    return write
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def compress_copy(path, codec):
+    """Write the compressed copy of a stored file next to it and return its size.
+
+    Returns None, leaving no copy, when it would keep more than
+    MAX_STORED_RATIO of the file. The file itself is left in place for the
+    caller to remove once the database says it is cold.
+    """
+
+    target = path + SUFFIXES[codec]
+    _rewrite(path, target, _compress(codec))
+    stored_size = os.path.getsize(target)
+    if stored_size > os.path.getsize(path) * MAX_STORED_RATIO:
+        _remove(target)
+        return None
+    return stored_size
+
+
+def demote(name, codec, size, stored_size):
+    """Record a stored file as cold once compress_copy made its copy, removing the file on commit"""
+
+    path = upload_storage.path(name)
+    FileTier.objects.update_or_create(name=name, defaults={
+        'codec': codec, 'size': size, 'stored_size': stored_size, 'incompressible': False,
+        'access_count': 0, 'compressed_datetime': timezone.now(),
+    })
+    # Readers prefer the uncompressed file while both exist.
+    transaction.on_commit(lambda: _remove(path))
+
+
+def promote(name):
+    """Decompress a cold file back to its own path; True if it was cold"""
+
+    path = upload_storage.path(name)
+    located = locate(path)
+    if located is None or located[1] is None:
+        return False
+    cold_path, codec = located
+    _rewrite(cold_path, path, _decompress(codec))
+    with transaction.atomic():
+        FileTier.objects.filter(name=name).update(codec='', stored_size=0, access_count=0, compressed_datetime=None)
+        transaction.on_commit(lambda: _remove(cold_path))
+    return True
+
+
+def record_access(name):
+    """Count a download of a stored file, promoting it once a cold file is downloaded often enough"""
+
+    now = timezone.now()
+    # Write before reading, as retain_file does, so SQLite waits for other writers.
+    if not FileTier.objects.filter(name=name).update(access_count=F('access_count') + 1, last_accessed=now):
+        try:
+            with transaction.atomic():
+                FileTier.objects.create(name=name, size=upload_storage.size(name) if upload_storage.exists(name) else 0,
+                                        access_count=1, last_accessed=now)
+        except IntegrityError:
+            FileTier.objects.filter(name=name).update(access_count=F('access_count') + 1, last_accessed=now)
+    if FileTier.objects.filter(name=name, access_count__gte=promote_accesses()).exclude(codec='').exists():
+        promote(name)
+        logger.info('Promoted %s back to the hot tier', name)
+
+
+def queue_access(name):
+    """record_access on the worker pool, off the download's request"""
+
+    if name:
+        workers.submit(record_access, name)
@@ -0,0 +1,218 @@
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import workers
+from .extraction import hash_file
+from .metrics import count_io
+from .models import FileRecord, UploadSession
+
+
+COPY_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+)$')
+
+
+class UploadError(Exception):
+    """A chunk was rejected; status is the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _AssembledFile(File):
+    """Finished upload on disk, exposed like a TemporaryUploadedFile so storage can move it"""
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self._path = path
+        self.content_hash = hash_file(path)
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def session_ttl():
+    return getattr(settings, 'CHUNKED_UPLOAD_SESSION_TTL', 172800)
+
+
+def chunk_timeout():
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_TIMEOUT', 600)
+
+
+def _unclaimed(now):
+    """Sessions with no chunk being written, or whose writer gave up long ago"""
+
+    return Q(chunk_claimed_datetime__isnull=True) | Q(chunk_claimed_datetime__lt=now - timedelta(seconds=chunk_timeout()))
+
+
+def parse_content_range(header, session):
+    """Return (start, length) from a Content-Range header for this session"""
+
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Content-Range must look like "bytes start-end/total".')
+    start, end, total = (int(match.group(g)) for g in ('start', 'end', 'total'))
+    if total != session.total_size or end < start or end >= total:
+        raise UploadError('Content-Range does not match the upload size.', status=416)
+    length = end - start + 1
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError('Chunk is too large.', status=413)
+    return start, length
+
+
+def append_chunk(session, stream, start, length):
+    """Append length bytes from stream at offset start and return the new received size.
+
+    Only the next expected chunk is accepted; anything else is answered with
+    the current offset so the client can resume from there. The offset is
+    claimed before anything is written, so two requests never write the same
+    bytes. The chunk is copied to disk in small pieces, so memory use does not
+    depend on its size.
+    """
+
+    if session.status != UploadSession.STATUS_ACTIVE:
+        raise UploadError('Upload is already complete.', status=409)
+    if start != session.received_size:
+        raise UploadError(f'Expected chunk at offset {session.received_size}.', status=409)
+
+    claimed = timezone.now()
+    if not UploadSession.objects.filter(
+        _unclaimed(claimed), pk=session.pk, status=UploadSession.STATUS_ACTIVE, received_size=start,
+    ).update(chunk_claimed_datetime=claimed, updated_datetime=claimed):
+        raise UploadError(f'The chunk at offset {start} is being uploaded by another request.', status=409)
+
+    try:
+        _write_chunk(session.part_path, stream, start, length)
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk, chunk_claimed_datetime=claimed).update(chunk_claimed_datetime=None)
+        raise
+
+    updated = UploadSession.objects.filter(pk=session.pk, received_size=start, chunk_claimed_datetime=claimed).update(
+        received_size=start + length, chunk_claimed_datetime=None, updated_datetime=timezone.now(),
+    )
+    if not updated:
+        raise UploadError('Chunk was uploaded concurrently.', status=409)
+    session.received_size = start + length
+    return session.received_size
+
+
+def _write_chunk(part_path, stream, start, length):
+    os.makedirs(settings.UPLOAD_SESSION_ROOT, exist_ok=True)
+    mode = 'r+b' if os.path.exists(part_path) else 'wb'
+    with open(part_path, mode) as part:
+        part.seek(start)
+        remaining = length
+        while remaining:
+            data = stream.read(min(COPY_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            part.write(data)
+            count_io('written', len(data))
+            remaining -= len(data)
+        if remaining:
+            # Client went away mid-chunk; drop the partial bytes so the
+            # retry starts from the last complete chunk.
+            part.truncate(start)
+            raise UploadError('Chunk was incomplete.')
+        part.truncate(start + length)
+
+
+def complete_upload(session):
+    """Turn a fully received upload into a FileRecord"""
+
+    if session.status == UploadSession.STATUS_COMPLETE:
+        return session.record
+    if session.received_size != session.total_size:
+        raise UploadError(f'Upload is incomplete ({session.received_size} of {session.total_size} bytes).', status=409)
+
+    try:
+        assembled = _AssembledFile(session.part_path, session.file_name)
+    except FileNotFoundError:
+        # A concurrent request completed it and moved the file.
+        return _completed_record(session)
+    try:
+        with transaction.atomic():
+            # Claim the session before the file is moved: a concurrent
+            # request waits here and then finds it complete.
+            if not UploadSession.objects.filter(
+                pk=session.pk, status=UploadSession.STATUS_ACTIVE, received_size=session.total_size,
+            ).update(status=UploadSession.STATUS_COMPLETE, updated_datetime=timezone.now()):
+                return _completed_record(session)
+            record = FileRecord(
+                description=session.description,
+                file_date=session.file_date,
+                letter_reference_number=session.letter_reference_number,
+            )
+            record.file = assembled
+            record.save()
+            UploadSession.objects.filter(pk=session.pk).update(record=record)
+            session.status = UploadSession.STATUS_COMPLETE
+            session.record = record
+    finally:
+        assembled.close()
+    if os.path.exists(session.part_path):
+        os.remove(session.part_path)
+    return record
+
+
+def _completed_record(session):
+    try:
+        session.refresh_from_db()
+    except UploadSession.DoesNotExist:
+        session.status = None
+    if session.status != UploadSession.STATUS_COMPLETE:
+        raise UploadError('The uploaded data is gone; start the upload again.', status=410)
+    return session.record
+
+
+def queue_expiry():
+    """expire_sessions on the worker pool once the transaction commits"""
+
+    transaction.on_commit(lambda: workers.submit(expire_sessions))
+
+
+def expire_sessions():
+    """Delete unfinished uploads idle for CHUNKED_UPLOAD_SESSION_TTL seconds with their partial files,
+    and partial files no unfinished upload uses.
+
+    Returns (sessions, files) deleted.
+    """
+
+    # Listed before the sessions are read, so a file of a session started meanwhile is not seen.
+    try:
+        names = os.listdir(settings.UPLOAD_SESSION_ROOT)
+    except FileNotFoundError:
+        names = []
+
+    now = timezone.now()
+    idle = UploadSession.objects.filter(
+        _unclaimed(now), status=UploadSession.STATUS_ACTIVE, updated_datetime__lt=now - timedelta(seconds=session_ttl()),
+    )
+    sessions = 0
+    for session in idle.only('id'):
+        # Deleted one by one, each only if it is still idle.
+        if idle.filter(pk=session.pk).delete()[0]:
+            _remove(session.part_path)
+            sessions += 1
+
+    active = {str(pk) for pk in UploadSession.objects.filter(status=UploadSession.STATUS_ACTIVE).values_list('id', flat=True)}
+    files = 0
+    for name in names:
+        if name.endswith('.part') and name[:-len('.part')] not in active:
+            files += _remove(os.path.join(settings.UPLOAD_SESSION_ROOT, name))
+    return sessions, files
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
@@ -1,14 +1,39 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
+
+
+def sync_or_async(sync_view, async_view):
+    """The async view when RECORDS_ASYNC_VIEWS is on (ASGI deployments), else the sync one"""
+    return async_view if settings.RECORDS_ASYNC_VIEWS else sync_view
+
 
 urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='login'), name='logout'),
     path('', views.list_records, name='list_records'),
-    path('upload/', views.upload_record, name='upload_record'),
+    path('upload/', sync_or_async(views.upload_record, views.aupload_record), name='upload_record'),
+    path('upload/bulk/', views.bulk_upload, name='bulk_upload'),
+    path('uploads/', views.create_upload_session, name='create_upload_session'),
+    path('uploads/<uuid:session_id>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:session_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
     path('edit/<int:record_id>/', views.edit_record, name='edit_record'),
-    path('download/<int:record_id>/', views.download_file, name='download_file'),
+    path('download/<int:record_id>/', sync_or_async(views.download_file, views.adownload_file), name='download_file'),
+    path('preview/<int:record_id>/', views.record_preview, name='record_preview'),
     path('delete/<int:record_id>/', views.delete_record, name='delete_record'),
-    path('export/', views.export_to_excel, name='export_to_excel'),
+    path('bulk/delete/', views.bulk_delete, name='bulk_delete'),
+    path('bulk/edit/', views.bulk_edit, name='bulk_edit'),
+    path('export/', sync_or_async(views.export_to_excel, views.aexport_to_excel), name='export_to_excel'),
+    path('export/jobs/', views.start_export_job, name='start_export_job'),
+    path('export/jobs/<uuid:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<uuid:job_id>/download/', sync_or_async(views.download_export_job, views.adownload_export_job), name='download_export_job'),
+    path('export/<slug:fmt>/', sync_or_async(views.export_metadata, views.aexport_metadata), name='export_metadata'),
+    path('api/records/', api.record_list, name='api_record_list'),
+    path('api/records/batch/', api.record_batch, name='api_record_batch'),
+    path('api/records/bulk/delete/', api.record_bulk_delete, name='api_record_bulk_delete'),
+    path('api/records/bulk/update/', api.record_bulk_update, name='api_record_bulk_update'),
+    path('api/records/<int:record_id>/', api.record_detail, name='api_record_detail'),
+    path('api/changes/', api.record_changes, name='api_record_changes'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
@@ -1,20 +1,31 @@
+import asyncio
 import os
-import zipfile
-from io import BytesIO
+import tempfile
+from urllib.parse import urlencode
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import FileResponse, HttpResponse, JsonResponse
-from django.views.decorators.http import require_POST
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
 from django.conf import settings
-from datetime import datetime
-import xlsxwriter
 
-from .models import FileRecord
-from .forms import FileRecordForm
+from .aio import aiterate, async_login_required, offload
+from .bulk import BulkError, delete_records, selected_ids, update_records
+from .downloads import aserve_file, aserve_stored, serve_file, serve_stored
+from .exports import iter_csv, iter_export_zip, iter_ndjson, parquet_available, write_parquet
+from .filters import filter_records, filters_key, get_filters
+from .jobs import start_export
+from .metrics import registry
+from .models import ExportJob, FileRecord, UploadSession
+from .pagination import PAGE_SIZE, CursorPage, cached_count, cached_cursor_page, cached_offset_page
+from .previews import preview_path
+from .tiers import queue_access
+from .forms import MAX_UPLOAD_SIZE, BulkEditForm, BulkUploadForm, FileRecordForm, UploadSessionForm
+from .ingest import ingest, uploaded_sources
+from .uploads import UploadError, append_chunk, complete_upload, parse_content_range, queue_expiry
 
 
 def login_view(request):
@@ -53,60 +64,34 @@ def list_records(request):
                 for error in errors:
                     messages.error(request, f'{field}: {error}')
     
-    records = FileRecord.objects.all()
-    search_query = request.GET.get('search', '').strip()
-    file_type = request.GET.get('file_type', '').strip()
-    start_date = request.GET.get('start_date', '').strip()
-    end_date = request.GET.get('end_date', '').strip()
-    sort_by = request.GET.get('sort_by', '-upload_datetime').strip()
+    filters = get_filters(request.GET)
+    records = filter_records(filters)
     
-    if search_query:
-        records = records.filter(Q(description__icontains=search_query))
-    
-    if file_type and file_type != 'All':
-        records = records.filter(file_type=file_type)
+    file_types = FileRecord.FILE_TYPE_CHOICES
     
-    if start_date:
-        try:
-            start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-            records = records.filter(upload_datetime__date__gte=start_datetime.date())
-        except ValueError:
-            pass
+    key = filters_key(filters)
+    page_obj = None
+    if settings.RECORDS_PAGINATION == 'cursor':
+        page_obj = cached_cursor_page(records, key, request.GET.get('cursor'), PAGE_SIZE)
     
-    if end_date:
-        try:
-            end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-            records = records.filter(upload_datetime__date__lte=end_datetime.date())
-        except ValueError:
-            pass
-    
-    if sort_by == 'upload_date_asc':
-        records = records.order_by('upload_datetime')
-    elif sort_by == 'upload_date_desc':
-        records = records.order_by('-upload_datetime')
-    elif sort_by == 'description_asc':
-        records = records.order_by('description')
-    elif sort_by == 'description_desc':
-        records = records.order_by('-description')
+    if page_obj is None:
+        page_obj = cached_offset_page(records, key, request.GET.get('page', 1), PAGE_SIZE)
+        total_records = page_obj.paginator.count
     else:
-        records = records.order_by('-upload_datetime')
-    
-    file_types = FileRecord.FILE_TYPE_CHOICES
-    
-    paginator = Paginator(records, 10)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+        total_records = cached_count(records, key)
     
     context = {
         'page_obj': page_obj,
+        'cursor_pagination': isinstance(page_obj, CursorPage),
+        'filter_query': urlencode({k: v for k, v in filters.items() if v}),
         'upload_form': upload_form,
-        'search_query': search_query,
-        'file_type': file_type,
-        'start_date': start_date,
-        'end_date': end_date,
-        'sort_by': sort_by,
+        'search_query': filters['search'],
+        'file_type': filters['file_type'],
+        'start_date': filters['start_date'],
+        'end_date': filters['end_date'],
+        'sort_by': filters['sort_by'],
         'file_types': file_types,
-        'total_records': records.count(),
+        'total_records': total_records,
     }
     
     return render(request, 'records/list.html', context)
@@ -117,18 +102,66 @@ def upload_record(request):
     """Handle file upload"""
     
     if request.method == 'POST':
-        form = FileRecordForm(request.POST, request.FILES)
-        if form.is_valid():
-            form.save()
-            messages.success(request, 'File uploaded successfully!')
-            return redirect('list_records')
-        else:
-            for field, errors in form.errors.items():
-                for error in errors:
-                    messages.error(request, f'{field}: {error}')
+        _save_upload(request)
+    
+    return redirect('list_records')
+
+
+@async_login_required
+async def aupload_record(request):
+    """upload_record for ASGI: parsing and storing the file run in a thread"""
+    
+    if request.method == 'POST':
+        await offload(_save_upload, request)
+    
+    return redirect('list_records')
+
+
+def _save_upload(request):
+    form = FileRecordForm(request.POST, request.FILES)
+    if form.is_valid():
+        form.save()
+        messages.success(request, 'File uploaded successfully!')
     else:
-        form = FileRecordForm()
+        for field, errors in form.errors.items():
+            for error in errors:
+                messages.error(request, f'{field}: {error}')
+
+
+@login_required(login_url='login')
+@require_POST
+def bulk_upload(request):
+    """Upload many files at once; each file's name is its description unless one is given"""
+    
+    wants_json = 'application/json' in request.headers.get('Accept', '')
+    form = BulkUploadForm(request.POST)
+    files = request.FILES.getlist('files')
+    if not form.is_valid() or not files:
+        errors = dict(form.errors)
+        if not files:
+            errors['files'] = ['Please select at least one file to upload.']
+        if wants_json:
+            return JsonResponse({'errors': errors}, status=400)
+        for field, field_errors in errors.items():
+            for error in field_errors:
+                messages.error(request, f'{field}: {error}')
+        return redirect('list_records')
     
+    report = ingest(uploaded_sources(files), max_size=MAX_UPLOAD_SIZE, **form.cleaned_data)
+    
+    if wants_json:
+        return JsonResponse({
+            'created': report.created,
+            'failed': report.failed,
+            'elapsed': round(report.elapsed, 3),
+            'results': [result.as_dict() for result in report.results],
+        }, status=201 if report.created else 400)
+    
+    if report.created:
+        messages.success(request, f'{report.created} files uploaded successfully!')
+    for result in report.results:
+        if not result.ok:
+            messages.error(request, f'{result.name}: {result.error}')
     return redirect('list_records')
 
 
@@ -166,172 +199,317 @@ def download_file(request, record_id):
     record = get_object_or_404(FileRecord, id=record_id)
     
     if record.file:
-        file_path = record.file.path
-        if os.path.exists(file_path):
-            return FileResponse(
-                open(file_path, 'rb'),
-                as_attachment=True,
-                filename=record.file_name
-            )
+        response = serve_stored(request, record.file.path, record.file_name, record.content_hash)
+        if response is not None:
+            queue_access(record.file.name)
+            return response
+    
+    messages.error(request, 'File not found.')
+    return redirect('list_records')
+
+
+@async_login_required
+async def adownload_file(request, record_id):
+    """download_file for ASGI: the file is read in a thread, so slow clients hold no worker"""
+    
+    try:
+        record = await FileRecord.objects.aget(id=record_id)
+    except FileRecord.DoesNotExist:
+        raise Http404('No FileRecord matches the given query.')
+    
+    if record.file:
+        response = await aserve_stored(request, record.file.path, record.file_name, record.content_hash)
+        if response is not None:
+            queue_access(record.file.name)
+            return response
     
     messages.error(request, 'File not found.')
     return redirect('list_records')
 
 
 @login_required(login_url='login')
-@require_POST
-def delete_record(request, record_id):
-    """Delete a record and its file"""
+@require_GET
+def record_preview(request, record_id):
+    """Thumbnail of an Image or PDF record; the URL changes with the file so it is cached for long"""
     
     record = get_object_or_404(FileRecord, id=record_id)
+    path = preview_path(record.preview) if record.preview else None
+    if path is None or not os.path.exists(path):
+        return HttpResponse(status=404)
     
-    if record.file:
-        try:
-            if os.path.exists(record.file.path):
-                os.remove(record.file.path)
-        except Exception as e:
-            messages.error(request, f'Error deleting file: {str(e)}')
+    response = serve_file(request, path, os.path.basename(path), as_attachment=False)
+    response['Cache-Control'] = f'private, max-age={settings.RECORDS_PREVIEW_MAX_AGE}, immutable'
+    return response
+
+
+@login_required(login_url='login')
+@require_POST
+def delete_record(request, record_id):
+    """Delete a record; its file is released once no other record shares it"""
     
+    record = get_object_or_404(FileRecord, id=record_id)
     record.delete()
     messages.success(request, 'Record deleted successfully!')
     return redirect('list_records')
 
 
+@login_required(login_url='login')
+@require_POST
+def bulk_delete(request):
+    """Delete the selected records (or every record matching the filters) at once"""
+    
+    try:
+        count = delete_records(selected_ids(request.POST))
+    except BulkError as e:
+        messages.error(request, str(e))
+        return redirect('list_records')
+    messages.success(request, f'{count} record(s) deleted successfully!')
+    return redirect('list_records')
+
+
+@login_required(login_url='login')
+@require_POST
+def bulk_edit(request):
+    """Set the same metadata on the selected records (or every record matching the filters)"""
+    
+    form = BulkEditForm(request.POST)
+    if not form.is_valid():
+        for field, errors in form.errors.items():
+            for error in errors:
+                messages.error(request, error if field == '__all__' else f'{field}: {error}')
+        return redirect('list_records')
+    try:
+        count = update_records(selected_ids(request.POST), form.cleaned_data)
+    except BulkError as e:
+        messages.error(request, str(e))
+        return redirect('list_records')
+    messages.success(request, f'{count} record(s) updated successfully!')
+    return redirect('list_records')
+
+
 @login_required(login_url='login')
 def export_to_excel(request):
-    """Export filtered records to Excel with logo header and embedded files in ZIP"""
+    """Export filtered records to Excel with logo header and embedded files in a streamed ZIP"""
     
-    records = FileRecord.objects.all()
-    search_query = request.GET.get('search', '').strip()
-    file_type = request.GET.get('file_type', '').strip()
-    start_date = request.GET.get('start_date', '').strip()
-    end_date = request.GET.get('end_date', '').strip()
-    sort_by = request.GET.get('sort_by', '-upload_datetime').strip()
+    records = filter_records(get_filters(request.GET))
     
-    if search_query:
-        records = records.filter(Q(description__icontains=search_query))
+    response = StreamingHttpResponse(iter_export_zip(records), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="file_records_export.zip"'
     
-    if file_type and file_type != 'All':
-        records = records.filter(file_type=file_type)
+    return response
+
+
+@async_login_required
+async def aexport_to_excel(request):
+    """export_to_excel for ASGI: the ZIP is built on its own thread while the event loop sends it"""
     
-    if start_date:
-        try:
-            start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-            records = records.filter(upload_datetime__date__gte=start_datetime.date())
-        except ValueError:
-            pass
+    records = filter_records(get_filters(request.GET))
     
-    if end_date:
-        try:
-            end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-            records = records.filter(upload_datetime__date__lte=end_datetime.date())
-        except ValueError:
-            pass
-    
-    if sort_by == 'upload_date_asc':
-        records = records.order_by('upload_datetime')
-    elif sort_by == 'upload_date_desc':
-        records = records.order_by('-upload_datetime')
-    elif sort_by == 'description_asc':
-        records = records.order_by('description')
-    elif sort_by == 'description_desc':
-        records = records.order_by('-description')
-    else:
-        records = records.order_by('-upload_datetime')
+    response = StreamingHttpResponse(aiterate(iter_export_zip(records)), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="file_records_export.zip"'
     
-    excel_buffer = BytesIO()
-    workbook = xlsxwriter.Workbook(excel_buffer)
-    worksheet = workbook.add_worksheet('File Records')
+    return response
+
+
+# Metadata-only export formats: format -> (streamed rows or None for a file, content type)
+METADATA_EXPORTS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson; charset=utf-8'),
+    'parquet': (None, 'application/vnd.apache.parquet'),
+}
+
+
+def _parquet_file(records):
+    output = tempfile.TemporaryFile()
+    write_parquet(records, output)
+    output.seek(0)
+    return output
+
+
+def _metadata_response(request, fmt, body):
+    content_type = METADATA_EXPORTS[fmt][1]
+    filename = f'file_records.{fmt}'
+    if fmt == 'parquet':
+        return FileResponse(body, as_attachment=True, filename=filename, content_type=content_type)
+    response = StreamingHttpResponse(body, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _metadata_export_error(request, fmt):
+    if fmt not in METADATA_EXPORTS:
+        raise Http404('Unknown export format.')
+    if fmt == 'parquet' and not parquet_available():
+        messages.error(request, 'Parquet export needs pyarrow installed on the server.')
+        return redirect('list_records')
+    return None
+
+
+@login_required(login_url='login')
+@require_GET
+def export_metadata(request, fmt):
+    """Export filtered records' metadata without their files: CSV or NDJSON streamed row by row, or Parquet"""
+    
+    error = _metadata_export_error(request, fmt)
+    if error:
+        return error
+    records = filter_records(get_filters(request.GET))
+    
+    iter_rows = METADATA_EXPORTS[fmt][0]
+    body = iter_rows(records) if iter_rows else _parquet_file(records)
+    return _metadata_response(request, fmt, body)
+
+
+@async_login_required
+async def aexport_metadata(request, fmt):
+    """export_metadata for ASGI: rows are read on their own thread while the event loop sends them"""
+    
+    error = _metadata_export_error(request, fmt)
+    if error:
+        return error
+    records = filter_records(get_filters(request.GET))
+    
+    iter_rows = METADATA_EXPORTS[fmt][0]
+    body = aiterate(iter_rows(records)) if iter_rows else await offload(_parquet_file, records)
+    return _metadata_response(request, fmt, body)
+
+
+def _export_job_payload(job):
+    payload = {
+        'id': str(job.id),
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'status_url': reverse('export_job_status', args=[job.id]),
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        payload['download_url'] = reverse('download_export_job', args=[job.id])
+    if job.error:
+        payload['error'] = job.error
+    return payload
+
+
+@login_required(login_url='login')
+@require_POST
+def start_export_job(request):
+    """Queue a background export for the current filters, or reuse a cached one"""
     
-    logo_path = os.path.join(settings.BASE_DIR, 'records', 'static', 'images', 'logo.png')
-    if os.path.exists(logo_path):
-        try:
-            worksheet.set_header('&C&G', {'image_center': logo_path})
-        except Exception:
-            pass
-    
-    header_row = 4
-    headers = ['Serial Number', 'Description', 'File Date', 'Letter Reference', 'File Name', 'File Type', 'Upload Date & Time']
-    
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#4472C4',
-        'font_color': 'white',
-        'align': 'center',
-        'valign': 'vcenter',
-        'border': 1
-    })
-    
-    for col, header in enumerate(headers):
-        worksheet.write(header_row, col, header, header_format)
-    
-    cell_format = workbook.add_format({
-        'align': 'center',
-        'valign': 'vcenter',
-        'border': 1
-    })
-    
-    text_format = workbook.add_format({
-        'align': 'left',
-        'valign': 'vcenter',
-        'border': 1
-    })
-    
-    date_format = workbook.add_format({
-        'align': 'center',
-        'valign': 'vcenter',
-        'border': 1,
-        'num_format': 'yyyy-mm-dd'
-    })
-    
-    worksheet.set_column('A:A', 12)
-    worksheet.set_column('B:B', 25)
-    worksheet.set_column('C:C', 12)
-    worksheet.set_column('D:D', 18)
-    worksheet.set_column('E:E', 25)
-    worksheet.set_column('F:F', 12)
-    worksheet.set_column('G:G', 20)
-    
-    row_num = header_row + 1
-    for record in records:
-        worksheet.write(row_num, 0, record.id, cell_format)
-        worksheet.write(row_num, 1, record.description, text_format)
-        
-        if record.file_date:
-            worksheet.write_datetime(row_num, 2, record.file_date, date_format)
-        else:
-            worksheet.write(row_num, 2, '', cell_format)
-        
-        worksheet.write(row_num, 3, record.letter_reference_number or '', cell_format)
-        worksheet.write(row_num, 4, record.file_name, text_format)
-        worksheet.write(row_num, 5, record.file_type, cell_format)
-        worksheet.write(row_num, 6, record.upload_datetime.strftime('%Y-%m-%d %H:%M:%S'), cell_format)
-        
-        row_num += 1
+    job = start_export(get_filters(request.POST or request.GET), user=request.user)
+    return JsonResponse(_export_job_payload(job), status=202)
+
+
+@login_required(login_url='login')
+@require_GET
+def export_job_status(request, job_id):
+    """Report a background export's status and progress as JSON"""
     
-    workbook.close()
-    excel_buffer.seek(0)
+    job = get_object_or_404(ExportJob, id=job_id)
+    return JsonResponse(_export_job_payload(job))
+
+
+@login_required(login_url='login')
+def download_export_job(request, job_id):
+    """Download the finished bundle of a background export"""
     
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.writestr('records.xlsx', excel_buffer.getvalue())
-        
-        for i, record in enumerate(records, 1):
-            file_path = os.path.join(settings.MEDIA_ROOT, record.file.name)
-            if os.path.exists(file_path):
-                try:
-                    file_name = record.file_name
-                    name_without_ext = os.path.splitext(file_name)[0]
-                    ext = os.path.splitext(file_name)[1]
-                    unique_filename = f"{i:03d}_{name_without_ext}{ext}"
-                    
-                    zip_file.write(file_path, arcname=f"files/{unique_filename}")
-                except Exception:
-                    pass
-    
-    zip_buffer.seek(0)
-    
-    response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-    response['Content-Disposition'] = 'attachment; filename="file_records_export.zip"'
+    job = get_object_or_404(ExportJob, id=job_id)
     
-    return response
+    if job.status == ExportJob.STATUS_DONE and os.path.exists(job.artifact_path):
+        return serve_file(request, job.artifact_path, 'file_records_export.zip')
+    
+    messages.error(request, 'Export is not ready.')
+    return redirect('list_records')
+
+
+@async_login_required
+async def adownload_export_job(request, job_id):
+    try:
+        job = await ExportJob.objects.aget(id=job_id)
+    except ExportJob.DoesNotExist:
+        raise Http404('No ExportJob matches the given query.')
+    
+    if job.status == ExportJob.STATUS_DONE and await asyncio.to_thread(os.path.exists, job.artifact_path):
+        return await aserve_file(request, job.artifact_path, 'file_records_export.zip')
+    
+    messages.error(request, 'Export is not ready.')
+    return redirect('list_records')
+
+
+def _upload_session_payload(session):
+    payload = {
+        'id': str(session.id),
+        'file_name': session.file_name,
+        'total_size': session.total_size,
+        'received_size': session.received_size,
+        'status': session.status,
+        'upload_url': reverse('upload_session', args=[session.id]),
+        'complete_url': reverse('complete_upload_session', args=[session.id]),
+    }
+    if session.record_id:
+        payload['record_id'] = session.record_id
+    return payload
+
+
+@login_required(login_url='login')
+@require_POST
+def create_upload_session(request):
+    """Start a chunked upload; the file itself is sent afterwards with PUT requests"""
+    
+    form = UploadSessionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    session = form.save(commit=False)
+    session.user = request.user
+    session.save()
+    # Sessions are started often enough to clear out abandoned ones.
+    queue_expiry()
+    return JsonResponse(_upload_session_payload(session), status=201)
+
+
+@login_required(login_url='login')
+@require_http_methods(['GET', 'PUT'])
+def upload_session(request, session_id):
+    """GET reports how much has been received; PUT appends the next chunk (Content-Range)"""
+    
+    session = get_object_or_404(UploadSession, id=session_id, user=request.user)
+    
+    if request.method == 'PUT':
+        try:
+            start, length = parse_content_range(request.headers.get('Content-Range'), session)
+            append_chunk(session, request, start, length)
+        except UploadError as e:
+            session.refresh_from_db()
+            payload = _upload_session_payload(session)
+            payload['error'] = str(e)
+            return JsonResponse(payload, status=e.status)
+    
+    return JsonResponse(_upload_session_payload(session))
+
+
+@login_required(login_url='login')
+@require_POST
+def complete_upload_session(request, session_id):
+    """Create the FileRecord once every byte of a chunked upload has arrived"""
+    
+    session = get_object_or_404(UploadSession, id=session_id, user=request.user)
+    try:
+        complete_upload(session)
+    except UploadError as e:
+        payload = _upload_session_payload(session)
+        payload['error'] = str(e)
+        return JsonResponse(payload, status=e.status)
+    
+    return JsonResponse(_upload_session_payload(session), status=201)
+
+
+@require_GET
+def metrics(request):
+    """Per-view request metrics in Prometheus format, for staff or a bearer token"""
+    
+    token = settings.RECORDS_METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    authorized = bool(token) and header.startswith('Bearer ') and constant_time_compare(header[7:], token)
+    if not authorized and not request.user.is_staff:
+        return HttpResponse('Forbidden', status=403 if request.user.is_authenticated else 401, content_type='text/plain')
+    
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+_pending = set()
+
+# SQLite reports a lock conflict immediately when two transactions try to
+# upgrade to a write lock at once, so tasks losing that race are retried.
+LOCK_RETRIES = 3
+LOCK_RETRY_DELAY = 0.2
+
+
+def get_executor():
+    """Return the process-wide background worker pool, creating it on first use"""
+
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'WORKER_POOL_SIZE', 4),
+                thread_name_prefix='records-worker',
+            )
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the background worker pool"""
+
+    future = get_executor().submit(_run, fn, *args, **kwargs)
+    with _lock:
+        _pending.add(future)
+    future.add_done_callback(_finished)
+    return future
+
+
+def _finished(future):
+    with _lock:
+        _pending.discard(future)
+
+
+def wait_idle(timeout=None):
+    """Block until every submitted task, including ones they submit, has finished"""
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _lock:
+            pending = list(_pending)
+        if not pending:
+            return True
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return False
+        wait(pending, remaining)
+
+
+def _run(fn, *args, **kwargs):
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == LOCK_RETRIES:
+                logger.exception('Background task %s failed', getattr(fn, '__name__', fn))
+                raise
+            time.sleep(LOCK_RETRY_DELAY * 2 ** attempt)
+        except Exception:
+            logger.exception('Background task %s failed', getattr(fn, '__name__', fn))
+            raise
+        finally:
+            connection.close()